@@ -2,7 +2,7 @@
 
 """
 .. module:: facio
-   :synopsis: Provides version number and exposes base facio class.
+   :synopsis: Provides version number and the generate API.
 """
 
 __VERSION__ = (2, 0, 0)
@@ -11,3 +11,10 @@ __VERSION__ = (2, 0, 0)
 def get_version(*args, **kwagrs):
     from facio import __VERSION__ as version
     return '.'.join(str(part) for part in version)
+
+
+def generate(*args, **kwargs):
+    """ Generate a project from Python, see :func:`facio.api.generate`. """
+
+    from facio.api import generate
+    return generate(*args, **kwargs)
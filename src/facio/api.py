@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.api
+   :synopsis: Generate projects from Python, without the command line.
+"""
+
+import os
+import re
+import time
+
+from facio.base import Embedded
+from facio.exceptions import FacioException
+from facio.run import Run
+from facio.state import Context
+from facio.template import Template
+
+
+class GenerateResult(object):
+    """ The outcome of ``generate``. """
+
+    def __init__(self, project_root):
+        """ Start the result of generating a project.
+
+        :param project_root: Path to the generated project
+        :type project_root: str
+        """
+
+        self.project_root = project_root
+        self.files = []
+        self.timings = {}
+        self.hook_results = []
+        self.messages = []
+        # Counted once facio.state.count_processes has been called
+        self.processes = 0
+
+    @property
+    def warnings(self):
+        """ Returns the warnings reported while generating the project.
+
+        :returns: list
+        """
+
+        prefix = 'Warning: '
+        return [message[len(prefix):] for message in self.messages
+                if message.startswith(prefix)]
+
+    def __repr__(self):
+        return '<GenerateResult {0}: {1} files>'.format(self.project_root,
+                                                        len(self.files))
+
+
+def get_files(project_root):
+    """ Returns the ``/`` separated paths of every file in a project.
+
+    :param project_root: Path to the project
+    :type project_root: str
+
+    :returns: list
+    """
+
+    files = []
+    for root, dirs, names in os.walk(project_root):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.relpath(os.path.join(root, name), project_root)
+            files.append('/'.join(path.split(os.sep)))
+    return files
+
+
+def generate(template, project_name, variables=None, destination=None,
+             jobs=1, hooks=True, mirror_cache=None, bytecode_cache=None):
+    """ Generate a project from a template in this process, as ``facio
+    <project_name>`` would from the command line. Nothing is printed, prompts
+    from hooks are answered with their defaults and errors are raised as
+    ``FacioException`` rather than exiting, so projects can be generated by
+    a long lived program. Each generation has its own
+    ``facio.state.Context``, so projects can be generated in several threads
+    at once, from the same prepared template.
+
+    ** Usage: **
+
+    .. code-block:: python
+
+        import facio
+        result = facio.generate('git+git@github.com:me/django.git', 'blog',
+                                variables={'port': '8000'},
+                                destination='/srv/projects')
+        print(result.files)
+
+    :param template: Template path, ``git+`` / ``hg+`` repository, archive
+                     or bundle, or a ``facio.template.Template`` already
+                     prepared, and optionally compiled, which is reused as is
+    :type template: str or facio.template.Template
+
+    :param project_name: The project name
+    :type project_name: str
+
+    ** Optional Key Word Arguments **
+
+    :param variables: Extra context variables
+    :type variables: dict -- default None
+
+    :param destination: Directory to generate the project in
+    :type destination: str -- default the current working directory
+
+    :param jobs: Number of processes to render files with
+    :type jobs: int -- default 1
+
+    :param hooks: Run the template's hooks
+    :type hooks: bool -- default True
+
+    :param mirror_cache: Cache of ``git+`` and ``hg+`` template mirrors
+    :type mirror_cache: facio.cache.MirrorCache -- default None
+
+    :param bytecode_cache: Cache of compiled templates
+    :type bytecode_cache: jinja2.BytecodeCache -- default None
+
+    :returns: facio.api.GenerateResult
+    """
+
+    start = time.time()
+    with Embedded() as messages:
+        if not project_name or not re.match(r'^\w+$', project_name):
+            raise FacioException('Project names can only contain numbers '
+                                 'letters and underscores')
+
+        context = Context(variables)
+        context.set_project_name(project_name)
+        if destination:
+            context.set_working_directory(os.path.abspath(destination))
+
+        vcs = None
+        with context:
+            try:
+                if isinstance(template, Template):
+                    instance = template
+                else:
+                    instance = Template(template, jobs=jobs)
+                    instance.mirror_cache = mirror_cache
+                    instance.bytecode_cache = bytecode_cache
+                    vcs = instance.prepare()
+
+                result = GenerateResult(context.get_project_root())
+                result.messages = messages
+                result.timings['prepare'] = time.time() - start
+
+                pipeline = None
+                if hooks:
+                    pipeline = Run().get_hooks(instance, context=context)
+                if pipeline is not None and pipeline.has_before():
+                    begin = time.time()
+                    pipeline.run_before()
+                    result.timings['before'] = time.time() - begin
+
+                begin = time.time()
+                instance.generate()
+                result.timings['generate'] = time.time() - begin
+
+                if pipeline is not None and pipeline.has_after():
+                    begin = time.time()
+                    pipeline.run_after()
+                    result.timings['after'] = time.time() - begin
+
+                if pipeline is not None:
+                    result.hook_results = pipeline.calls.items()
+            finally:
+                if vcs is not None:
+                    vcs.cleanup(origin=instance.origin, destination=None)
+
+    result.processes = context.get_process_count()
+    result.files = get_files(result.project_root)
+    result.timings['total'] = time.time() - start
+    return result
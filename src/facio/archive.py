@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.archive
+   :synopsis: Read templates packaged as tar or zip archives.
+"""
+
+import copy
+import os
+import stat
+import subprocess
+import tarfile
+import threading
+import time
+import zipfile
+
+from facio.base import BaseFacio
+from jinja2 import BaseLoader, TemplateNotFound
+
+# File name endings of supported template archives
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.zip')
+
+# Errors raised reading a corrupt archive
+ARCHIVE_ERRORS = (tarfile.TarError, zipfile.BadZipfile)
+
+
+def is_archive(path):
+    """ Is the path a template archive.
+
+    :param path: Path to the template
+    :type path: str
+
+    :returns: bool
+    """
+
+    return (path.lower().endswith(ARCHIVE_SUFFIXES) and
+            os.path.isfile(path))
+
+
+class TemplateArchive(BaseFacio):
+    """ Read only access to the directories, regular files and links of a
+    ``.tar``, ``.tar.gz`` or ``.zip`` template in archive order. Symbolic
+    links are kept as links, see ``get_link``, hardlinks are read as the
+    file they link to and other members, such as devices, are skipped with a
+    warning. If every member is within a single top level directory, as in
+    archives of a repository, it is treated as the template root. Each
+    generation reads members through its own file handle from ``reader`` and
+    ``read`` holds a lock, so several projects can be generated from one
+    archive at once. """
+
+    def __init__(self, path):
+        """ Open the archive and read its table of contents.
+
+        :param path: Path to the archive
+        :type path: str
+        """
+
+        self.path = path
+        self.members = []
+        self.index = {}
+        self.lock = threading.Lock()
+        self.archive = self.open_archive()
+
+        if isinstance(self.archive, zipfile.ZipFile):
+            for info in self.archive.infolist():
+                is_dir = info.filename.endswith('/')
+                mode = (info.external_attr >> 16) & 0o7777
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                self.add(info.filename, is_dir,
+                         mode or (0o755 if is_dir else 0o644), mtime, info)
+        else:
+            for member in self.archive.getmembers():
+                if (member.isdir() or member.isfile() or member.issym() or
+                        member.islnk()):
+                    self.add(member.name, member.isdir(), member.mode,
+                             member.mtime, member)
+                else:
+                    self.warning('Skipping {0} in {1}, only files, '
+                                 'directories and links are supported'.format(
+                                     member.name, path))
+
+        self.strip_root()
+
+    def open_archive(self):
+        """ Returns a new handle on the archive file.
+
+        :returns: zipfile.ZipFile or tarfile.TarFile
+        """
+
+        if self.path.lower().endswith('.zip'):
+            return zipfile.ZipFile(self.path)
+        return tarfile.open(self.path, 'r:*')
+
+    def reader(self):
+        """ Returns a copy of the archive sharing its table of contents but
+        reading through a file handle of its own, which the caller closes.
+
+        :returns: facio.archive.TemplateArchive
+        """
+
+        reader = copy.copy(self)
+        reader.lock = threading.Lock()
+        reader.archive = self.open_archive()
+        return reader
+
+    def add(self, name, is_dir, mode, mtime, member):
+        """ Add a member to the table of contents, members with ``..`` in
+        their path are skipped. """
+
+        parts = [part for part in name.split('/') if part not in ('', '.')]
+        if parts and '..' not in parts:
+            self.members.append(['/'.join(parts), is_dir, mode, mtime,
+                                 member])
+
+    def strip_root(self):
+        """ Remove a top level directory holding every member from the
+        member names. """
+
+        roots = set(name.split('/', 1)[0] for name, is_dir, mode, mtime,
+                    member in self.members)
+        if len(roots) == 1:
+            root = roots.pop()
+            if all(name != root or is_dir for name, is_dir, mode, mtime,
+                   member in self.members):
+                self.members = [m for m in self.members if m[0] != root]
+                for m in self.members:
+                    m[0] = m[0][len(root) + 1:]
+
+        self.index = dict((m[0], m[4]) for m in self.members
+                          if not m[1] and not self.is_link(m[4]))
+
+    def is_link(self, member):
+        """ Is a member a symbolic link.
+
+        :param member: The tarfile.TarInfo or zipfile.ZipInfo of the member
+        :type member: object
+
+        :returns: bool
+        """
+
+        if isinstance(member, zipfile.ZipInfo):
+            return stat.S_ISLNK(member.external_attr >> 16)
+        return member.issym()
+
+    def get_link(self, member):
+        """ Returns the target of a symbolic link member, None for other
+        members.
+
+        :param member: The tarfile.TarInfo or zipfile.ZipInfo of the member
+        :type member: object
+
+        :returns: str or None
+        """
+
+        if not self.is_link(member):
+            return None
+        if isinstance(member, zipfile.ZipInfo):
+            # Zip archives store the target as the contents of the link
+            return self.archive.read(member).decode('utf8')
+        return member.linkname
+
+    def open(self, member):
+        """ Returns a binary file like object reading a member.
+
+        :param member: The tarfile.TarInfo or zipfile.ZipInfo of the member
+        :type member: object
+
+        :returns: file
+        """
+
+        if isinstance(self.archive, zipfile.ZipFile):
+            return self.archive.open(member)
+        return self.archive.extractfile(member)
+
+    def read(self, name):
+        """ Returns the contents of a file in the template, raising KeyError
+        if it does not exist.
+
+        :param name: ``/`` separated path of the file in the template
+        :type name: str
+
+        :returns: bytes
+        """
+
+        with self.lock:
+            handler = self.open(self.index[name])
+            try:
+                return handler.read()
+            finally:
+                handler.close()
+
+    def close(self):
+        self.archive.close()
+
+
+class RepositoryArchive(BaseFacio):
+    """ Read only access to the directories, regular files and symbolic
+    links of a ``git+`` or ``hg+`` template at the revision checked out by
+    ``BaseVCS.checkout``, streamed from ``git archive`` or ``hg archive`` so
+    the template is never checked out, other members are skipped with a
+    warning. The archive is streamed again each time ``members`` is
+    iterated, and a member can only be opened while it is the current member
+    of its stream. Files are read by name straight from the repository. """
+
+    def __init__(self, vcs):
+        """ Set the repository to stream the template from.
+
+        :param vcs: The VCS instance the template was checked out with
+        :type vcs: facio.vcs.BaseVCS
+        """
+
+        self.vcs = vcs
+        self.path = vcs.origin
+
+    @property
+    def members(self):
+        """ Yields the [name, is_dir, mode, mtime, member] of each member in
+        archive order, members outside the template or with ``..`` in their
+        path are skipped. Each iteration has a stream of its own, member is a
+        (tarfile.TarFile, tarfile.TarInfo) tuple of the stream and the member.
+        Raises tarfile.TarError if the archive command fails.
+
+        :returns: generator
+        """
+
+        command, prefix = self.vcs.get_archive_command()
+        try:
+            process = subprocess.Popen(command, cwd=self.vcs.directory,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        except OSError:
+            raise tarfile.TarError('Failed to run {0}'.format(command[0]))
+
+        try:
+            stream = tarfile.open(fileobj=process.stdout, mode='r|')
+            for member in stream:
+                name = member.name
+                if prefix:
+                    if name != prefix and not name.startswith(prefix + '/'):
+                        continue
+                    name = name[len(prefix):]
+                parts = [part for part in name.split('/')
+                         if part not in ('', '.')]
+                if not parts or '..' in parts:
+                    continue
+                if member.isdir() or member.isfile() or member.issym():
+                    yield ['/'.join(parts), member.isdir(), member.mode,
+                           member.mtime, (stream, member)]
+                else:
+                    self.warning('Skipping {0} in {1}, only files, '
+                                 'directories and symbolic links are '
+                                 'supported'.format('/'.join(parts),
+                                                    self.path))
+            # Drain the end of archive padding so the process can exit
+            while process.stdout.read(64 * 1024):
+                pass
+        finally:
+            process.stdout.close()
+            process.stderr.read()
+            process.stderr.close()
+            returncode = process.wait()
+
+        if returncode:
+            raise tarfile.TarError('{0} exited with {1}'.format(command[0],
+                                                                returncode))
+
+    def reader(self):
+        """ Returns the archive itself, every iteration of ``members``
+        already streams the archive separately.
+
+        :returns: facio.archive.RepositoryArchive
+        """
+
+        return self
+
+    def get_link(self, member):
+        """ Returns the target of a symbolic link member, None for other
+        members.
+
+        :param member: The stream and member yielded by ``members``
+        :type member: tuple
+
+        :returns: str or None
+        """
+
+        stream, info = member
+        return info.linkname if info.issym() else None
+
+    def open(self, member):
+        """ Returns a binary file like object reading the current member of
+        a stream.
+
+        :param member: The stream and member yielded by ``members``
+        :type member: tuple
+
+        :returns: file
+        """
+
+        stream, info = member
+        return stream.extractfile(info)
+
+    def read(self, name):
+        """ Returns the contents of a file in the template, raising KeyError
+        if it does not exist.
+
+        :param name: ``/`` separated path of the file in the template
+        :type name: str
+
+        :returns: bytes
+        """
+
+        data = self.vcs.read_file(name)
+        if data is None:
+            raise KeyError(name)
+        return data.encode('utf8')
+
+    def close(self):
+        pass
+
+
+class ArchiveLoader(BaseLoader):
+    """ Jinja2 loader reading templates from the members of a
+    ``TemplateArchive``, so ``{% include %}`` and ``{% extends %}`` work
+    without extracting the archive. Sources already read can be handed to
+    the loader through ``sources`` to avoid reading them again. """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.sources = {}
+
+    def get_source(self, environment, template):
+        source = self.sources.get(template)
+        if source is None:
+            try:
+                source = self.archive.read(template).decode('utf8')
+            except KeyError:
+                raise TemplateNotFound(template)
+        return source, None, lambda: True
@@ -5,10 +5,49 @@
    :synopsis: Base facio classes.
 """
 
+import threading
+
 from clint.textui import puts, indent
 from clint.textui.colored import blue, green, red, yellow
 from six.moves import input
 
+# Per thread state of facio embedded in another program, see Embedded
+_embedded = threading.local()
+
+
+def get_embedded_messages():
+    """ Returns the list messages are collected in when facio is embedded
+    in the calling thread, else None.
+
+    :returns: list or None
+    """
+
+    return getattr(_embedded, 'messages', None)
+
+
+class Embedded(object):
+    """ Context manager embedding facio in another program for the calling
+    thread. Messages are collected rather than printed, prompts are answered
+    with their defaults and ``FacioException`` is raised rather than exiting.
+
+    ** Usage: **
+
+    .. code-block:: python
+
+        from facio.base import Embedded
+        with Embedded() as messages:
+            template.generate()
+    """
+
+    def __enter__(self):
+        self.previous = get_embedded_messages()
+        _embedded.messages = []
+        return _embedded.messages
+
+    def __exit__(self, *exc_info):
+        _embedded.messages = self.previous
+        return False
+
 
 class BaseFacio(object):
 
@@ -24,6 +63,11 @@ class BaseFacio(object):
         :type: function -- default blue
         """
 
+        messages = get_embedded_messages()
+        if messages is not None:
+            messages.append(message)
+            return
+
         with indent(4, quote=' >'):
             puts(color(message))
 
@@ -63,4 +107,10 @@ class BaseFacio(object):
         :type message: str
         """
 
+        # Embedded there is no one to ask, the prompt's default is used
+        messages = get_embedded_messages()
+        if messages is not None:
+            messages.append(message)
+            return ''
+
         return input(' >  ' + yellow(message))
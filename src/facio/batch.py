@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.batch
+   :synopsis: Generate many projects from one prepared template.
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from facio.base import BaseFacio, Embedded
+from facio.cache import BytecodeCache, MirrorCache
+from facio.config import parse_variables
+from facio.exceptions import FacioException
+from facio.hooks import Hook
+from facio.state import Context, HookCalls, state
+from facio.template import Template
+
+# Per process batch, set up once in each batch pool worker
+_worker = {}
+
+
+def _init_batch_worker(settings):
+    """ Batch pool initializer, each worker loads the template prepared and
+    compiled by ``Batch.run``, nothing is cloned or compiled again. Its
+    files are loaded from the bytecode cache as they are first rendered and
+    archives and bundles are reopened so workers do not share a file offset.
+    Only plain settings are passed, see ``Batch.get_worker_settings``, so the
+    pool also works when workers are spawned rather than forked. """
+
+    render = settings['render']
+    template = Template(settings['origin'])
+    template.copy_ignore_globs = list(settings['copy_ignore_globs'])
+    template.render_ignore_globs = list(settings['render_ignore_globs'])
+    template.buffer_size = render['buffer_size']
+    template.copy_strategy = render['copy_strategy']
+    template.copy_threads = settings['copy_threads']
+    if render['bytecode_cache'] is not None:
+        template.bytecode_cache = BytecodeCache(*render['bytecode_cache'])
+    if settings['mirror_cache'] is not None:
+        template.mirror_cache = MirrorCache(*settings['mirror_cache'])
+    # The origin is the local copy of the parent, prepare only opens
+    # archives and bundles
+    template.prepare()
+    template.environment = template.get_template_environment()
+
+    pipeline = Hook()
+    if settings['hooks'] is not None:
+        pipeline.hooks = settings['hooks']
+
+    batch = Batch(template, pipeline)
+    batch.variables = settings['variables']
+    batch.working_directory = settings['working_directory']
+    _worker['batch'] = batch
+
+
+def _batch_worker(record):
+    """ Batch pool task, generates a (project_name, variables) record. """
+
+    return _worker['batch'].generate(record)
+
+
+class Batch(BaseFacio):
+    """ Generates a project for every record of a JSONL or CSV file from a
+    template prepared, its hooks loaded and its files compiled once, in a
+    pool of processes. """
+
+    # Directory projects are generated in, else the working directory of
+    # the process wide state
+    working_directory = None
+
+    def __init__(self, template, pipeline, jobs=1):
+        """ Set the prepared template, its hooks and the number of projects
+        generated at once.
+
+        :param template: The prepared template
+        :type template: facio.template.Template
+
+        :param pipeline: The loaded template hooks
+        :type pipeline: facio.hooks.Hook
+
+        ** Optional Key Word Arguments **
+
+        :param jobs: Number of projects to generate at once
+        :type jobs: int -- default 1
+        """
+
+        self.template = template
+        self.pipeline = pipeline
+        self.jobs = jobs
+        self.variables = dict(state.get_context_variables())
+
+    def parse_jsonl(self, lines):
+        """ Returns the (line number, project name, variables) of each JSON
+        object in lines, variables are given by a ``vars`` object or string
+        of comma separated key=value pairs.
+
+        :param lines: The lines of the records
+        :type lines: list
+
+        :returns: list
+        """
+
+        records = []
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                variables = record.get('vars') or {}
+                if not isinstance(variables, dict):
+                    variables = parse_variables(variables)
+            except (ValueError, AttributeError):
+                raise FacioException('Line {0}: records should be JSON '
+                                     'objects with a project_name and '
+                                     'vars'.format(number))
+            records.append((number, record.get('project_name'), variables))
+        return records
+
+    def parse_csv(self, lines):
+        """ Returns the (line number, project name, variables) of each row of
+        the CSV in lines, the first row names the columns. Every column other
+        than ``project_name`` is a variable, a ``vars`` column takes comma
+        separated key=value pairs.
+
+        :param lines: The lines of the records
+        :type lines: list
+
+        :returns: list
+        """
+
+        records = []
+        reader = csv.DictReader(lines)
+        for row in reader:
+            number = reader.line_num
+            variables = {}
+            try:
+                variables.update(parse_variables(row.pop('vars', None)))
+            except ValueError:
+                raise FacioException('Line {0}: vars should be comma '
+                                     'separated key=value pairs'.format(
+                                         number))
+            name = row.pop('project_name', None)
+            variables.update((key, value) for key, value in row.items()
+                             if key and value)
+            records.append((number, name, variables))
+        return records
+
+    def read_records(self, path):
+        """ Returns the (project name, variables) records to generate from a
+        JSONL or CSV file, ``-`` reads stdin. The format is taken from the
+        file extension, else records starting with ``{`` are JSONL.
+
+        :param path: Path to the records, or ``-``
+        :type path: str
+
+        :returns: list
+        """
+
+        try:
+            if path == '-':
+                data = sys.stdin.read()
+            else:
+                with io.open(path, encoding='utf8', newline='') as handler:
+                    data = handler.read()
+        except (IOError, OSError):
+            raise FacioException('Failed to read {0}'.format(path))
+
+        lines = data.splitlines(True)
+        if path.lower().endswith(('.jsonl', '.json')):
+            jsonl = True
+        elif path.lower().endswith('.csv'):
+            jsonl = False
+        else:
+            jsonl = data.lstrip().startswith('{')
+        records = self.parse_jsonl(lines) if jsonl else self.parse_csv(lines)
+
+        names = set()
+        for number, name, variables in records:
+            if not name or not re.match(r'^\w+$', name):
+                raise FacioException('Line {0}: project names can only '
+                                     'contain numbers letters and '
+                                     'underscores'.format(number))
+            if name in names:
+                raise FacioException('Line {0}: {1} is listed more than '
+                                     'once'.format(number, name))
+            names.add(name)
+
+        if not records:
+            raise FacioException('No projects to generate in {0}'.format(
+                path))
+        return [(name, variables) for number, name, variables in records]
+
+    def get_worker_settings(self):
+        """ Returns the settings batch pool workers are started with, plain
+        values which can be pickled, see ``_init_batch_worker``.
+
+        :returns: dict
+        """
+
+        template = self.template
+        mirror_cache = None
+        if isinstance(template.mirror_cache, MirrorCache):
+            mirror_cache = (template.mirror_cache.directory,
+                            template.mirror_cache.ttl,
+                            template.mirror_cache.max_size)
+        return {
+            'origin': template.origin,
+            'copy_ignore_globs': list(template.get_copy_ignore_globs()),
+            'render_ignore_globs': list(template.get_render_ignore_globs()),
+            'copy_threads': template.copy_threads,
+            'render': template.get_render_settings(),
+            'mirror_cache': mirror_cache,
+            'hooks': getattr(self.pipeline, 'hooks', None),
+            'variables': self.variables,
+            'working_directory': (self.working_directory or
+                                  state.get_working_directory()),
+        }
+
+    def generate(self, record):
+        """ Generate a project, running the template hooks, and time it. Each
+        project has its own ``facio.state.Context`` and is generated embedded,
+        so a ``FacioException`` is raised rather than exiting and the other
+        projects are still generated.
+
+        :param record: (project name, variables) of the project
+        :type record: tuple
+
+        :returns: tuple -- (name, seconds, error message or None)
+        """
+
+        name, variables = record
+        start = time.time()
+        error = None
+        with Embedded():
+            try:
+                context = Context(self.variables)
+                context.update_context_variables(variables)
+                context.set_project_name(name)
+                if self.working_directory:
+                    context.set_working_directory(self.working_directory)
+                self.pipeline.calls = HookCalls()
+                self.pipeline.context = context
+
+                with context:
+                    if self.pipeline.has_before():
+                        self.pipeline.run_before()
+
+                    self.template.generate()
+
+                    if self.pipeline.has_after():
+                        self.pipeline.run_after()
+            except FacioException:
+                error = sys.exc_info()[1].message
+            except (Exception, SystemExit):
+                error = '{0}'.format(sys.exc_info()[1])
+        return name, time.time() - start, error
+
+    def run(self, records):
+        """ Compile the template then generate every project, reporting the
+        time each took and summarising the failures. With more than one job
+        the projects are generated by a pool of processes, which load the
+        compiled template from its bytecode cache, a temporary one if it has
+        none.
+
+        :param records: (project name, variables) tuples of the projects
+        :type records: list
+
+        :returns: list -- names of the projects that failed
+        """
+
+        jobs = min(self.jobs, len(records))
+        self.out('Generating {0} projects, {1} at a time'.format(
+            len(records), jobs))
+
+        start = time.time()
+        failures = []
+        pool = None
+        directory = None
+        if jobs > 1 and self.template.bytecode_cache is None:
+            directory = tempfile.mkdtemp(suffix='facio')
+            self.template.bytecode_cache = BytecodeCache(directory,
+                                                         sys.maxsize)
+
+        try:
+            self.template.compile()
+            self.out('Compiled {0} in {1:.2f}s'.format(
+                self.template.origin, time.time() - start))
+
+            if jobs > 1:
+                pool = multiprocessing.Pool(
+                    processes=jobs,
+                    initializer=_init_batch_worker,
+                    initargs=(self.get_worker_settings(),))
+                results = pool.imap_unordered(_batch_worker, records)
+            else:
+                results = (self.generate(record) for record in records)
+
+            for name, seconds, error in results:
+                if error is None:
+                    self.success('Generated {0} in {1:.2f}s'.format(
+                        name, seconds))
+                else:
+                    self.error('Failed to generate {0} after {1:.2f}s'.format(
+                        name, seconds))
+                    failures.append((name, error))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            if directory is not None:
+                self.template.bytecode_cache = None
+                shutil.rmtree(directory, ignore_errors=True)
+
+        self.out('Generated {0} of {1} projects in {2:.2f}s'.format(
+            len(records) - len(failures), len(records), time.time() - start))
+
+        if failures:
+            for name, error in sorted(failures):
+                self.error('{0}: {1}'.format(name, error) if error else name)
+            raise FacioException('Failed to generate {0} projects'.format(
+                len(failures)))
+
+        return [name for name, error in failures]
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.bundle
+   :synopsis: Read and write packed, precompiled template bundles.
+"""
+
+import binascii
+import json
+import marshal
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import jinja2
+
+from jinja2 import BaseLoader, TemplateNotFound
+from jinja2.bccache import bc_magic
+
+# First bytes of every bundle
+BUNDLE_MAGIC = b'FACIOPK1'
+
+# File name ending of bundles written by facio pack
+BUNDLE_SUFFIX = '.faciopack'
+
+# Big endian length of the JSON index following BUNDLE_MAGIC
+INDEX_LENGTH = struct.Struct('>I')
+
+# Python and Jinja2 versions compiled code in a bundle can be loaded by,
+# marshalled code objects are specific to both
+CODE_TAG = '{0}-{1}'.format(binascii.hexlify(bc_magic).decode('ascii'),
+                            jinja2.__version__)
+
+# Bundle entry kind of directories, file entries are a facio.template render
+# outcome or COPIED
+DIRECTORY = 'directory'
+
+
+def is_bundle(path):
+    """ Is the path a template bundle written by ``facio pack``.
+
+    :param path: Path to the template
+    :type path: str
+
+    :returns: bool
+    """
+
+    if not os.path.isfile(path):
+        return False
+    try:
+        with open(path, 'rb') as handler:
+            return handler.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC
+    except (IOError, OSError):
+        return False
+
+
+class BundleWriter(object):
+    """ Writes a template bundle. A bundle is ``BUNDLE_MAGIC``, the length of
+    its index, a JSON index and the data of its files. Each index entry
+    records the ``/`` separated name, kind, mode, modification time and
+    whether the name needs renaming of a directory or file, and for files the
+    offset and size of their raw bytes in the data, and of their marshalled
+    Jinja2 code if they are rendered. """
+
+    def __init__(self, path):
+        """ Start a bundle, it is only written to path by ``close``.
+
+        :param path: Path to write the bundle to
+        :type path: str
+        """
+
+        self.path = path
+        self.entries = []
+        self.data = tempfile.TemporaryFile()
+        self.size = 0
+
+    def add_data(self, handler):
+        """ Append the contents of a file like object to the data.
+
+        :returns: tuple -- (offset, size)
+        """
+
+        offset = self.size
+        shutil.copyfileobj(handler, self.data)
+        self.size = self.data.tell()
+        return offset, self.size - offset
+
+    def add_directory(self, name, mode, mtime, rename):
+        """ Add a directory entry.
+
+        :param name: ``/`` separated path of the directory in the template
+        :type name: str
+
+        :param mode: Permission bits of the directory
+        :type mode: int
+
+        :param mtime: Modification time of the directory
+        :type mtime: float
+
+        :param rename: Does the name contain variables to substitute
+        :type rename: bool
+        """
+
+        self.entries.append({
+            'name': name,
+            'kind': DIRECTORY,
+            'mode': mode,
+            'mtime': mtime,
+            'rename': rename,
+        })
+
+    def add_file(self, name, kind, mode, mtime, rename, path, code=None):
+        """ Add a file entry, storing the raw bytes of the file at path and
+        its compiled Jinja2 code if given.
+
+        :param name: ``/`` separated path of the file in the template
+        :type name: str
+
+        :param kind: How the file is generated, a render outcome or COPIED
+        :type kind: str
+
+        :param mode: Permission bits of the file
+        :type mode: int
+
+        :param mtime: Modification time of the file
+        :type mtime: float
+
+        :param rename: Does the name contain variables to substitute
+        :type rename: bool
+
+        :param path: Path to the file
+        :type path: str
+
+        ** Optional Key Word Arguments **
+
+        :param code: Jinja2 code compiled from the file
+        :type code: code -- default None
+        """
+
+        entry = {
+            'name': name,
+            'kind': kind,
+            'mode': mode,
+            'mtime': mtime,
+            'rename': rename,
+        }
+        with open(path, 'rb') as handler:
+            entry['offset'], entry['size'] = self.add_data(handler)
+        if code is not None:
+            self.data.write(marshal.dumps(code))
+            entry['code_offset'] = self.size
+            entry['code_size'] = self.data.tell() - self.size
+            self.size = self.data.tell()
+        self.entries.append(entry)
+
+    def close(self):
+        """ Write the bundle, replacing any file at path once it is complete.
+        """
+
+        index = json.dumps({
+            'code': CODE_TAG,
+            'entries': self.entries,
+        }, separators=(',', ':')).encode('utf8')
+
+        temp_path = '{0}.facio.tmp'.format(self.path)
+        try:
+            with open(temp_path, 'wb') as handler:
+                handler.write(BUNDLE_MAGIC)
+                handler.write(INDEX_LENGTH.pack(len(index)))
+                handler.write(index)
+                self.data.seek(0)
+                shutil.copyfileobj(self.data, handler)
+            os.rename(temp_path, self.path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            self.data.close()
+
+
+class TemplateBundle(object):
+    """ Read only, random access to the entries of a template bundle. The
+    bundle is memory mapped, reading an entry is a slice at its offset. """
+
+    def __init__(self, path):
+        """ Open the bundle and read its index, raising ValueError if it is
+        not a bundle.
+
+        :param path: Path to the bundle
+        :type path: str
+        """
+
+        self.path = path
+        with open(path, 'rb') as handler:
+            header = handler.read(len(BUNDLE_MAGIC) + INDEX_LENGTH.size)
+            if not header.startswith(BUNDLE_MAGIC) or \
+                    len(header) != len(BUNDLE_MAGIC) + INDEX_LENGTH.size:
+                raise ValueError('{0} is not a template bundle'.format(path))
+            length = INDEX_LENGTH.unpack(header[len(BUNDLE_MAGIC):])[0]
+            index = json.loads(handler.read(length).decode('utf8'))
+            self.data = mmap.mmap(handler.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+
+        self.offset = len(header) + length
+        self.compiled = index.get('code') == CODE_TAG
+        self.entries = index['entries']
+        self.index = dict((entry['name'], entry) for entry in self.entries
+                          if entry['kind'] != DIRECTORY)
+
+    def read_entry(self, entry):
+        """ Returns the raw bytes of a file entry.
+
+        :param entry: The index entry
+        :type entry: dict
+
+        :returns: bytes
+        """
+
+        start = self.offset + entry['offset']
+        return self.data[start:start + entry['size']]
+
+    def read(self, name):
+        """ Returns the contents of a file in the template, raising KeyError
+        if it does not exist.
+
+        :param name: ``/`` separated path of the file in the template
+        :type name: str
+
+        :returns: bytes
+        """
+
+        return self.read_entry(self.index[name])
+
+    def get_code(self, entry):
+        """ Returns the compiled Jinja2 code of a file entry, None if it was
+        not compiled or was compiled by another Python or Jinja2 version.
+
+        :param entry: The index entry
+        :type entry: dict
+
+        :returns: code or None
+        """
+
+        if not self.compiled or 'code_offset' not in entry:
+            return None
+        start = self.offset + entry['code_offset']
+        return marshal.loads(self.data[start:start + entry['code_size']])
+
+    def close(self):
+        self.data.close()
+
+
+class BundleLoader(BaseLoader):
+    """ Jinja2 loader creating templates straight from the compiled code in
+    a ``TemplateBundle``, so ``{% include %}`` and ``{% extends %}`` work
+    without lexing or compiling. Files without compiled code are compiled
+    from their source. """
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+
+    def get_entry(self, template):
+        try:
+            return self.bundle.index[template]
+        except KeyError:
+            raise TemplateNotFound(template)
+
+    def get_source(self, environment, template):
+        source = self.bundle.read_entry(self.get_entry(template))
+        return source.decode('utf8'), None, lambda: True
+
+    def load(self, environment, name, globals=None):
+        entry = self.get_entry(name)
+        code = self.bundle.get_code(entry)
+        if code is None:
+            source = self.bundle.read_entry(entry).decode('utf8')
+            code = environment.compile(source, name, name)
+        return environment.template_class.from_code(
+            environment, code, environment.make_globals(globals),
+            lambda: True)
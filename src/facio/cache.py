@@ -0,0 +1,473 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.cache
+   :synopsis: Persistent, per user caches shared between facio runs.
+"""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import time
+
+from facio.base import BaseFacio
+from jinja2.bccache import Bucket, BytecodeCache as BaseBytecodeCache
+
+
+def get_default_cache_directory():
+    """ Returns the default per user cache directory, honouring
+    ``$XDG_CACHE_HOME``.
+
+    :returns: str
+    """
+
+    root = os.environ.get('XDG_CACHE_HOME', os.path.join('~', '.cache'))
+    return os.path.join(os.path.expanduser(root), 'facio')
+
+
+# Jinja2 environment settings which change the code a template compiles to
+ENVIRONMENT_SETTINGS = (
+    'block_start_string',
+    'block_end_string',
+    'variable_start_string',
+    'variable_end_string',
+    'comment_start_string',
+    'comment_end_string',
+    'line_statement_prefix',
+    'line_comment_prefix',
+    'trim_blocks',
+    'lstrip_blocks',
+    'newline_sequence',
+    'keep_trailing_newline',
+    'optimized',
+    'autoescape',
+    'finalize',
+)
+
+
+def get_environment_key(environment):
+    """ Returns a string describing the settings and extensions of a Jinja2
+    environment which change the code its templates compile to. Functions
+    are described by name so the key is the same in every process.
+
+    :param environment: The Jinja2 environment
+    :type environment: jinja2.Environment
+
+    :returns: str
+    """
+
+    settings = []
+    for name in ENVIRONMENT_SETTINGS:
+        value = getattr(environment, name, None)
+        if callable(value):
+            value = '{0}.{1}'.format(getattr(value, '__module__', ''),
+                                     getattr(value, '__name__', ''))
+        settings.append(value)
+    settings.append(sorted(environment.extensions))
+    return repr(settings)
+
+
+class BytecodeCache(BaseBytecodeCache):
+    """ On disk Jinja2 bytecode cache keyed by the name, path and content
+    hash of each template file and the settings of the environment compiling
+    it, so repeat generations from the same template skip lexing and
+    compiling. The cache is capped in size, least recently used entries are
+    evicted first. """
+
+    suffix = '.cache'
+
+    def __init__(self, directory, max_size):
+        """ Set the cache directory and maximum size.
+
+        :param directory: Directory to store compiled templates in
+        :type directory: str
+
+        :param max_size: Maximum size of the cache in bytes
+        :type max_size: int
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None
+
+    def get_bucket(self, environment, name, filename, source):
+        """ Returns a cache bucket keyed on the environment settings, the
+        template name and path and the checksum of the template source, so
+        the cached code always carries its own name and path into tracebacks
+        and environments with other delimiters or extensions never share it.
+        """
+
+        checksum = self.get_source_checksum(source)
+        key = hashlib.sha1('|'.join([
+            get_environment_key(environment), name, filename or '',
+            checksum]).encode('utf8')).hexdigest()
+        bucket = Bucket(environment, key, checksum)
+        self.load_bytecode(bucket)
+        return bucket
+
+    def get_path(self, key):
+        """ Returns the path of a cache entry.
+
+        :param key: The cache key
+        :type key: str
+
+        :returns: str
+        """
+
+        return os.path.join(self.directory, key + self.suffix)
+
+    def load_bytecode(self, bucket):
+        path = self.get_path(bucket.key)
+        try:
+            with open(path, 'rb') as handler:
+                bucket.load_bytecode(handler)
+            # Bump the modification time, used for LRU eviction
+            os.utime(path, None)
+        except (IOError, OSError):
+            pass
+
+    def dump_bytecode(self, bucket):
+        path = self.get_path(bucket.key)
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(temp_path, 'wb') as handler:
+                bucket.write_bytecode(handler)
+            os.rename(temp_path, path)
+            size = os.path.getsize(path)
+        except (IOError, OSError):
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+
+        if self.size is None:
+            self.size = self.get_size()
+        else:
+            self.size += size
+        if self.size > self.max_size:
+            self.prune()
+
+    def get_entries(self):
+        """ Returns a list of ``(mtime, size, path)`` tuples for every entry
+        in the cache.
+
+        :returns: list
+        """
+
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+
+        for name in names:
+            if name.endswith(self.suffix):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    def get_size(self):
+        """ Returns the total size of the cache in bytes.
+
+        :returns: int
+        """
+
+        return sum(size for mtime, size, path in self.get_entries())
+
+    def prune(self):
+        """ Evict least recently used entries until the cache fits within
+        ``max_size``. """
+
+        entries = sorted(self.get_entries())
+        self.size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        for mtime, size, path in self.get_entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.size = 0
+
+
+def get_directory_size(path):
+    """ Returns the total size in bytes of the files under path.
+
+    :param path: The directory
+    :type path: str
+
+    :returns: int
+    """
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class MirrorCache(BaseFacio):
+    """ Persistent local mirrors of ``git+`` and ``hg+`` template
+    repositories keyed by repository URL. A mirror older than ``ttl`` seconds
+    is brought up to date with an incremental fetch rather than a fresh clone.
+    Mirrors are locked so concurrent facio processes can share them and the
+    least recently used mirrors are evicted once ``max_size`` is exceeded.
+
+    Each mirror ``<key>`` is stored alongside ``<key>.lock``, whose
+    modification time records when it was last used, ``<key>.fetched``,
+    recording when it was last fetched, and ``<key>.size``. """
+
+    def __init__(self, directory, ttl, max_size):
+        """ Set the cache directory, time to live and maximum size.
+
+        :param directory: Directory to store mirrors in
+        :type directory: str
+
+        :param ttl: Seconds a mirror is fresh for after being fetched
+        :type ttl: int
+
+        :param max_size: Maximum size of all mirrors in bytes
+        :type max_size: int
+        """
+
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.locks = {}
+
+    def get_key(self, origin):
+        """ Returns the cache key for a template origin.
+
+        :param origin: The template origin, e.g: git+git@foo.com/bar.git
+        :type origin: str
+
+        :returns: str
+        """
+
+        return hashlib.sha1(origin.encode('utf8')).hexdigest()
+
+    def get_path(self, origin):
+        """ Returns the path of the mirror of a template origin.
+
+        :param origin: The template origin, e.g: git+git@foo.com/bar.git
+        :type origin: str
+
+        :returns: str
+        """
+
+        return os.path.join(self.directory, self.get_key(origin))
+
+    def lock(self, path, operation=fcntl.LOCK_EX):
+        """ Lock a mirror, blocking until the lock is acquired.
+
+        :param path: Path to the mirror
+        :type path: str
+
+        :param operation: ``fcntl.LOCK_EX`` or ``fcntl.LOCK_SH``
+        :type operation: int
+
+        :returns: file -- The open lock file
+        """
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                pass
+        handler = open(path + '.lock', 'a')
+        fcntl.flock(handler.fileno(), operation)
+        return handler
+
+    def is_stale(self, path):
+        """ Has the mirror not been fetched within ``ttl`` seconds.
+
+        :param path: Path to the mirror
+        :type path: str
+
+        :returns: bool
+        """
+
+        try:
+            fetched = os.path.getmtime(path + '.fetched')
+        except OSError:
+            return True
+        return time.time() - fetched >= self.ttl
+
+    def mark_fetched(self, path):
+        """ Record that a mirror has just been fetched and its size.
+
+        :param path: Path to the mirror
+        :type path: str
+        """
+
+        with open(path + '.fetched', 'w'):
+            pass
+        with open(path + '.size', 'w') as handler:
+            handler.write(str(get_directory_size(path)))
+
+    def needs_update(self, vcs, path, force=False):
+        """ Is the mirror missing, or stale and not of an immutable ref.
+
+        :param vcs: The VCS instance for the repository
+        :type vcs: facio.vcs.BaseVCS
+
+        :param path: Path to the mirror
+        :type path: str
+
+        ** Optional Key Word Arguments **
+
+        :param force: Fetch even if the mirror is fresh
+        :type force: bool -- default False
+
+        :returns: bool
+        """
+
+        if not os.path.isdir(path):
+            return True
+        return not vcs.is_immutable() and (force or self.is_stale(path))
+
+    def checkout(self, vcs, force=False):
+        """ Returns the path to an up to date mirror of a repository, cloning
+        or fetching it as needed, mirrors of immutable refs are never
+        fetched again. A fresh mirror is only ever share locked, so any
+        number of processes read it at once, the lock is made exclusive only
+        to clone or fetch. The mirror stays locked against updates from
+        other processes until ``release`` is called.
+
+        :param vcs: The VCS instance for the repository
+        :type vcs: facio.vcs.BaseVCS
+
+        ** Optional Key Word Arguments **
+
+        :param force: Fetch even if the mirror is fresh
+        :type force: bool -- default False
+
+        :returns: str -- Path to the mirror
+        """
+
+        path = self.get_path(vcs.origin)
+        lock = self.lock(path, fcntl.LOCK_SH)
+        updated = False
+        try:
+            if self.needs_update(vcs, path, force):
+                # flock does not upgrade atomically, another process may
+                # have updated the mirror meanwhile so it is checked again
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                if not os.path.isdir(path):
+                    try:
+                        vcs.clone(path)
+                    except:
+                        shutil.rmtree(path, ignore_errors=True)
+                        raise
+                    updated = True
+                elif self.needs_update(vcs, path, force):
+                    vcs.update(path)
+                    updated = True
+                if updated:
+                    self.mark_fetched(path)
+                # Let other processes read the mirror while this one uses it
+                fcntl.flock(lock.fileno(), fcntl.LOCK_SH)
+            if not updated:
+                self.out('Using cached mirror of {0}'.format(vcs.path))
+            os.utime(path + '.lock', None)
+        except:
+            lock.close()
+            raise
+
+        self.locks[path] = lock
+
+        if updated:
+            self.prune(keep=path)
+
+        return path
+
+    def release(self, path):
+        """ Release the lock taken on a mirror by ``checkout``.
+
+        :param path: Path to the mirror
+        :type path: str
+        """
+
+        lock = self.locks.pop(path, None)
+        if lock is not None:
+            lock.close()
+
+    def get_mirrors(self):
+        """ Returns a list of ``(last_used, size, path)`` tuples for every
+        mirror in the cache.
+
+        :returns: list
+        """
+
+        mirrors = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return mirrors
+
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                last_used = os.path.getmtime(path + '.lock')
+            except OSError:
+                last_used = 0
+            try:
+                with open(path + '.size') as handler:
+                    size = int(handler.read())
+            except (IOError, OSError, ValueError):
+                size = get_directory_size(path)
+            mirrors.append((last_used, size, path))
+
+        return mirrors
+
+    def prune(self, keep=None):
+        """ Evict least recently used mirrors, which are not in use by any
+        process, until the cache fits within ``max_size``.
+
+        :param keep: Path to a mirror which should never be evicted
+        :type keep: str
+        """
+
+        mirrors = sorted(self.get_mirrors())
+        size = sum(mirror_size for last_used, mirror_size, path in mirrors)
+        for last_used, mirror_size, path in mirrors:
+            if size <= self.max_size:
+                break
+            if path == keep or path in self.locks:
+                continue
+            lock = open(path + '.lock', 'a')
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                lock.close()
+                continue
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+                for suffix in ('.fetched', '.size'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            finally:
+                lock.close()
+            size -= mirror_size
@@ -11,7 +11,9 @@ import re
 from docopt import docopt
 from facio import get_version
 from facio.base import BaseFacio
+from facio.cache import get_default_cache_directory
 from facio.exceptions import FacioException
+from facio.files import COPY_STRATEGIES
 from facio.state import state
 from six.moves import configparser as ConfigParser
 from textwrap import dedent
@@ -21,6 +23,24 @@ HOOKS_FILE_NAME = '.facio.hooks.yml'
 CONFIG_FILE_NAME = '.facio.cfg'
 
 
+def parse_variables(variables):
+    """ Returns a dict of the comma separated key=value pairs passed as
+    ``--vars``.
+
+    :param variables: The comma separated key=value pairs
+    :type variables: str
+
+    :returns: dict
+    """
+
+    variable_dict = {}
+    if variables:
+        for pair in variables.split(','):
+            key, value = pair.split('=')
+            variable_dict[key] = value
+    return variable_dict
+
+
 class CommandLineInterface(object):
     """
     Facio
@@ -33,7 +53,15 @@ class CommandLineInterface(object):
         https://facio.readthedocs.org
 
     Usage:
+        facio fetch [--jobs <n>]
+        facio pack <bundle> [--template <path>|--select]
+        facio index [--template <path>|--select]
+        facio batch <records> [--template <path>|--select] [--vars <variables>]
+                              [--jobs <n>] [--verbose]
         facio <project_name> [--template <path>|--select] [--vars <variables>]
+                             [--jobs <n>] [--verbose]
+        facio new <project_name> [--template <path>|--select]
+                                 [--vars <variables>] [--jobs <n>] [--verbose]
 
     Options:
         -h --help              Show this help text.
@@ -45,6 +73,26 @@ class CommandLineInterface(object):
                                to select a template from this list.
         --vars <variables>     Comma separated key=value pairs of values to be
                                used in processing templates.
+        -j --jobs <n>          Number of processes to render files with,
+                               default 1, of templates to fetch at once,
+                               default 4, or of projects to generate at once
+                               in a batch, default 1.
+        -v --verbose           Report extra detail, such as copy throughput
+                               and processes spawned.
+
+    Commands:
+        fetch                  Refresh the cached mirrors of the git+ and hg+
+                               templates in ~/.facio.cfg.
+        pack                   Pack the template into a single file bundle,
+                               which can be passed to --template.
+        index                  Rebuild the .facio.index of a template
+                               directory.
+        batch                  Generate a project for every record of a
+                               JSONL or CSV file, - reads the records from
+                               stdin.
+        new                    Generate a project, the same as
+                               facio <project_name> but for projects named
+                               after a command, e.g. facio new fetch.
 
     Example:
         facio hello_world -t git+git@github.com:you/django.git --vars foo=bar
@@ -54,10 +102,12 @@ class CommandLineInterface(object):
         self.arguments = docopt(
             dedent(self.__doc__),
             version='Facio {0}'.format(get_version()))
-        self.validate_project_name(self.arguments.get('<project_name>'))
+        commands = ('fetch', 'pack', 'index', 'batch')
+        if not any(self.arguments.get(command) for command in commands):
+            self.validate_project_name(self.arguments.get('<project_name>'))
 
     def validate_project_name(self, name):
-        if not re.match('^\w+$', name):
+        if not name or not re.match('^\w+$', name):
             raise FacioException('Project names can only contain numbers '
                                  'letters and underscores')
         else:
@@ -161,19 +211,77 @@ class Settings(BaseFacio):
         # Default template
         return Settings.default_template_path
 
+    def get_templates(self):
+        """ Returns the templates in the ``[template]`` section of the
+        configuration file.
+
+        :returns: list -- (name, path) tuples
+        """
+
+        try:
+            return self.config.items('template')
+        except ConfigParser.NoSectionError:
+            return []
+
+    def get_bundle_path(self):
+        """ Returns the path to write the bundle to passed into the
+        ``pack`` command.
+
+        :returns: str
+        """
+
+        return os.path.abspath(os.path.expanduser(
+            self.interface.arguments.get('<bundle>')))
+
     def get_variables(self):
         """ Returns dict of variables passed into command line interface.
 
         :returns: dict
         """
 
-        variable_dict = {}
-        variables = self.interface.arguments.get('--vars')
-        if variables:
-            for pair in variables.split(','):
-                key, value = pair.split('=')
-                variable_dict[key] = value
-        return variable_dict
+        return parse_variables(self.interface.arguments.get('--vars'))
+
+    def get_records_path(self):
+        """ Returns the path of the records passed into the ``batch``
+        command, ``-`` for stdin.
+
+        :returns: str
+        """
+
+        path = self.interface.arguments.get('<records>')
+        if path == '-':
+            return path
+        return os.path.abspath(os.path.expanduser(path))
+
+    def get_jobs(self, default=1):
+        """ Returns the number of processes to render files with, or of
+        templates to fetch at once, passed into the command line interface.
+
+        ** Optional Key Word Arguments **
+
+        :param default: The number returned if ``--jobs`` is not passed
+        :type default: int -- default 1
+
+        :returns: int
+        """
+
+        jobs = self.interface.arguments.get('--jobs') or default
+        try:
+            jobs = int(jobs)
+            if jobs < 1:
+                raise ValueError
+        except ValueError:
+            raise FacioException('--jobs must be a positive number')
+        return jobs
+
+    def get_verbose(self):
+        """ Returns if ``--verbose`` was passed into the command line
+        interface.
+
+        :returns: bool
+        """
+
+        return bool(self.interface.arguments.get('--verbose'))
 
     def copy_ignore_globs(self):
         """ Returns list of of file copy ignore globs from configuration file.
@@ -205,3 +313,118 @@ class Settings(BaseFacio):
             return []
         else:
             return globs.split(',')
+
+    def copy_strategy(self):
+        """ Returns how files which are not rendered are copied, from the
+        ``copy_strategy`` option of the ``[files]`` section, one of
+        ``auto``, ``hardlink`` or ``copy``. ``hardlink`` only links files
+        from the mirror working trees ``facio batch`` generates from.
+
+        :returns: str
+        """
+
+        try:
+            strategy = self.config.get('files', 'copy_strategy')
+        except ConfigParser.NoSectionError:
+            return 'auto'
+        except ConfigParser.NoOptionError:
+            return 'auto'
+
+        strategy = strategy.strip().lower()
+        if strategy not in COPY_STRATEGIES:
+            self.warning('copy_strategy in [files] should be one of {0}, '
+                         'using auto'.format(', '.join(COPY_STRATEGIES)))
+            return 'auto'
+        return strategy
+
+    def get_int(self, section, option, default):
+        """ Returns an integer option from the configuration file, falling
+        back to default when it is not set or not an integer.
+
+        :param section: The configuration file section
+        :type section: str
+
+        :param option: The option name
+        :type option: str
+
+        :param default: The value returned if the option is not set
+        :type default: int
+
+        :returns: int
+        """
+
+        try:
+            return self.config.getint(section, option)
+        except ConfigParser.NoSectionError:
+            return default
+        except ConfigParser.NoOptionError:
+            return default
+        except ValueError:
+            self.warning('{0} in [{1}] should be a number, using {2}'.format(
+                option, section, default))
+            return default
+
+    def cache_directory(self):
+        """ Returns the directory facio keeps its caches in, from the
+        ``directory`` option of the ``[cache]`` section.
+
+        :returns: str
+        """
+
+        try:
+            path = self.config.get('cache', 'directory')
+        except ConfigParser.NoSectionError:
+            return get_default_cache_directory()
+        except ConfigParser.NoOptionError:
+            return get_default_cache_directory()
+        else:
+            return os.path.expanduser(path)
+
+    def bytecode_cache_size(self):
+        """ Returns the maximum size of the compiled template cache in
+        bytes, configured in megabytes by the ``bytecode_size`` option of the
+        ``[cache]`` section. 0 disables the cache.
+
+        :returns: int
+        """
+
+        return self.get_int('cache', 'bytecode_size', 64) * 1024 * 1024
+
+    def render_buffer_size(self):
+        """ Returns the number of characters of rendered output buffered
+        between writes, configured in kilobytes by the ``render_buffer``
+        option of the ``[files]`` section.
+
+        :returns: int
+        """
+
+        return max(self.get_int('files', 'render_buffer', 64), 1) * 1024
+
+    def copy_threads(self):
+        """ Returns the number of threads copying files at once, from the
+        ``copy_threads`` option of the ``[files]`` section.
+
+        :returns: int
+        """
+
+        return max(self.get_int('files', 'copy_threads', 8), 1)
+
+    def mirror_ttl(self):
+        """ Returns the number of seconds a cached mirror of a ``git+`` or
+        ``hg+`` template is used for before being fetched again, from the
+        ``mirror_ttl`` option of the ``[cache]`` section.
+
+        :returns: int
+        """
+
+        return max(self.get_int('cache', 'mirror_ttl', 0), 0)
+
+    def mirror_cache_size(self):
+        """ Returns the maximum size of the cached template mirrors in bytes,
+        configured in megabytes by the ``mirror_size`` option of the
+        ``[cache]`` section. 0 disables the cache.
+
+        :returns: int
+        """
+
+        return self.get_int('cache', 'mirror_size', 1024) * 1024 * 1024
@@ -9,11 +9,19 @@ import sys
 
 from clint.textui import indent, puts
 from clint.textui.colored import red
+from facio.base import get_embedded_messages
 
 
 class FacioException(Exception):
 
     def __init__(self, message):
+        super(FacioException, self).__init__(message)
+        self.message = message
+
+        # Embedded in another program the exception is simply raised
+        if get_embedded_messages() is not None:
+            return
+
         with indent(4, quote=' >'):
             puts(red('Error: {0}'.format(message)))
             puts(red('Exiting'))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.fetch
+   :synopsis: Refresh the cached mirrors of configured VCS templates.
+"""
+
+import sys
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from facio.base import BaseFacio, Embedded
+from facio.exceptions import FacioException
+from facio.template import Template
+
+
+class Fetch(BaseFacio):
+    """ Refreshes the mirrors of ``git+`` and ``hg+`` templates in a pool of
+    threads, so generating a project from them never waits on a clone. """
+
+    def __init__(self, mirror_cache, jobs=4):
+        """ Set the mirror cache and the number of templates fetched at once.
+
+        :param mirror_cache: The cache to refresh the mirrors in
+        :type mirror_cache: facio.cache.MirrorCache
+
+        ** Optional Key Word Arguments **
+
+        :param jobs: Number of templates to fetch at once
+        :type jobs: int -- default 4
+        """
+
+        self.mirror_cache = mirror_cache
+        self.jobs = jobs
+
+    def get_vcs(self, templates):
+        """ Returns a VCS instance for each ``git+`` and ``hg+`` template,
+        templates sharing an origin are only fetched once.
+
+        :param templates: (name, path) tuples of templates
+        :type templates: list
+
+        :returns: list -- (name, facio.vcs.BaseVCS) tuples
+        """
+
+        found = []
+        origins = set()
+        for name, path in templates:
+            template = Template(path)
+            template.mirror_cache = self.mirror_cache
+            vcs = template.get_vcs()
+            if vcs is not None and vcs.origin not in origins:
+                origins.add(vcs.origin)
+                found.append((name, vcs))
+        return found
+
+    def fetch(self, item):
+        """ Fetch a template into the mirror cache, even if its mirror is
+        fresh, and time it. The fetch is embedded, so a ``FacioException`` is
+        raised rather than exiting and the fetch of the other templates
+        carries on.
+
+        :param item: (name, VCS instance) of the template
+        :type item: tuple
+
+        :returns: tuple -- (name, vcs, seconds, error message or None)
+        """
+
+        name, vcs = item
+        start = time.time()
+        error = None
+        with Embedded():
+            try:
+                path = self.mirror_cache.checkout(vcs, force=True)
+                self.mirror_cache.release(path)
+            except FacioException:
+                error = sys.exc_info()[1].message
+            except (Exception, SystemExit):
+                error = '{0}'.format(sys.exc_info()[1])
+        return name, vcs, time.time() - start, error
+
+    def run(self, templates):
+        """ Fetch every ``git+`` and ``hg+`` template, reporting the time
+        each took and summarising the failures.
+
+        :param templates: (name, path) tuples of templates
+        :type templates: list
+
+        :returns: list -- (name, path) tuples of templates that failed
+        """
+
+        found = self.get_vcs(templates)
+        if not found:
+            self.warning('No git+ or hg+ templates to fetch')
+            return []
+
+        self.out('Fetching {0} templates, {1} at a time'.format(
+            len(found), min(self.jobs, len(found))))
+
+        start = time.time()
+        failures = []
+        pool = ThreadPool(min(self.jobs, len(found)))
+        try:
+            for name, vcs, seconds, error in pool.imap_unordered(self.fetch,
+                                                                 found):
+                if error is None:
+                    self.success('Fetched {0} in {1:.2f}s'.format(
+                        name, seconds))
+                else:
+                    self.error('Failed to fetch {0} after {1:.2f}s'.format(
+                        name, seconds))
+                    failures.append((name, vcs.path, error))
+        finally:
+            pool.close()
+            pool.join()
+
+        self.out('Fetched {0} of {1} templates in {2:.2f}s'.format(
+            len(found) - len(failures), len(found), time.time() - start))
+
+        if failures:
+            for name, path, error in sorted(failures):
+                self.error('{0}: {1}: {2}'.format(name, path, error) if error
+                           else '{0}: {1}'.format(name, path))
+            raise FacioException('Failed to fetch {0} templates'.format(
+                len(failures)))
+
+        return [(name, path) for name, path, error in failures]
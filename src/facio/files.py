@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.files
+   :synopsis: Helpers for inspecting and writing template files.
+"""
+
+import codecs
+import fnmatch
+import mmap
+import os
+import re
+import shutil
+import sys
+import tarfile
+
+# Number of bytes read from the start of a file when sniffing its type
+SNIFF_SIZE = 8192
+
+# Gitignore style file at the template root listing files not to copy
+IGNORE_FILE_NAME = '.facioignore'
+
+# Jinja2 variable, block and comment start markers
+get_marker_pattern = re.compile(br'\{[{%#]')
+
+# File signatures of common binary formats which do not always contain a
+# NUL byte near the start of the file
+MAGIC_NUMBERS = (
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'GIF87a',  # GIF
+    b'GIF89a',  # GIF
+    b'\xff\xd8\xff',  # JPEG
+    b'%PDF-',  # PDF
+    b'PK\x03\x04',  # Zip, Jar, Office documents
+    b'\x1f\x8b',  # Gzip
+    b'BZh',  # Bzip2
+    b'\xfd7zXZ\x00',  # XZ
+    b'7z\xbc\xaf\x27\x1c',  # 7-Zip
+    b'Rar!\x1a\x07',  # RAR
+    b'SQLite format 3\x00',  # SQLite
+    b'\x7fELF',  # ELF executables
+    b'\xca\xfe\xba\xbe',  # Java classes, Mach-O
+    b'wOFF',  # WOFF fonts
+    b'wOF2',  # WOFF2 fonts
+    b'II*\x00',  # TIFF
+    b'MM\x00*',  # TIFF
+    b'\x00\x00\x01\x00',  # Icon
+    b'RIFF',  # WAV, AVI, WebP
+    b'OggS',  # Ogg
+    b'fLaC',  # FLAC
+)
+
+# Linux ioctl sharing the extents of one file with another on copy on write
+# filesystems such as Btrfs and XFS
+FICLONE = 0x40049409
+
+# Ways files which are not rendered can be copied, auto reflinks where
+# possible falling back to an in kernel copy, hardlink also links files
+# from cached templates and copy always copies every byte in Python
+COPY_STRATEGIES = ('auto', 'hardlink', 'copy')
+
+
+class GlobMatcher(object):
+    """ Matches file names against a list of glob patterns compiled once.
+    Literal names and ``*.ext`` style patterns are matched with set lookups,
+    any other patterns are combined into a single regular expression. """
+
+    def __init__(self, patterns):
+        """ Compile the glob patterns.
+
+        :param patterns: List of glob patterns
+        :type patterns: list
+        """
+
+        self.literals = set()
+        self.suffixes = set()
+        expressions = []
+
+        for pattern in patterns:
+            pattern = os.path.normcase(pattern)
+            if not self.is_glob(pattern):
+                self.literals.add(pattern)
+            elif (pattern.startswith('*') and len(pattern) > 1 and
+                    not self.is_glob(pattern[1:])):
+                self.suffixes.add(pattern[1:])
+            else:
+                expressions.append(fnmatch.translate(pattern))
+
+        self.suffix_lengths = set(len(suffix) for suffix in self.suffixes)
+        self.expression = None
+        if expressions:
+            self.expression = re.compile('|'.join(expressions))
+
+    def is_glob(self, pattern):
+        """ Does the pattern contain glob special characters.
+
+        :param pattern: Glob pattern
+        :type pattern: str
+
+        :returns: bool
+        """
+
+        return '*' in pattern or '?' in pattern or '[' in pattern
+
+    def match(self, name):
+        """ Does the name match any of the patterns.
+
+        :param name: File or directory name
+        :type name: str
+
+        :returns: bool
+        """
+
+        name = os.path.normcase(name)
+        if name in self.literals:
+            return True
+        for length in self.suffix_lengths:
+            if name[-length:] in self.suffixes:
+                return True
+        if self.expression is not None:
+            return self.expression.match(name) is not None
+        return False
+
+    def filter(self, names):
+        """ Returns the names matching any of the patterns.
+
+        :param names: List of file or directory names
+        :type names: list
+
+        :returns: set
+        """
+
+        return set(name for name in names if self.match(name))
+
+    def __call__(self, path, names):
+        """ Allows the matcher to be used as a ``shutil.copytree`` ignore
+        callable. """
+
+        return self.filter(names)
+
+
+def translate_ignore_pattern(pattern):
+    """ Translate a gitignore style pattern into a regular expression
+    matched against paths relative to the template root. ``*`` and ``?``
+    do not match ``/``, ``**`` matches across directories and patterns
+    containing a ``/`` are anchored to the template root.
+
+    :param pattern: The pattern, without any ``!`` or trailing ``/``
+    :type pattern: str
+
+    :returns: str
+    """
+
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    expression = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            expression.append('(?:.*/)?')
+            i += 3
+            continue
+        elif pattern.startswith('**', i):
+            expression.append('.*')
+            i += 2
+            continue
+        elif c == '*':
+            expression.append('[^/]*')
+        elif c == '?':
+            expression.append('[^/]')
+        elif c == '\\' and i + 1 < n:
+            expression.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        elif c == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            members = pattern[i + 1:end].replace('\\', '\\\\')
+            if members.startswith('!'):
+                members = '^' + members[1:]
+            expression.append('[{0}]'.format(members))
+            i = end + 1
+            continue
+        else:
+            expression.append(re.escape(c))
+        i += 1
+
+    if anchored:
+        return '^{0}$'.format(''.join(expression))
+    return '^(?:.*/)?{0}$'.format(''.join(expression))
+
+
+class IgnoreMatcher(object):
+    """ Matches paths relative to the template root against the copy ignore
+    globs, matched against file and directory names, followed by gitignore
+    style rules, such as those in ``.facioignore``. Rules support ``!``
+    negation, patterns anchored with a ``/`` and ``dir/`` patterns matching
+    only directories. As with gitignore the last matching rule wins, so a
+    template can re-include a name ignored by the globs. """
+
+    def __init__(self, globs, rules=(), root=None):
+        """ Compile the globs and rules.
+
+        :param globs: List of glob patterns matched against names
+        :type globs: list
+
+        ** Optional Key Word Arguments **
+
+        :param rules: Lines of a gitignore style file
+        :type rules: list -- default ()
+
+        :param root: Template root, only needed to use the matcher as a
+                     ``shutil.copytree`` ignore callable
+        :type root: str -- default None
+        """
+
+        self.globs = GlobMatcher(globs)
+        self.root = root
+        self.rules = []
+
+        for line in rules:
+            line = line.rstrip('\n\r')
+            if not line.endswith('\\ '):
+                line = line.rstrip(' ')
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            directory = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            self.rules.append((re.compile(translate_ignore_pattern(line)),
+                               negate, directory))
+
+    def is_ignored(self, path, is_dir=False):
+        """ Is the path ignored, directories above it are not checked.
+
+        :param path: ``/`` separated path relative to the template root
+        :type path: str
+
+        ** Optional Key Word Arguments **
+
+        :param is_dir: Is the path a directory
+        :type is_dir: bool -- default False
+
+        :returns: bool
+        """
+
+        ignored = self.globs.match(path.rsplit('/', 1)[-1])
+        for expression, negate, directory in self.rules:
+            if directory and not is_dir:
+                continue
+            if ignored == negate and expression.match(path):
+                ignored = not negate
+        return ignored
+
+    def excludes(self, path, is_dir=False):
+        """ Is the path, or any directory above it, ignored. Used when paths
+        are not visited top down, such as members of an archive.
+
+        :param path: ``/`` separated path relative to the template root
+        :type path: str
+
+        ** Optional Key Word Arguments **
+
+        :param is_dir: Is the path a directory
+        :type is_dir: bool -- default False
+
+        :returns: bool
+        """
+
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            if self.is_ignored('/'.join(parts[:i]), True):
+                return True
+        return self.is_ignored(path, is_dir)
+
+    def filter(self, directory, dirs, files):
+        """ Returns the names ignored in a directory, for use while walking
+        the template top down so ignored directories are pruned before they
+        are descended into.
+
+        :param directory: ``/`` separated path of the directory relative to
+                          the template root, empty for the root
+        :type directory: str
+
+        :param dirs: Names of the directories in the directory
+        :type dirs: list
+
+        :param files: Names of the files in the directory
+        :type files: list
+
+        :returns: set
+        """
+
+        prefix = directory + '/' if directory else ''
+        ignored = set()
+        for names, is_dir in ((dirs, True), (files, False)):
+            for name in names:
+                if self.is_ignored(prefix + name, is_dir):
+                    ignored.add(name)
+        return ignored
+
+    def __call__(self, path, names):
+        """ Allows the matcher to be used as a ``shutil.copytree`` ignore
+        callable. """
+
+        directory = get_relative_path(path, self.root or path)
+        dirs = [n for n in names if os.path.isdir(os.path.join(path, n))]
+        files = [n for n in names if n not in dirs]
+        return self.filter(directory, dirs, files)
+
+
+def get_relative_path(path, root):
+    """ Returns path relative to root with ``/`` separators, empty for
+    root itself.
+
+    :param path: The path
+    :type path: str
+
+    :param root: The directory path is within
+    :type root: str
+
+    :returns: str
+    """
+
+    path = os.path.relpath(path, root)
+    if path == '.':
+        return ''
+    return path.replace(os.sep, '/')
+
+
+def reflink(source, destination):
+    """ Clone source to destination with a copy on write reflink, no data is
+    copied until either file is modified.
+
+    :param source: Path to the file to clone
+    :type source: str
+
+    :param destination: Path to create the clone at
+    :type destination: str
+
+    :returns: bool -- False if the filesystem does not support reflinks
+    """
+
+    try:
+        import fcntl
+    except ImportError:  # pragma: no cover
+        return False
+
+    try:
+        with open(source, 'rb') as source_handler:
+            with open(destination, 'wb') as handler:
+                fcntl.ioctl(handler.fileno(), FICLONE,
+                            source_handler.fileno())
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def copy_file_data(source, destination):
+    """ Copy the contents of source to destination in the kernel with
+    ``copy_file_range``, or ``sendfile`` on Linux, the only platform which
+    can ``sendfile`` between regular files, where available. Any error from
+    either falls back to reading and writing in Python.
+
+    :param source: Path to the file to copy
+    :type source: str
+
+    :param destination: Path to copy the file to
+    :type destination: str
+    """
+
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    sendfile = None
+    if sys.platform.startswith('linux'):
+        sendfile = getattr(os, 'sendfile', None)
+
+    with open(source, 'rb') as source_handler:
+        with open(destination, 'wb') as handler:
+            size = os.fstat(source_handler.fileno()).st_size
+            offset = 0
+            try:
+                while offset < size:
+                    if copy_file_range is not None:
+                        copied = copy_file_range(source_handler.fileno(),
+                                                 handler.fileno(),
+                                                 size - offset)
+                    elif sendfile is not None:
+                        copied = sendfile(handler.fileno(),
+                                          source_handler.fileno(),
+                                          offset, size - offset)
+                    else:
+                        break
+                    if not copied:
+                        break
+                    offset += copied
+            except OSError:
+                # Python copies what the kernel would not, a real error such
+                # as a full disk is raised again there
+                offset = 0
+            if offset < size:
+                source_handler.seek(0)
+                handler.seek(0)
+                handler.truncate()
+                shutil.copyfileobj(source_handler, handler)
+
+
+def copy_file(source, destination, strategy='auto', link=False):
+    """ Copy a file which is not rendered, with its permissions and
+    modification time, using the cheapest method the strategy and the
+    filesystem allow.
+
+    :param source: Path to the file to copy
+    :type source: str
+
+    :param destination: Path to copy the file to
+    :type destination: str
+
+    ** Optional Key Word Arguments **
+
+    :param strategy: One of ``COPY_STRATEGIES``
+    :type strategy: str -- default auto
+
+    :param link: Hardlink source if the strategy is hardlink, only for files
+                 which are never modified in place
+    :type link: bool -- default False
+    """
+
+    if strategy == 'copy':
+        shutil.copy2(source, destination)
+        return
+
+    if link and strategy == 'hardlink':
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+
+    if not reflink(source, destination):
+        copy_file_data(source, destination)
+    shutil.copystat(source, destination)
+
+
+def is_binary_data(head):
+    """ Sniff the first ``SNIFF_SIZE`` bytes of a file to see if it is
+    binary, by looking for a NUL byte or a known binary file signature.
+
+    :param head: The start of the file
+    :type head: bytes
+
+    :returns: bool
+    """
+
+    return b'\x00' in head or head.startswith(MAGIC_NUMBERS)
+
+
+def is_binary(path):
+    """ Sniff the start of a file to see if it is binary, see
+    ``is_binary_data``.
+
+    :param path: Path to the file
+    :type path: str
+
+    :returns: bool
+    """
+
+    with open(path, 'rb') as handler:
+        head = handler.read(SNIFF_SIZE)
+
+    return is_binary_data(head)
+
+
+def has_template_markers(path):
+    """ Scan a memory mapped file for Jinja2 ``{{``, ``{%`` or ``{#``
+    markers, files without any do not need rendering.
+
+    :param path: Path to the file
+    :type path: str
+
+    :returns: bool
+    """
+
+    with open(path, 'rb') as handler:
+        if not os.fstat(handler.fileno()).st_size:
+            return False
+        mapped = mmap.mmap(handler.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return get_marker_pattern.search(mapped) is not None
+        finally:
+            mapped.close()
+
+
+def write_stream(chunks, path, buffer_size):
+    """ Write an iterable of text chunks, such as a Jinja2 template stream, to
+    a utf8 encoded file. Chunks are buffered up to buffer_size characters
+    between writes so memory use is bounded whatever the size of the output.
+
+    :param chunks: The text to write
+    :type chunks: iterable
+
+    :param path: Path to the file to write
+    :type path: str
+
+    :param buffer_size: Number of characters to buffer between writes
+    :type buffer_size: int
+    """
+
+    with codecs.open(path, 'w', encoding='utf8') as handler:
+        buffered = []
+        size = 0
+        for chunk in chunks:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                handler.write(u''.join(buffered))
+                buffered = []
+                size = 0
+        if buffered:
+            handler.write(u''.join(buffered))
+
+
+def extract_tar_stream(fileobj, destination, ignore=None, prefix=''):
+    """ Extract a tar archive read sequentially from a stream, such as the
+    output of ``git archive``, into destination. Only regular files,
+    directories and symbolic links are extracted, members with ``..`` in
+    their path are skipped.
+
+    :param fileobj: The stream to read the archive from
+    :type fileobj: file
+
+    :param destination: Directory to extract to, created if needed
+    :type destination: str
+
+    ** Optional Key Word Arguments **
+
+    :param ignore: Members whose path, or a directory above it, is ignored
+                   are skipped
+    :type ignore: facio.files.IgnoreMatcher -- default None
+
+    :param prefix: Only members under prefix are extracted, with the
+                   prefix removed from their path
+    :type prefix: str -- default ''
+
+    :returns: int -- Number of files extracted
+    """
+
+    if not os.path.isdir(destination):
+        os.makedirs(destination)
+
+    count = 0
+    archive = tarfile.open(fileobj=fileobj, mode='r|')
+    try:
+        for member in archive:
+            name = member.name
+            if prefix:
+                if name != prefix and not name.startswith(prefix + '/'):
+                    continue
+                name = name[len(prefix):]
+            parts = [part for part in name.split('/') if part not in ('', '.')]
+            if not parts or '..' in parts:
+                continue
+            if ignore is not None and ignore.excludes('/'.join(parts),
+                                                      member.isdir()):
+                continue
+
+            path = os.path.join(destination, *parts)
+            if member.isdir():
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                continue
+
+            parent = os.path.dirname(path)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            if member.issym():
+                os.symlink(member.linkname, path)
+            elif member.isfile():
+                source = archive.extractfile(member)
+                with open(path, 'wb') as handler:
+                    shutil.copyfileobj(source, handler)
+                os.chmod(path, member.mode & 0o7777)
+                os.utime(path, (member.mtime, member.mtime))
+                count += 1
+    finally:
+        archive.close()
+
+    return count
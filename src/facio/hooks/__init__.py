@@ -6,20 +6,52 @@
 """
 
 import sys
+import time
 import yaml
 
 from facio.base import BaseFacio
-from facio.state import state
+from facio.state import HOOK_FAILED, HOOK_SUCCEEDED, HookCalls, state
 from importlib import import_module
 from yaml.scanner import ScannerError
 
 
+def accepts_context(function):
+    """ Does a hooks module run() function take a context argument.
+
+    :param function: The run() function
+    :type function: function
+
+    :returns: bool
+    """
+
+    code = getattr(function, '__code__', None)
+    if code is None:
+        return False
+    return 'context' in code.co_varnames[:code.co_argcount]
+
+
 class Hook(BaseFacio):
 
-    def __init__(self):
-        """ Hook class instanctiation. """
+    def __init__(self, context=None):
+        """ Hook class instanctiation.
+
+        ** Optional Key Word Arguments **
+
+        :param context: The run the hooks belong to, else the process wide
+                        ``facio.state.state``
+        :type context: facio.state.Context -- default None
+        """
+
+        self.calls = HookCalls()
+        self.context = context
 
-        self.calls = []
+    def get_state(self):
+        """ Returns the context of the run, else the process wide state.
+
+        :returns: facio.state.Context or facio.state.State
+        """
+
+        return state if self.context is None else self.context
 
     def load(self, path):
         """ Parse the hooks file.
@@ -30,16 +62,28 @@ class Hook(BaseFacio):
 
         try:
             with open(path) as f:
-                try:
-                    self.hooks = yaml.load(f.read())
-                except ScannerError:
-                    self.warning('Error loading {0} hooks - Is it '
-                                 'correctly formatted?'.format(path))
-                else:
-                    self.out('Loading hooks')
+                self.parse(f.read(), path)
         except IOError:
             self.warning('{0} not found'.format(path))
 
+    def parse(self, data, path):
+        """ Parse the contents of a hooks file.
+
+        :param data: The hooks file contents
+        :type data: str
+
+        :param path: Path to the hooks file, used in messages
+        :type path: str
+        """
+
+        try:
+            self.hooks = yaml.load(data)
+        except ScannerError:
+            self.warning('Error loading {0} hooks - Is it '
+                         'correctly formatted?'.format(path))
+        else:
+            self.out('Loading hooks')
+
     def _validate_before(self):
         try:
             if 'before' in self.hooks:
@@ -102,6 +146,24 @@ class Hook(BaseFacio):
             self.out('Loaded module: {0}'.format(path))
             return module
 
+    def call_module(self, module):
+        """ Call the run() function of a module, with the context entered
+        so modules using ``facio.state.state`` see the run's state. Run
+        functions taking a context argument are passed it.
+
+        :param module: The imported module
+        :type module: module
+
+        :returns: The result of the module run() function
+        """
+
+        if self.context is None:
+            return module.run()
+        with self.context:
+            if accepts_context(module.run):
+                return module.run(context=self.context)
+            return module.run()
+
     def run_module(self, path):
         """ Run a before or after module.
 
@@ -113,8 +175,11 @@ class Hook(BaseFacio):
         result = None
 
         if module:
+            status = HOOK_FAILED
+            start = time.time()
             try:
-                result = module.run()
+                result = self.call_module(module)
+                status = HOOK_SUCCEEDED
             except AttributeError:
                 self.error('Error Running Module: Missing run() method.')
             except Exception:
@@ -123,8 +188,10 @@ class Hook(BaseFacio):
                 self.warning('Exeption caught in module: {0} line: {1}'.format(
                     e,
                     traceback.tb_lineno))
-            self.calls.append({path: result})
-            state.save_hook_call(path, result)
+            seconds = time.time() - start
+            self.calls.add(path, result, status=status, seconds=seconds)
+            self.get_state().save_hook_call(path, result, status=status,
+                                            seconds=seconds)
             return result
 
     def has_run(self, path):
@@ -136,12 +203,10 @@ class Hook(BaseFacio):
         :returns: False if not run else the modules returned data
         """
 
-        try:
-            data = [d for d in self.calls if path in d][0]
-        except IndexError:
+        call = self.calls.get(path)
+        if call is None:
             return False
-        else:
-            return data[path]
+        return call['result']
 
     def run_before(self):
         """ Run the before modules. """
@@ -15,6 +15,17 @@ class GenerateDjangoSecretKey(BaseFacio):
 
     characters = 'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)'
 
+    def __init__(self, context=None):
+        """ Set the run the hook belongs to.
+
+        ** Optional Key Word Arguments **
+
+        :param context: The run, else the process wide ``facio.state.state``
+        :type context: facio.state.Context -- default None
+        """
+
+        self.context = state if context is None else context
+
     def generate(self):
         """ Generate Django secret key
 
@@ -26,10 +37,16 @@ class GenerateDjangoSecretKey(BaseFacio):
         return key
 
 
-def run():
-    """ Called by the ``facio.hooks`` runner. """
+def run(context=None):
+    """ Called by the ``facio.hooks`` runner.
+
+    ** Optional Key Word Arguments **
+
+    :param context: The run, else the process wide ``facio.state.state``
+    :type context: facio.state.Context -- default None
+    """
 
-    generator = GenerateDjangoSecretKey()
+    generator = GenerateDjangoSecretKey(context=context)
     key = generator.generate()
-    state.update_context_variables({'DJANGO_SECRET_KEY': key})
+    generator.context.update_context_variables({'DJANGO_SECRET_KEY': key})
     return key
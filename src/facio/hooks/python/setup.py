@@ -15,6 +15,17 @@ from facio.state import state
 
 class Setup(BaseFacio):
 
+    def __init__(self, context=None):
+        """ Set the run the hook belongs to.
+
+        ** Optional Key Word Arguments **
+
+        :param context: The run, else the process wide ``facio.state.state``
+        :type context: facio.state.Context -- default None
+        """
+
+        self.context = state if context is None else context
+
     def log_errors(self, errors):
         """ Called with errors are encountered running setup.py and are logged
         to a setup.error.log.
@@ -23,7 +34,7 @@ class Setup(BaseFacio):
         :type errors: str
         """
 
-        project_root = state.get_project_root()
+        project_root = self.context.get_project_root()
         log_path = os.path.join(project_root, 'setup.error.log')
 
         with open(log_path, 'a') as handler:
@@ -62,7 +73,7 @@ class Setup(BaseFacio):
         """
 
         # Returns path to virtualenv
-        call = state.get_hook_call(
+        call = self.context.get_hook_call(
             'facio.hooks.python.virtualenv')
 
         if call:
@@ -96,8 +107,8 @@ class Setup(BaseFacio):
         :returns: bool -- Based on return code subprocess call return code
         """
 
-        project_root = state.get_project_root()
-        working_dir = state.get_working_directory()
+        project_root = self.context.get_project_root()
+        working_dir = self.context.get_working_directory()
 
         python = self.get_path_to_python()
         setup = os.path.join(project_root, 'setup.py')
@@ -119,12 +130,17 @@ class Setup(BaseFacio):
         return True
 
 
-def run():
+def run(context=None):
     """ Called by hooks runner, runs the setup class and returns Bool on
     status of the run command.
 
+    ** Optional Key Word Arguments **
+
+    :param context: The run, else the process wide ``facio.state.state``
+    :type context: facio.state.Context -- default None
+
     :returns: bool -- The state of running setup.py
     """
 
-    setup = Setup()
+    setup = Setup(context=context)
     return setup.run()
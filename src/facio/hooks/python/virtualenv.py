@@ -13,6 +13,17 @@ from facio.state import state
 
 class Virtualenv(BaseFacio):
 
+    def __init__(self, context=None):
+        """ Set the run the hook belongs to.
+
+        ** Optional Key Word Arguments **
+
+        :param context: The run, else the process wide ``facio.state.state``
+        :type context: facio.state.Context -- default None
+        """
+
+        self.context = state if context is None else context
+
     def get_name(self):
         """ Returns the name for the virtualenv - gathered from user input with
         the default value being the project name from facio state.
@@ -20,7 +31,7 @@ class Virtualenv(BaseFacio):
         :returns: str -- Virtual environment name
         """
 
-        project_name = state.get_context_variable('PROJECT_NAME')
+        project_name = self.context.get_context_variable('PROJECT_NAME')
         prompt = "Please enter a name for the virtual environment you want "\
                  "to create, leave blank to name it {0}: ".format(project_name)
         name = self.gather(prompt)
@@ -70,11 +81,16 @@ class Virtualenv(BaseFacio):
                 return path
 
 
-def run():
+def run(context=None):
     """ Called from ``facio.hooks`` runner.
 
+    ** Optional Key Word Arguments **
+
+    :param context: The run, else the process wide ``facio.state.state``
+    :type context: facio.state.Context -- default None
+
     :returns: str -- Path to the created virtual environment
     """
 
-    env = Virtualenv()
+    env = Virtualenv(context=context)
     return env.create()
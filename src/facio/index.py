@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.index
+   :synopsis: Sidecar index of a template directory's files and how each is
+              generated.
+"""
+
+import hashlib
+import json
+import os
+import stat
+
+from facio.files import get_relative_path
+
+# Index file at the template root, written by facio index
+INDEX_FILE_NAME = '.facio.index'
+
+# Bumped when the index format changes, older indexes are rebuilt
+INDEX_VERSION = 1
+
+
+def get_file_hash(path):
+    """ Returns the SHA1 hex digest of the contents of a file.
+
+    :param path: Path to the file
+    :type path: str
+
+    :returns: str
+    """
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handler:
+        for chunk in iter(lambda: handler.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TemplateIndex(object):
+    """ Lists every directory and file of a template directory not matching
+    the copy ignore globs, in the order they are generated. Files record
+    their size, modification time, SHA1 hash, how they are generated, a
+    ``facio.template`` render outcome or ``COPIED``, and whether their name
+    needs renaming. Directories record their modification time and the names
+    in them which are ignored, so added and removed files are noticed without
+    walking the template. """
+
+    def __init__(self, path):
+        """ Set the path of the index file.
+
+        :param path: Path to the index file
+        :type path: str
+        """
+
+        self.path = path
+        self.root = os.path.dirname(path)
+        self.settings = {}
+        self.entries = []
+
+    def get_settings(self, template):
+        """ Returns the template settings the index was built with, an index
+        built with other settings is not valid.
+
+        :param template: The template
+        :type template: facio.template.Template
+
+        :returns: dict
+        """
+
+        return {
+            'version': INDEX_VERSION,
+            'copy_ignore': list(template.get_copy_ignore_globs()),
+            'render_ignore': list(template.get_render_ignore_globs()),
+            'ignore_rules': list(template.get_ignore_rules()),
+        }
+
+    def build(self, template):
+        """ Walk and classify the template directory, every file is read
+        once to hash and sniff it.
+
+        :param template: The template, its origin must be the index root
+        :type template: facio.template.Template
+        """
+
+        ignore = template.get_copy_ignore_matcher()
+        self.settings = self.get_settings(template)
+        self.entries = []
+
+        for root, dirs, files in os.walk(self.root, followlinks=True):
+            directory = get_relative_path(root, self.root)
+            prefix = directory + '/' if directory else ''
+            ignored = ignore.filter(directory, dirs, files)
+            dirs[:] = sorted(d for d in dirs if d not in ignored)
+
+            self.entries.append({
+                'name': directory,
+                'dir': True,
+                'mtime': os.stat(root).st_mtime,
+                'rename': '{{' in directory.rpartition('/')[2],
+                'ignored': sorted(ignored),
+            })
+
+            for filename in sorted(f for f in files if f not in ignored):
+                path = os.path.join(root, filename)
+                stats = os.stat(path)
+                self.entries.append({
+                    'name': prefix + filename,
+                    'kind': template.classify(path),
+                    'size': stats.st_size,
+                    'mtime': stats.st_mtime,
+                    'sha1': get_file_hash(path),
+                    'rename': '{{' in filename,
+                })
+
+    def load(self):
+        """ Read the index file, raising IOError or ValueError if it can not
+        be read. """
+
+        with open(self.path, 'rb') as handler:
+            index = json.loads(handler.read().decode('utf8'))
+        try:
+            self.settings = index['settings']
+            self.entries = index['entries']
+        except (KeyError, TypeError):
+            raise ValueError('{0} is not a template index'.format(self.path))
+
+    def save(self):
+        """ Write the index file, replacing any existing index once it is
+        complete. """
+
+        temp_path = '{0}.facio.tmp'.format(self.path)
+        try:
+            with open(temp_path, 'wb') as handler:
+                handler.write(json.dumps({
+                    'settings': self.settings,
+                    'entries': self.entries,
+                }, separators=(',', ':'), sort_keys=True).encode('utf8'))
+            os.rename(temp_path, self.path)
+        except:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_path(self, name):
+        """ Returns the path of an entry.
+
+        :param name: ``/`` separated path relative to the template root
+        :type name: str
+
+        :returns: str
+        """
+
+        if not name:
+            return self.root
+        return os.path.join(self.root, *name.split('/'))
+
+    def is_valid(self, template):
+        """ Does the index still describe the template. Only entries are
+        stat'd, directories are listed only when their modification time has
+        changed and files are hashed only when their size matches but their
+        modification time has changed, such as in a fresh checkout.
+
+        :param template: The template
+        :type template: facio.template.Template
+
+        :returns: bool
+        """
+
+        if self.settings != self.get_settings(template):
+            return False
+
+        children = {}
+        for entry in self.entries:
+            if entry['name']:
+                parent = entry['name'].rpartition('/')[0]
+                children.setdefault(parent, set()).add(
+                    entry['name'].rpartition('/')[2])
+
+        for entry in self.entries:
+            path = self.get_path(entry['name'])
+            try:
+                stats = os.stat(path)
+            except OSError:
+                return False
+
+            if entry.get('dir'):
+                if not stat.S_ISDIR(stats.st_mode):
+                    return False
+                if stats.st_mtime != entry['mtime']:
+                    names = children.get(entry['name'], set()).union(
+                        entry['ignored'])
+                    if not entry['name']:
+                        names.add(INDEX_FILE_NAME)
+                    if set(os.listdir(path)) != names:
+                        return False
+            else:
+                if not stat.S_ISREG(stats.st_mode) or \
+                        stats.st_size != entry['size']:
+                    return False
+                if stats.st_mtime != entry['mtime'] and \
+                        get_file_hash(path) != entry['sha1']:
+                    return False
+
+        return True
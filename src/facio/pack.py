@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: facio.pack
+   :synopsis: Pack a template into a single file, precompiled bundle.
+"""
+
+import os
+import sys
+
+from facio.base import BaseFacio
+from facio.bundle import BundleWriter
+from facio.exceptions import FacioException
+from facio.template import RENDERED
+
+
+class Pack(BaseFacio):
+    """ Packs a template directory into a bundle, see
+    ``facio.bundle.BundleWriter``. Files are classified and rendered files
+    compiled once when packing, so generating a project from the bundle never
+    walks, sniffs or compiles the template. """
+
+    def __init__(self, template):
+        """ Set the template to pack.
+
+        :param template: The template, prepared so its origin is a directory
+        :type template: facio.template.Template
+        """
+
+        self.template = template
+
+    def compile(self, environment, name, path):
+        """ Returns the Jinja2 code compiled from a template file, None if it
+        fails to compile, it is then rendered from its source, failing as it
+        would without a bundle.
+
+        :param environment: Jinja2 environment to compile with
+        :type environment: jinja2.Environment
+
+        :param name: The Jinja2 template name of the file
+        :type name: str
+
+        :param path: Path to the template file
+        :type path: str
+
+        :returns: code or None
+        """
+
+        try:
+            with open(path, 'rb') as handler:
+                source = handler.read().decode('utf8')
+            return environment.compile(source, name, name)
+        except:
+            self.warning('Failed to compile {0}: {1}'.format(
+                path, sys.exc_info()[1]))
+            return None
+
+    def run(self, path):
+        """ Write the bundle.
+
+        :param path: Path to write the bundle to
+        :type path: str
+        """
+
+        template = self.template
+        if not os.path.isdir(template.origin):
+            raise FacioException('Only template directories and git+ or hg+ '
+                                 'templates can be packed')
+
+        self.out('Packing {0} into {1}'.format(template.origin, path))
+
+        environment = template.get_environment(template.origin)
+        writer = BundleWriter(path)
+        files = 0
+        compiled = 0
+        try:
+            for name, source, is_dir in template.walk():
+                stat = os.stat(source)
+                mode = stat.st_mode & 0o7777
+                rename = '{{' in name.rpartition('/')[2]
+                if is_dir:
+                    writer.add_directory(name, mode, stat.st_mtime, rename)
+                    continue
+
+                kind = template.classify(source)
+                code = None
+                if kind == RENDERED:
+                    code = self.compile(environment, name, source)
+                    compiled += code is not None
+                writer.add_file(name, kind, mode, stat.st_mtime, rename,
+                                source, code=code)
+                files += 1
+            writer.close()
+        except (IOError, OSError):
+            raise FacioException('Failed to pack {0} into {1}'.format(
+                template.origin, path))
+
+        self.out('Packed {0} files, {1} compiled'.format(files, compiled))
@@ -8,13 +8,19 @@
 import os
 
 from facio.base import BaseFacio
+from facio.batch import Batch
+from facio.cache import BytecodeCache, MirrorCache
 from facio.config import (HOOKS_FILE_NAME,
                           Settings,
                           CommandLineInterface,
                           ConfigurationFile)
+from facio.exceptions import FacioException
+from facio.fetch import Fetch
 from facio.hooks import Hook
+from facio.index import INDEX_FILE_NAME, TemplateIndex
+from facio.pack import Pack
 from facio.template import Template
-from facio.state import state
+from facio.state import count_processes, state
 
 
 class Run(BaseFacio):
@@ -29,25 +35,187 @@ class Run(BaseFacio):
         parsed = config.read()
 
         settings = Settings(interface, parsed)
+
+        if interface.arguments.get('fetch'):
+            return self.fetch(settings)
+
+        if interface.arguments.get('pack'):
+            return self.pack(settings)
+
+        if interface.arguments.get('index'):
+            return self.index(settings)
+
+        if interface.arguments.get('batch'):
+            return self.batch(settings)
+
         state.update_context_variables(settings.get_variables())
 
-        template = Template(settings.get_template_path())
-        template.update_copy_ignore_globs(settings.copy_ignore_globs())
-        template.update_render_ignore_globs(settings.render_ignore_globs())
-        template.copy()
+        counting = settings.get_verbose() and count_processes()
 
-        pipeline = Hook()
-        pipeline.load(os.path.join(
-            state.get_project_root(),
-            HOOKS_FILE_NAME))
+        template = self.get_template(settings)
+        vcs = template.prepare()
+        pipeline = self.get_hooks(template)
 
         if pipeline.has_before():
             pipeline.run_before()
 
-        template.rename()
-        template.render()
+        template.generate(callback=vcs.cleanup if vcs else None)
 
         if pipeline.has_after():
             pipeline.run_after()
 
+        if counting:
+            self.out('Spawned {0} processes'.format(
+                state.get_process_count()))
+
+        self.success('Done')
+
+    def get_template(self, settings):
+        """ Returns the template configured from the settings.
+
+        :param settings: The facio settings
+        :type settings: facio.config.Settings
+
+        :returns: facio.template.Template
+        """
+
+        template = Template(settings.get_template_path(),
+                            jobs=settings.get_jobs())
+        template.update_copy_ignore_globs(settings.copy_ignore_globs())
+        template.update_render_ignore_globs(settings.render_ignore_globs())
+        template.buffer_size = settings.render_buffer_size()
+        template.copy_strategy = settings.copy_strategy()
+        template.copy_threads = settings.copy_threads()
+        template.verbose = settings.get_verbose()
+        if settings.bytecode_cache_size():
+            template.bytecode_cache = BytecodeCache(
+                os.path.join(settings.cache_directory(), 'bytecode'),
+                settings.bytecode_cache_size())
+        template.mirror_cache = self.get_mirror_cache(settings)
+        return template
+
+    def get_hooks(self, template, context=None):
+        """ Returns the hooks of a prepared template.
+
+        :param template: The prepared template
+        :type template: facio.template.Template
+
+        ** Optional Key Word Arguments **
+
+        :param context: The run the hooks belong to
+        :type context: facio.state.Context -- default None
+
+        :returns: facio.hooks.Hook
+        """
+
+        pipeline = Hook(context=context)
+        packed = template.bundle or template.archive
+        if packed is None:
+            pipeline.load(os.path.join(template.origin, HOOKS_FILE_NAME))
+        else:
+            try:
+                pipeline.parse(packed.read(HOOKS_FILE_NAME), HOOKS_FILE_NAME)
+            except KeyError:
+                pipeline.warning('{0} not found in {1}'.format(
+                    HOOKS_FILE_NAME, template.origin))
+        return pipeline
+
+    def get_mirror_cache(self, settings):
+        """ Returns the cache of template mirrors, None if it is disabled.
+
+        :param settings: The facio settings
+        :type settings: facio.config.Settings
+
+        :returns: facio.cache.MirrorCache or None
+        """
+
+        if not settings.mirror_cache_size():
+            return None
+        return MirrorCache(
+            os.path.join(settings.cache_directory(), 'mirrors'),
+            settings.mirror_ttl(),
+            settings.mirror_cache_size())
+
+    def fetch(self, settings):
+        """ Refresh the mirrors of the templates in the configuration file.
+
+        :param settings: The facio settings
+        :type settings: facio.config.Settings
+        """
+
+        mirror_cache = self.get_mirror_cache(settings)
+        if mirror_cache is None:
+            raise FacioException('The template mirror cache is disabled, '
+                                 'set mirror_size in [cache]')
+
+        Fetch(mirror_cache, jobs=settings.get_jobs(default=4)).run(
+            settings.get_templates())
+
+        self.success('Done')
+
+    def pack(self, settings):
+        """ Pack the template into a bundle.
+
+        :param settings: The facio settings
+        :type settings: facio.config.Settings
+        """
+
+        template = self.get_template(settings)
+        vcs = template.prepare(working_tree=True)
+        try:
+            Pack(template).run(settings.get_bundle_path())
+        finally:
+            if vcs is not None:
+                vcs.cleanup(origin=template.origin, destination=None)
+
+        self.success('Done')
+
+    def index(self, settings):
+        """ Rebuild the index of a template directory.
+
+        :param settings: The facio settings
+        :type settings: facio.config.Settings
+        """
+
+        template = self.get_template(settings)
+        if not os.path.isdir(template.origin):
+            raise FacioException('Only template directories can be indexed')
+
+        path = os.path.join(template.origin, INDEX_FILE_NAME)
+        index = TemplateIndex(path)
+        try:
+            index.build(template)
+            index.save()
+        except (IOError, OSError):
+            raise FacioException('Failed to index {0}'.format(
+                template.origin))
+
+        self.out('Indexed {0} files in {1}'.format(
+            len([e for e in index.entries if not e.get('dir')]), path))
+        self.success('Done')
+
+    def batch(self, settings):
+        """ Generate a project for every record of the batch records, the
+        template is prepared, its hooks loaded and its files compiled once.
+
+        :param settings: The facio settings
+        :type settings: facio.config.Settings
+        """
+
+        state.update_context_variables(settings.get_variables())
+
+        template = self.get_template(settings)
+        # --jobs sets the number of projects generated at once
+        template.jobs = 1
+        batch = Batch(template, None, jobs=settings.get_jobs())
+        records = batch.read_records(settings.get_records_path())
+
+        vcs = template.prepare(working_tree=True)
+        try:
+            batch.pipeline = self.get_hooks(template)
+            batch.run(records)
+        finally:
+            if vcs is not None:
+                vcs.cleanup(origin=template.origin, destination=None)
+
         self.success('Done')
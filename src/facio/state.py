@@ -7,11 +7,131 @@
 """
 
 import os
+import sys
+import threading
 
 from facio.base import BaseFacio
-from sh import pwd
+from os import getcwd
+from six import string_types
 from six.moves import builtins
 
+# Per thread stack of the contexts entered, see Context
+_active = threading.local()
+
+# Audit events raised as a process is spawned, see count_processes.
+# subprocess can spawn with os.posix_spawn, which is left out so those
+# processes are not counted twice
+PROCESS_EVENTS = frozenset([
+    'os.fork',
+    'os.forkpty',
+    'os.spawn',
+    'os.system',
+    'subprocess.Popen',
+])
+
+# Holds True once spawned processes are being counted, see count_processes
+_counting = []
+
+# Hook call statuses
+HOOK_SUCCEEDED = 'succeeded'
+HOOK_FAILED = 'failed'
+
+
+def get_active_contexts():
+    """ Returns the stack of contexts entered in the calling thread.
+
+    :returns: list
+    """
+
+    try:
+        return _active.contexts
+    except AttributeError:
+        _active.contexts = []
+        return _active.contexts
+
+
+def get_context():
+    """ Returns the context most recently entered in the calling thread,
+    else None.
+
+    :returns: facio.state.Context or None
+    """
+
+    contexts = get_active_contexts()
+    return contexts[-1] if contexts else None
+
+
+class HookCalls(object):
+    """ Registry of the hook modules called in a run, keyed by module path so
+    hooks can look up each other's calls in constant time. Each call records
+    its module path, the order it was called in, its status, how long it took
+    and its result. Iterating the registry yields the calls in order. """
+
+    def __init__(self):
+        self.calls = {}
+        self.order = []
+
+    def add(self, path, result, status=None, seconds=None):
+        """ Record a call, a module's first call is kept.
+
+        :param path: The python dotted path to the module
+        :type path: str
+
+        :param result: The result of the module run() function
+        :type result: Anything
+
+        ** Optional Key Word Arguments **
+
+        :param status: How the call went
+        :type status: str -- default HOOK_SUCCEEDED
+
+        :param seconds: How long the call took
+        :type seconds: float -- default None
+
+        :returns: dict -- The recorded call
+        """
+
+        call = self.calls.get(path)
+        if call is None:
+            call = {
+                'path': path,
+                'order': len(self.order),
+                'status': status or HOOK_SUCCEEDED,
+                'seconds': seconds,
+                'result': result,
+            }
+            self.calls[path] = call
+            self.order.append(call)
+        return call
+
+    def get(self, path):
+        """ Returns the call of a module, None if it has not been called.
+
+        :param path: The python dotted path to the module
+        :type path: str
+
+        :returns: dict or None
+        """
+
+        return self.calls.get(path)
+
+    def items(self):
+        """ Returns the (module path, result) of every call in order.
+
+        :returns: list
+        """
+
+        return [(call['path'], call['result']) for call in self.order]
+
+    def __contains__(self, path):
+        return path in self.calls
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def __len__(self):
+        return len(self.order)
+
 
 class State(BaseFacio):
 
@@ -20,7 +140,8 @@ class State(BaseFacio):
         this class is instantiated but only if not already set.
 
         This class is basically a proxy class for interfacing with __facio__
-        super global variable. All state is set and retrieved from __facio__.
+        super global variable. All state is set and retrieved from __facio__,
+        or from the ``Context`` entered in the calling thread.
         """
 
         try:
@@ -29,6 +150,18 @@ class State(BaseFacio):
             builtins.__facio__ = self
             self.state = builtins.__facio__
 
+    def get_store(self):
+        """ Returns the object state is kept on, the context entered in the
+        calling thread, else the __facio__ super global.
+
+        :returns: object
+        """
+
+        context = get_context()
+        if context is not None:
+            return context
+        return self.state
+
     def set_project_name(self, name):
         """ Set the project name to the state.
 
@@ -37,7 +170,9 @@ class State(BaseFacio):
         """
 
         self.update_context_variables({'PROJECT_NAME': name})
-        self.state.project_name = name
+        store = self.get_store()
+        store.project_name = name
+        store.project_root = None
 
     def get_project_name(self):
         """ Return the project name stored in the state.
@@ -45,26 +180,49 @@ class State(BaseFacio):
         :returns: str
         """
 
-        return self.state.project_name
+        return self.get_store().project_name
+
+    def set_working_directory(self, path):
+        """ Set the directory projects are generated in, instead of the
+        current working directory.
+
+        :param path: The directory, None for the current working directory
+        :type path: str
+        """
+
+        store = self.get_store()
+        store.working_directory = path
+        store.project_root = None
 
     def get_working_directory(self):
-        """ Use the ``sh`` library to return the current working directory
-        using the unix command ``pwd``.
+        """ Returns the directory set by ``set_working_directory``, else the
+        current working directory, which is kept so it is only looked up once
+        a run.
 
         :returns: str
         """
 
-        return '{0}'.format(pwd()).strip()
+        store = self.get_store()
+        path = getattr(store, 'working_directory', None)
+        if not isinstance(path, string_types):
+            path = getcwd()
+            store.working_directory = path
+        return path
 
     def get_project_root(self):
         """ Return the project root, which is the current working directory
-        plus the project name.
+        plus the project name, kept until either changes.
 
         :returns: str
         """
 
-        return os.path.join(self.get_working_directory(),
-                            self.get_project_name())
+        store = self.get_store()
+        path = getattr(store, 'project_root', None)
+        if not isinstance(path, string_types):
+            path = os.path.join(self.get_working_directory(),
+                                self.get_project_name())
+            store.project_root = path
+        return path
 
     def update_context_variables(self, dictionary):
         """ Update the context varaibles dict with new values.
@@ -84,16 +242,17 @@ class State(BaseFacio):
         :type dictionary: dict
         """
 
+        store = self.get_store()
         try:
-            dict1 = self.state.context_variables
+            dict1 = store.context_variables
         except AttributeError:
-            self.state.context_variables = {}
-            dict1 = self.state.context_variables
+            store.context_variables = {}
+            dict1 = store.context_variables
         dict2 = dictionary
 
         if isinstance(dict1, dict) and isinstance(dict2, dict):
             dict1.update(dict2)
-            self.state.context_variables = dict1
+            store.context_variables = dict1
         else:
             self.warning('Failed to update context variables with {0}'.format(
                 dict2))
@@ -105,7 +264,7 @@ class State(BaseFacio):
         """
 
         try:
-            return self.state.context_variables
+            return self.get_store().context_variables
         except AttributeError:
             return {}
 
@@ -121,9 +280,57 @@ class State(BaseFacio):
         variables = self.get_context_variables()
         return variables.get(name, None)
 
+    def reset(self, variables=None):
+        """ Forget the project name, working directory, context variables,
+        hook calls and spawned processes, so another project can be generated
+        by the same process.
+
+        ** Optional Key Word Arguments **
+
+        :param variables: Context variables to start the next project with
+        :type variables: dict -- default None
+        """
+
+        store = self.get_store()
+        store.project_name = None
+        store.working_directory = None
+        store.project_root = None
+        store.context_variables = dict(variables or {})
+        store.hook_calls = HookCalls()
+        store.processes = 0
+
+    def add_process(self):
+        """ Count a process spawned by the run, see ``count_processes``. """
+
+        store = self.get_store()
+        store.processes = self.get_process_count() + 1
+
+    def get_process_count(self):
+        """ Returns the number of processes the run has spawned since
+        ``count_processes`` was called, a debugging aid.
+
+        :returns: int
+        """
+
+        processes = getattr(self.get_store(), 'processes', 0)
+        return processes if isinstance(processes, int) else 0
+
+    def get_hook_calls(self):
+        """ Returns the registry of the hook modules called in the run.
+
+        :returns: facio.state.HookCalls
+        """
+
+        store = self.get_store()
+        calls = getattr(store, 'hook_calls', None)
+        if not isinstance(calls, HookCalls):
+            calls = HookCalls()
+            store.hook_calls = calls
+        return calls
+
     def get_hook_call(self, module_path):
-        """ Returns a hook call result, else returns false if the module
-        path is not in the hook call list.
+        """ Returns a hook call result, else returns None if the module
+        path has not been called.
 
         :param module_path: The python dotted path to the module
         :type module_path: str
@@ -131,20 +338,13 @@ class State(BaseFacio):
         :returns: Call result
         """
 
-        try:
-            calls = self.state.hook_calls
-        except AttributeError:
-            calls = []
-
-        try:
-            module, result = [(m, r) for m, r in calls if m == module_path][0]
-        except IndexError:
+        call = self.get_hook_calls().get(module_path)
+        if call is None:
             return None
+        return call['result']
 
-        return result
-
-    def save_hook_call(self, module_path, result):
-        """ Saves a hook call to state
+    def save_hook_call(self, module_path, result, status=None, seconds=None):
+        """ Saves a hook call to state, a module's first call is kept.
 
         :param module_path: The python dotted path to the module
         :type module_path: str
@@ -152,19 +352,94 @@ class State(BaseFacio):
         :param result: The result of the module run() function
         :type result: Anything
 
-        :returns: list -- The call list or tuples
-        """
+        ** Optional Key Word Arguments **
 
-        try:
-            calls = self.state.hook_calls
-        except AttributeError:
-            calls = []
+        :param status: How the call went, ``HOOK_SUCCEEDED`` or
+                       ``HOOK_FAILED``
+        :type status: str -- default HOOK_SUCCEEDED
+
+        :param seconds: How long the call took
+        :type seconds: float -- default None
 
-        if not self.get_hook_call(module_path):
-            calls.append((module_path, result))
-            self.state.hook_calls = calls
+        :returns: facio.state.HookCalls -- The call registry
+        """
 
+        calls = self.get_hook_calls()
+        calls.add(module_path, result, status=status, seconds=seconds)
         return calls
 
 
+class Context(State):
+    """ The state of a single run, generating one project, kept apart from
+    every other run. A context is passed to ``facio.template.Template`` and
+    ``facio.hooks.Hook``, which enter it while they run. While a context is
+    entered in a thread the process wide ``state`` reads and writes it, so
+    hooks written against ``state`` work unchanged and runs in other threads
+    never see its variables.
+
+    ** Usage: **
+
+    .. code-block:: python
+
+        from facio.state import Context
+        context = Context({'port': '8000'})
+        context.set_project_name('blog')
+        with context:
+            template.generate()
+    """
+
+    def __init__(self, variables=None):
+        """ Start a run.
+
+        ** Optional Key Word Arguments **
+
+        :param variables: Context variables to start the run with
+        :type variables: dict -- default None
+        """
+
+        self.reset(variables)
+
+    def get_store(self):
+        """ Returns the context itself, a context always keeps its own state.
+
+        :returns: facio.state.Context
+        """
+
+        return self
+
+    def __enter__(self):
+        get_active_contexts().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        get_active_contexts().pop()
+        return False
+
+
+def _audit(event, args):
+    """ Audit hook counting spawned processes against the run of the
+    spawning thread. """
+
+    if _counting and event in PROCESS_EVENTS:
+        state.add_process()
+
+
+def count_processes():
+    """ Count every process spawned from now on, by ``sh`` commands,
+    ``subprocess`` and render pool workers alike, against the context entered
+    in the spawning thread else the process wide state, see
+    ``State.get_process_count``. Counting needs the audit hooks of Python 3.8
+    and later, it can not be turned off once started.
+
+    :returns: bool -- Are processes counted
+    """
+
+    if not hasattr(sys, 'addaudithook'):
+        return False
+    if not _counting:
+        sys.addaudithook(_audit)
+        _counting.append(True)
+    return True
+
+
 state = State()
@@ -6,15 +6,27 @@
               out into the current working directory.
 """
 
-import fnmatch
+import multiprocessing
 import os
 import re
 import shutil
+import sys
+import time
 
 from codecs import open
+from multiprocessing.pool import ThreadPool
+from facio.archive import (ARCHIVE_ERRORS, ArchiveLoader, RepositoryArchive,
+                           TemplateArchive, is_archive)
 from facio.base import BaseFacio
+from facio.bundle import DIRECTORY, BundleLoader, TemplateBundle, is_bundle
+from facio.cache import BytecodeCache
 from facio.exceptions import FacioException
-from facio.state import state
+from facio.files import (IGNORE_FILE_NAME, SNIFF_SIZE, GlobMatcher,
+                         IgnoreMatcher, copy_file, get_marker_pattern,
+                         get_relative_path, has_template_markers, is_binary,
+                         is_binary_data, write_stream)
+from facio.index import INDEX_FILE_NAME, TemplateIndex
+from facio.state import get_context, state
 from facio.vcs import GitVCS, MercurialVCS
 
 try:
@@ -26,21 +38,173 @@ except ImportError:  # pragma: no cover
 # Regex for extracting context variable name from file or directory name
 get_var_name_pattern = re.compile(r'\{\{(\w+)\}\}')
 
+# Per process render state, set up once in each render pool worker
+_worker = {}
+
+# render_file outcomes
+RENDERED = 'rendered'
+BINARY = 'binary'
+UNMARKED = 'unmarked'
+FAILED = 'failed'
+
+# Files matching the render ignore globs, copied without being sniffed
+COPIED = 'copied'
+
+
+def render_file(environment, name, variables, path, new_path, buffer_size,
+                copy_strategy='auto', kind=None):
+    """ Render a single template file to new_path. Binary files and files
+    without Jinja2 markers are never passed to Jinja2, they and files which
+    fail to render are copied verbatim to new_path, and never hardlinked.
+    Output is streamed to a temporary file which replaces new_path once
+    rendering succeeds, so rendered files are always new files.
+
+    :param environment: Jinja2 environment to load the template from
+    :type environment: jinja2.Environment
+
+    :param name: The Jinja2 template name of the file
+    :type name: str
+
+    :param variables: Context variables to render with
+    :type variables: dict
+
+    :param path: Path to the template file
+    :type path: str
+
+    :param new_path: Path to write the rendered file to, can be path
+    :type new_path: str
+
+    :param buffer_size: Number of characters buffered between writes
+    :type buffer_size: int
+
+    ** Optional Key Word Arguments **
+
+    :param copy_strategy: How files which are not rendered are copied
+    :type copy_strategy: str -- default auto
+
+    :param kind: The outcome classifying the file already decided, such as
+                 from a template index, the file is then not sniffed
+    :type kind: str -- default None
+
+    :returns: tuple -- (outcome, warning message or None)
+    """
+
+    if kind in (BINARY, UNMARKED):
+        outcome = kind
+    elif kind is None and is_binary(path):
+        outcome = BINARY
+    elif kind is None and not has_template_markers(path):
+        outcome = UNMARKED
+    else:
+        temp_path = '{0}.facio.tmp'.format(new_path)
+        try:
+            template = environment.get_template(name)
+            write_stream(template.generate(variables), temp_path,
+                         buffer_size)
+        except:
+            e = sys.exc_info()[1]
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if path != new_path:
+                copy_file(path, new_path, copy_strategy)
+            return FAILED, 'Failed to render {0}: {1}'.format(new_path, e)
+
+        shutil.copymode(path, temp_path)
+        os.rename(temp_path, new_path)
+        return RENDERED, None
+
+    if path != new_path:
+        copy_file(path, new_path, copy_strategy)
+    return outcome, None
+
+
+def _init_render_worker(root, variables, settings):
+    """ Render pool initializer, gives each worker process its own warm
+    Jinja2 environment. Only plain settings are passed, see
+    ``Template.get_render_settings``, so the pool also works when workers
+    are spawned rather than forked. """
+
+    bytecode_cache = None
+    if settings['bytecode_cache'] is not None:
+        bytecode_cache = BytecodeCache(*settings['bytecode_cache'])
+    _worker['environment'] = Environment(
+        loader=FileSystemLoader(root),
+        cache_size=settings['cache_size'],
+        bytecode_cache=bytecode_cache)
+    _worker['variables'] = variables
+    _worker['buffer_size'] = settings['buffer_size']
+    _worker['copy_strategy'] = settings['copy_strategy']
+
+
+def _render_worker(task):
+    """ Render pool task, renders a (name, path, new_path, kind) tuple. """
+
+    name, path, new_path, kind = task
+    return render_file(_worker['environment'], name, _worker['variables'],
+                       path, new_path, _worker['buffer_size'],
+                       copy_strategy=_worker['copy_strategy'], kind=kind)
+
 
 class Template(BaseFacio):
 
-    COPY_ATTEMPT_LIMIT = 5
-    COPY_ATTEMPT = 1
+    # Maximum number of compiled templates held in memory by the Jinja2
+    # environment shared across a render
+    JINJA_CACHE_SIZE = 1000
+
+    # Optional jinja2.BytecodeCache persisting compiled templates
+    bytecode_cache = None
+
+    # Number of characters of rendered output buffered between writes
+    buffer_size = 64 * 1024
 
-    def __init__(self, origin):
+    # How files which are not rendered are copied, see
+    # facio.files.COPY_STRATEGIES
+    copy_strategy = 'auto'
+
+    # Number of threads copying files at once
+    copy_threads = 8
+
+    # Optional facio.cache.MirrorCache keeping local mirrors of git+ and hg+
+    # templates between runs
+    mirror_cache = None
+
+    # Lines of the template's .facioignore, read on first use
+    ignore_rules = None
+
+    # facio.archive.TemplateArchive of tar and zip templates, set by prepare
+    archive = None
+
+    # facio.bundle.TemplateBundle of templates packed by facio pack, set by
+    # prepare
+    bundle = None
+
+    # Report extra detail, such as copy throughput
+    verbose = False
+
+    # Jinja2 environment holding the compiled files of the template, set by
+    # compile and reused by every following generate
+    environment = None
+
+    def __init__(self, origin, jobs=1, context=None):
         """ Constructor for Template Class sets the project template origin.
         It also sets the default ignore globs.
 
         :param origin: The origin path to the template
         :type origin: str
+
+        ** Optional Key Word Arguments **
+
+        :param jobs: Number of processes to render files with
+        :type jobs: int -- default 1
+
+        :param context: The run to generate the project of, else the process
+                        wide ``facio.state.state``
+        :type context: facio.state.Context -- default None
         """
 
         self.origin = origin
+        self.jobs = jobs
+        self.context = context
 
         # Update copy ignore globs with standard ignore patterns
         self.update_copy_ignore_globs([
@@ -49,6 +213,8 @@ class Template(BaseFacio):
             '.svn',
             '.DS_Store',
             'Thumbs.db',
+            IGNORE_FILE_NAME,
+            INDEX_FILE_NAME,
         ])
 
         # Update render ignore globs
@@ -78,6 +244,7 @@ class Template(BaseFacio):
         :type globs: list
         """
 
+        self.copy_ignore_matcher = None
         try:
             self.copy_ignore_globs += globs
         except AttributeError:
@@ -120,6 +287,7 @@ class Template(BaseFacio):
         :type globs: list
         """
 
+        self.render_ignore_matcher = None
         try:
             self.render_ignore_globs += globs
         except AttributeError:
@@ -142,22 +310,185 @@ class Template(BaseFacio):
         except AttributeError:
             return []
 
+    def get_ignore_rules(self):
+        """ Returns the lines of the gitignore style ``.facioignore`` file at
+        the root of the template, if it has one.
+
+        :returns: list
+        """
+
+        if self.ignore_rules is None and self.archive is not None:
+            try:
+                self.ignore_rules = self.archive.read(
+                    IGNORE_FILE_NAME).decode('utf8').splitlines()
+            except KeyError:
+                self.ignore_rules = []
+        elif self.ignore_rules is None:
+            path = os.path.join(self.origin, IGNORE_FILE_NAME)
+            try:
+                with open(path, encoding='utf8') as handler:
+                    self.ignore_rules = handler.read().splitlines()
+            except (IOError, OSError):
+                self.ignore_rules = []
+        return self.ignore_rules
+
+    def get_copy_ignore_matcher(self):
+        """ Returns ``get_copy_ignore_globs`` patterns and
+        ``get_ignore_rules`` rules compiled into a matcher, which can also be
+        used as a ``shutil.copytree`` ignore callable.
+
+        :returns: facio.files.IgnoreMatcher
+        """
+
+        if getattr(self, 'copy_ignore_matcher', None) is None:
+            self.copy_ignore_matcher = IgnoreMatcher(
+                self.get_copy_ignore_globs(),
+                rules=self.get_ignore_rules(),
+                root=self.origin)
+        return self.copy_ignore_matcher
+
+    def get_render_ignore_matcher(self):
+        """ Returns ``get_render_ignore_globs`` patterns compiled into a
+        matcher.
+
+        :returns: facio.files.GlobMatcher
+        """
+
+        if getattr(self, 'render_ignore_matcher', None) is None:
+            self.render_ignore_matcher = GlobMatcher(
+                self.get_render_ignore_globs())
+        return self.render_ignore_matcher
+
     def get_render_ignore_files(self, files):
-        """ Returns a list of files to ignore for rendering based on
+        """ Returns a set of files to ignore for rendering based on
         ``get_render_ignore_globs`` patterns.
 
         :param files: List of files to check against
         :type files: list
 
-        :returns: list -- list of filenames
+        :returns: set -- set of filenames
+        """
+
+        return self.get_render_ignore_matcher().filter(files)
+
+    def is_cached(self):
+        """ Is the template origin a mirror in ``mirror_cache``, whose files
+        can be hardlinked as the mirror is never modified in place.
+
+        :returns: bool
+        """
+
+        if self.mirror_cache is None:
+            return False
+        directory = os.path.realpath(self.mirror_cache.directory)
+        return os.path.realpath(self.origin).startswith(directory + os.sep)
+
+    def copy_file(self, path, new_path):
+        """ Copy a template file which is not rendered using
+        ``copy_strategy``, only files matching the render ignore globs are
+        hardlinked.
+
+        :param path: Path to the template file
+        :type path: str
+
+        :param new_path: Path to copy the file to
+        :type new_path: str
+        """
+
+        link = (self.is_cached() and
+                self.get_render_ignore_matcher().match(
+                    os.path.basename(path)))
+        copy_file(path, new_path, self.copy_strategy, link=link)
+
+    def copy_task(self, task):
+        """ Copy pool task, copies a (path, new_path) tuple.
+
+        :returns: int -- Number of bytes copied
+        """
+
+        path, new_path = task
+        self.copy_file(path, new_path)
+        return os.path.getsize(new_path)
+
+    def copy_files(self, tasks):
+        """ Copy files which are not rendered, in a pool of ``copy_threads``
+        threads so the latency of each copy overlaps on network and overlay
+        filesystems. The throughput is reported when ``verbose`` is set.
+
+        :param tasks: List of (path, new_path) tuples to copy
+        :type tasks: list
+        """
+
+        start = time.time()
+        if self.copy_threads > 1 and len(tasks) > 1:
+            pool = ThreadPool(min(self.copy_threads, len(tasks)))
+            try:
+                sizes = pool.map(self.copy_task, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            sizes = [self.copy_task(task) for task in tasks]
+
+        if self.verbose:
+            seconds = max(time.time() - start, 0.000001)
+            megabytes = sum(sizes) / (1024.0 * 1024.0)
+            self.out('Copied {0} files, {1:.1f} MB in {2:.2f}s, {3:.0f} '
+                     'files/s, {4:.1f} MB/s'.format(len(tasks), megabytes,
+                                                   seconds,
+                                                   len(tasks) / seconds,
+                                                   megabytes / seconds))
+
+    def copy_tree(self, source, destination):
+        """ Copy a directory tree to destination, which must not exist,
+        skipping files and directories matching the copy ignore globs. The
+        directory skeleton is created first, then the files are copied by
+        ``copy_files`` and finally directory permissions and modification
+        times are copied.
+
+        :param source: The directory to copy
+        :type source: str
+
+        :param destination: The directory to copy to
+        :type destination: str
         """
 
-        ignores = []
-        for pattern in self.get_render_ignore_globs():
-            for filename in fnmatch.filter(files, pattern):
-                ignores.append(filename)
+        ignore = self.get_copy_ignore_matcher()
+        directories = []
+        tasks = []
+
+        for root, dirs, files in os.walk(source, followlinks=True):
+            directory = get_relative_path(root, source)
+            target = destination
+            if directory:
+                target = os.path.join(destination, *directory.split('/'))
+            os.mkdir(target)
+            directories.append((root, target))
+
+            # Ignored directories are pruned before os.walk descends
+            ignored = ignore.filter(directory, dirs, files)
+            dirs[:] = sorted(d for d in dirs if d not in ignored)
+            for filename in sorted(files):
+                if filename not in ignored:
+                    tasks.append((os.path.join(root, filename),
+                                  os.path.join(target, filename)))
+
+        self.copy_files(tasks)
+
+        for root, target in reversed(directories):
+            shutil.copystat(root, target)
+
+    def get_supported_vcs(self):
+        """ Returns the template origin prefixes which are cloned from
+        version control and their VCS classes.
 
-        return ignores
+        :returns: list -- list of (prefix, class) tuples
+        """
+
+        return [
+            ('git+', GitVCS),
+            ('hg+', MercurialVCS),
+        ]
 
     def copy(self, callback=None):
         """ Copy template from origin path to ``state.get_project_root()``.
@@ -169,60 +500,25 @@ class Template(BaseFacio):
         :returns: bool
         """
 
-        self.out('Copying {0} to {1}'.format(
-            self.origin,
-            state.get_project_root()))
+        project_root = state.get_project_root()
 
-        ignore = shutil.ignore_patterns(*self.get_copy_ignore_globs())
-        try:
-            shutil.copytree(self.origin, state.get_project_root(),
-                            ignore=ignore)
-        except shutil.Error:
-            raise FacioException('Failed to copy {0} to {1}'.format(
-                self.origin,
-                state.get_project_root()))
-        except OSError:
-            # If we get an OSError either the template path does not exist or
-            # the project root already exists. Check the later first and then
-            # check if the template path is git+ or hg+ and clone, finally
-            # raising exceptions
-
-            if not os.path.isdir(state.get_project_root()):
-
-                supported_vcs = [
-                    ('git+', GitVCS),
-                    ('hg+', MercurialVCS),
-                ]
-
-                for prefix, cls in supported_vcs:
-                    if self.origin.startswith(prefix):
-                        vcs = cls(self.origin)
-                        new_path = vcs.clone()
-                        if not new_path:
-                            raise FacioException(
-                                'New path to template not returned by '
-                                '{0}.clone()'.format(vcs.__class__.__name__))
-                        self.origin = new_path
-                        break
-                else:
-                    # Loop feel through so path is not prefixed with git+ or
-                    # +hg so it must be a path that does not exist
-                    raise FacioException('{0} does not exist'.format(
-                        self.origin))
-
-                # The loop broke so we can call self.copy again
-                if self.COPY_ATTEMPT <= self.COPY_ATTEMPT_LIMIT:
-                    self.COPY_ATTEMPT += 1
-                    self.copy(callback=vcs.remove_tmp_dir)
-                else:
-                    raise FacioException('Failed to copy template after '
-                                         '{0} attempts'.format(
-                                             self.COPY_ATTEMPT))
+        self.out('Copying {0} to {1}'.format(self.origin, project_root))
 
-            else:
-                # project root exists, raise exception
-                raise FacioException('{0} already exists'.format(
-                    state.get_project_root()))
+        if os.path.isdir(project_root):
+            raise FacioException('{0} already exists'.format(project_root))
+
+        vcs = self.get_vcs()
+        if vcs is not None:
+            self.export(vcs, project_root)
+        elif not os.path.isdir(self.origin):
+            raise FacioException('{0} does not exist'.format(self.origin))
+        else:
+            try:
+                self.copy_tree(self.origin, project_root)
+            except (IOError, OSError, shutil.Error):
+                raise FacioException('Failed to copy {0} to {1}'.format(
+                    self.origin,
+                    project_root))
 
         # Call callback if callable
         if callable(callback):
@@ -232,72 +528,836 @@ class Template(BaseFacio):
 
         return True
 
-    def rename_direcories(self):
-        """ Renames directories that are named after context variables, for
-        example: ``{{PROJECT_NAME}}``.
+    def get_vcs(self):
+        """ Returns a VCS instance for ``git+`` and ``hg+`` origins.
+
+        :returns: facio.vcs.BaseVCS or None
+        """
+
+        for prefix, cls in self.get_supported_vcs():
+            if self.origin.startswith(prefix):
+                vcs = cls(self.origin)
+                vcs.mirror_cache = self.mirror_cache
+                return vcs
+
+        return None
+
+    def checkout(self, vcs, working_tree=True):
+        """ Check out the template from a VCS, from ``mirror_cache`` if set,
+        else by cloning into a temporary directory.
+
+        :param vcs: The VCS instance for the template origin
+        :type vcs: facio.vcs.BaseVCS
+
+        ** Optional Key Word Arguments **
+
+        :param working_tree: Check out the template files
+        :type working_tree: bool -- default True
+
+        :returns: str -- Path to the local copy of the template
+        """
+
+        new_path = vcs.checkout(working_tree=working_tree)
+        if not new_path:
+            raise FacioException(
+                'New path to template not returned by '
+                '{0}.clone()'.format(vcs.__class__.__name__))
+        return new_path
+
+    def export(self, vcs, destination):
+        """ Stream the template files from a VCS straight into destination,
+        skipping files matching the copy ignore globs, and release the local
+        copy of the repository.
+
+        :param vcs: The VCS instance for the template origin
+        :type vcs: facio.vcs.BaseVCS
+
+        :param destination: Directory to export the template to
+        :type destination: str
+        """
+
+        self.checkout(vcs, working_tree=False)
+        try:
+            self.ignore_rules = (vcs.read_file(IGNORE_FILE_NAME) or
+                                 '').splitlines()
+            self.copy_ignore_matcher = None
+            vcs.export(destination, ignore=self.get_copy_ignore_matcher())
+        finally:
+            vcs.cleanup(vcs.directory, destination)
+
+    def prepare(self, working_tree=False):
+        """ Open the template origin for generating, ``git+`` and ``hg+``
+        origins are checked out from ``mirror_cache`` if set, else cloned
+        into a temporary directory. Their files are streamed straight from
+        the repository by ``generate`` unless a working tree is asked for, in
+        which case the origin becomes the checked out template directory.
+
+        ** Optional Key Word Arguments **
+
+        :param working_tree: Check out the files of ``git+`` and ``hg+``
+                             templates, for commands which need a template
+                             directory
+        :type working_tree: bool -- default False
+
+        :returns: The VCS instance the origin was checked out with or None
+        """
+
+        if os.path.isdir(self.origin):
+            return None
+
+        if is_bundle(self.origin):
+            try:
+                self.bundle = TemplateBundle(self.origin)
+            except (IOError, OSError, ValueError):
+                raise FacioException('Failed to read {0}'.format(
+                    self.origin))
+            if not self.bundle.compiled:
+                self.warning('{0} was packed by another version of Python or '
+                             'Jinja2, its files are compiled as they are '
+                             'rendered'.format(self.origin))
+            return None
+
+        if is_archive(self.origin):
+            try:
+                self.archive = TemplateArchive(self.origin)
+            except (IOError, OSError) + ARCHIVE_ERRORS:
+                raise FacioException('Failed to read {0}'.format(
+                    self.origin))
+            self.ignore_rules = None
+            self.copy_ignore_matcher = None
+            return None
+
+        vcs = self.get_vcs()
+        if vcs is None:
+            raise FacioException('{0} does not exist'.format(self.origin))
+
+        if working_tree:
+            self.origin = self.checkout(vcs)
+        else:
+            self.checkout(vcs, working_tree=False)
+            self.archive = RepositoryArchive(vcs)
+        self.ignore_rules = None
+        self.copy_ignore_matcher = None
+        return vcs
+
+    def get_renamed(self, name):
+        """ Returns the name of a file or directory once every context
+        variable in it, for example ``{{PROJECT_NAME}}``, has been substituted.
+        Unknown variables are left as they are.
+
+        :param name: The file or directory name
+        :type name: str
+
+        :returns: str
+        """
+
+        if '{{' not in name:
+            return name
+
+        def substitute(match):
+            return state.get_context_variable(match.group(1)) or \
+                match.group(0)
+
+        return get_var_name_pattern.sub(substitute, name)
+
+    def get_renames(self, root, names):
+        """ Returns the new names of the files and directories in root,
+        checking that no two of them end up with the same name.
+
+        :param root: The directory the names are in
+        :type root: str
+
+        :param names: List of file and directory names in root
+        :type names: list
+
+        :returns: dict -- Mapping of each name to its new name
+        """
+
+        renames = {}
+        taken = {}
+        for name in names:
+            new_name = self.get_renamed(name)
+            if os.sep in new_name or new_name in ('', '.', '..'):
+                raise FacioException('Cannot rename {0} to {1}'.format(
+                    os.path.join(root, name), new_name))
+            if new_name in taken:
+                raise FacioException(
+                    'Renaming {0} to {1} collides with {2}'.format(
+                        os.path.join(root, name),
+                        os.path.join(root, new_name),
+                        os.path.join(root, taken[new_name])))
+            taken[new_name] = name
+            renames[name] = new_name
+        return renames
+
+    def generate(self, callback=None):
+        """ Copy, rename and render the template to
+        ``state.get_project_root()`` in a single pass over the origin, each
+        file is read once and written straight to its final path.
+
+        :param callback: A callback function to be called after
+                         generation is complete
+        :type callback: function -- default None
+
+        :returns: bool
+        """
+
+        # The run's context is entered for the whole generation
+        if self.context is not None and get_context() is not self.context:
+            with self.context:
+                return self.generate(callback=callback)
+
+        destination = state.get_project_root()
+        if os.path.exists(destination):
+            raise FacioException('{0} already exists'.format(destination))
+
+        self.out('Generating {0} from {1}'.format(destination, self.origin))
+
+        try:
+            if self.bundle is not None:
+                self.generate_bundle(destination)
+            elif self.archive is not None:
+                self.generate_archive(destination)
+            else:
+                index = self.get_index()
+                if index is not None:
+                    self.generate_index(destination, index)
+                else:
+                    self.generate_directory(destination)
+        except (IOError, OSError, shutil.Error) + ARCHIVE_ERRORS:
+            raise FacioException('Failed to generate {0} from {1}'.format(
+                destination, self.origin))
+
+        if callable(callback):
+            callback(origin=self.origin, destination=destination)
+
+        return True
+
+    def generate_directory(self, destination):
+        """ Generate the project from a template directory, walking it once.
+        Files are classified as they are found, every file which is not
+        rendered is copied by ``copy_files`` and the rest are rendered by
+        ``render_files``. Directory permissions and modification times are
+        copied once their files have been written.
+
+        :param destination: The project root
+        :type destination: str
+        """
+
+        ignore = self.get_copy_ignore_matcher()
+        directories = {self.origin: destination}
+        created = []
+        copies = []
+        tasks = []
+        counts = dict((outcome, 0) for outcome in (BINARY, UNMARKED))
+
+        for root, dirs, files in os.walk(self.origin, followlinks=True):
+            target = directories.pop(root)
+            os.mkdir(target)
+            created.append((root, target))
+
+            # Ignored directories are pruned before os.walk descends
+            ignored = ignore.filter(get_relative_path(root, self.origin),
+                                    dirs, files)
+            dirs[:] = sorted(d for d in dirs if d not in ignored)
+            files = sorted(f for f in files if f not in ignored)
+            renames = self.get_renames(target, dirs + files)
+
+            for directory in dirs:
+                directories[os.path.join(root, directory)] = os.path.join(
+                    target, renames[directory])
+
+            for filename in files:
+                path = os.path.join(root, filename)
+                new_path = os.path.join(target, renames[filename])
+                kind = self.classify(path)
+                if kind == RENDERED:
+                    tasks.append((path, new_path, kind))
+                else:
+                    copies.append((path, new_path))
+                    if kind in counts:
+                        counts[kind] += 1
+
+        self.copy_files(copies)
+        self.render_files(self.origin, tasks, counts=counts)
+
+        for root, target in reversed(created):
+            shutil.copystat(root, target)
+
+    def get_index(self):
+        """ Returns the ``.facio.index`` of the template directory, None if
+        it has none or it no longer describes the template.
+
+        :returns: facio.index.TemplateIndex or None
+        """
+
+        path = os.path.join(self.origin, INDEX_FILE_NAME)
+        if not os.path.isfile(path):
+            return None
+
+        index = TemplateIndex(path)
+        try:
+            index.load()
+            valid = index.is_valid(self)
+        except (IOError, OSError, ValueError):
+            valid = False
+        if not valid:
+            self.warning('{0} is out of date, run facio index to rebuild '
+                         'it'.format(path))
+            return None
+        return index
+
+    def generate_index(self, destination, index):
+        """ Generate the project from a template directory using its
+        ``.facio.index``, every file was classified when the index was built
+        so the template is neither walked nor sniffed.
+
+        :param destination: The project root
+        :type destination: str
+
+        :param index: The template index
+        :type index: facio.index.TemplateIndex
+        """
+
+        targets = {'': destination}
+        taken = {}
+        copies = []
+        tasks = []
+        counts = dict((outcome, 0) for outcome in (BINARY, UNMARKED))
+
+        os.mkdir(destination)
+        for entry in index.entries:
+            name = entry['name']
+            if entry.get('dir'):
+                if name:
+                    self.get_archive_target(name, targets, taken)
+                continue
+
+            parent, _, basename = name.rpartition('/')
+            new_path = self.get_archive_path(
+                name, self.get_archive_target(parent, targets, taken),
+                basename, taken, rename=entry['rename'])
+            path = index.get_path(name)
+            if entry['kind'] == RENDERED:
+                tasks.append((path, new_path, entry['kind']))
+            else:
+                copies.append((path, new_path))
+                if entry['kind'] in counts:
+                    counts[entry['kind']] += 1
+
+        self.copy_files(copies)
+        self.render_files(self.origin, tasks, counts=counts)
+
+        # Deepest directories first, the project root last
+        for name in sorted(targets, reverse=True):
+            shutil.copystat(index.get_path(name), targets[name])
+
+    def get_archive_target(self, name, targets, taken):
+        """ Returns the renamed path of a directory of an archive template
+        in the project, creating it and its parents if needed.
+
+        :param name: ``/`` separated path of the directory in the template
+        :type name: str
+
+        :param targets: Mapping of directories to their path in the project
+        :type targets: dict
+
+        :param taken: Mapping of project paths to the template path renamed
+                      to them, to detect collisions
+        :type taken: dict
+
+        :returns: str
+        """
+
+        if name not in targets:
+            parent, _, basename = name.rpartition('/')
+            target = self.get_archive_path(
+                name, self.get_archive_target(parent, targets, taken),
+                basename, taken)
+            if not os.path.isdir(target):
+                os.mkdir(target)
+            targets[name] = target
+        return targets[name]
+
+    def get_archive_path(self, name, target, basename, taken, rename=True):
+        """ Returns the path in the project of an archive template member,
+        checking it does not collide with another member.
+
+        ** Optional Key Word Arguments **
+
+        :param rename: Substitute context variables in basename
+        :type rename: bool -- default True
+
+        :returns: str
+        """
+
+        if rename:
+            basename = self.get_renames(target, [basename])[basename]
+        new_path = os.path.join(target, basename)
+        if taken.setdefault(new_path, name) != name:
+            raise FacioException(
+                'Renaming {0} to {1} collides with {2}'.format(
+                    name, new_path, taken[new_path]))
+        return new_path
+
+    def generate_archive(self, destination):
+        """ Generate the project from an archive template, reading each
+        member once and copying or rendering it straight to its path in the
+        project without extracting the archive. Members are classified the
+        same way as files of a template directory and symbolic links are
+        recreated. Each generation reads the archive through its own handle,
+        so projects can be generated from one template in several threads at
+        once.
+
+        :param destination: The project root
+        :type destination: str
+        """
+
+        archive = self.archive.reader()
+        try:
+            self.generate_members(archive, destination)
+        finally:
+            if archive is not self.archive:
+                archive.close()
+
+    def generate_members(self, archive, destination):
+        """ Generate the project from the members of an archive template
+        read through archive, see ``generate_archive``.
+
+        :param archive: The archive reader
+        :type archive: facio.archive.TemplateArchive or
+                       facio.archive.RepositoryArchive
+
+        :param destination: The project root
+        :type destination: str
+        """
+
+        ignore = self.get_copy_ignore_matcher()
+        render_ignore = self.get_render_ignore_matcher()
+        loader = ArchiveLoader(archive)
+        environment = self.get_environment(None, loader=loader)
+        variables = state.get_context_variables()
+        counts = dict((outcome, 0) for outcome in (RENDERED, BINARY,
+                                                   UNMARKED, FAILED))
+        targets = {'': destination}
+        taken = {}
+
+        os.mkdir(destination)
+        for name, is_dir, mode, mtime, member in archive.members:
+            if ignore.excludes(name, is_dir):
+                continue
+            if is_dir:
+                self.get_archive_target(name, targets, taken)
+                continue
+
+            parent, _, basename = name.rpartition('/')
+            new_path = self.get_archive_path(
+                name, self.get_archive_target(parent, targets, taken),
+                basename, taken)
+
+            link = archive.get_link(member)
+            if link is not None:
+                os.symlink(link, new_path)
+                continue
+
+            handler = archive.open(member)
+            try:
+                head = handler.read(SNIFF_SIZE)
+                ignored = render_ignore.match(basename)
+                if ignored or is_binary_data(head):
+                    outcome = None if ignored else BINARY
+                    with open(new_path, 'wb') as output:
+                        output.write(head)
+                        shutil.copyfileobj(handler, output)
+                else:
+                    data = head + handler.read()
+                    outcome = self.render_member(environment, loader, name,
+                                                 data, new_path, variables)
+            finally:
+                handler.close()
+
+            os.chmod(new_path, mode)
+            if outcome in (None, BINARY, UNMARKED):
+                os.utime(new_path, (mtime, mtime))
+            if outcome is not None:
+                counts[outcome] += 1
+
+        self.out('Rendered {0} files, skipped {1} without template markers '
+                 'and {2} binary files'.format(counts[RENDERED],
+                                               counts[UNMARKED],
+                                               counts[BINARY]))
+
+    def render_member(self, environment, loader, name, data, new_path,
+                      variables):
+        """ Render the contents of an archive template member to new_path,
+        members without Jinja2 markers, or which fail to render, are written
+        verbatim.
+
+        :returns: str -- The render outcome
+        """
+
+        if not get_marker_pattern.search(data):
+            with open(new_path, 'wb') as output:
+                output.write(data)
+            return UNMARKED
+
+        temp_path = '{0}.facio.tmp'.format(new_path)
+        try:
+            loader.sources[name] = data.decode('utf8')
+            template = environment.get_template(name)
+            write_stream(template.generate(variables), temp_path,
+                         self.buffer_size)
+        except:
+            e = sys.exc_info()[1]
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            with open(new_path, 'wb') as output:
+                output.write(data)
+            self.warning('Failed to render {0}: {1}'.format(new_path, e))
+            return FAILED
+        finally:
+            loader.sources.pop(name, None)
+
+        os.rename(temp_path, new_path)
+        return RENDERED
+
+    def generate_bundle(self, destination):
+        """ Generate the project from a bundle written by ``facio pack``.
+        Every file was classified and compiled when the template was packed,
+        so nothing is walked, sniffed or compiled, files are copied from or
+        rendered with the code in the bundle straight to their path in the
+        project.
+
+        :param destination: The project root
+        :type destination: str
+        """
+
+        environment = self.environment or self.get_environment(
+            None, loader=BundleLoader(self.bundle))
+        variables = state.get_context_variables()
+        counts = dict((outcome, 0) for outcome in (RENDERED, BINARY,
+                                                   UNMARKED, FAILED))
+        targets = {'': destination}
+        taken = {}
+
+        os.mkdir(destination)
+        for entry in self.bundle.entries:
+            name = entry['name']
+            if entry['kind'] == DIRECTORY:
+                self.get_archive_target(name, targets, taken)
+                continue
+
+            parent, _, basename = name.rpartition('/')
+            new_path = self.get_archive_path(
+                name, self.get_archive_target(parent, targets, taken),
+                basename, taken, rename=entry['rename'])
+
+            if entry['kind'] == RENDERED:
+                outcome = self.render_entry(environment, entry, new_path,
+                                            variables)
+            else:
+                outcome = entry['kind']
+                with open(new_path, 'wb') as output:
+                    output.write(self.bundle.read_entry(entry))
+
+            os.chmod(new_path, entry['mode'])
+            if outcome in (COPIED, BINARY, UNMARKED):
+                os.utime(new_path, (entry['mtime'], entry['mtime']))
+            if outcome in counts:
+                counts[outcome] += 1
+
+        self.out('Rendered {0} files, skipped {1} without template markers '
+                 'and {2} binary files'.format(counts[RENDERED],
+                                               counts[UNMARKED],
+                                               counts[BINARY]))
+
+    def render_entry(self, environment, entry, new_path, variables):
+        """ Render a bundle entry to new_path, entries which fail to render
+        are written verbatim.
+
+        :returns: str -- The render outcome
+        """
+
+        temp_path = '{0}.facio.tmp'.format(new_path)
+        try:
+            template = environment.get_template(entry['name'])
+            write_stream(template.generate(variables), temp_path,
+                         self.buffer_size)
+        except:
+            e = sys.exc_info()[1]
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            with open(new_path, 'wb') as output:
+                output.write(self.bundle.read_entry(entry))
+            self.warning('Failed to render {0}: {1}'.format(new_path, e))
+            return FAILED
+
+        os.rename(temp_path, new_path)
+        return RENDERED
+
+    def walk(self):
+        """ Yields every directory and file of the template directory not
+        matching the copy ignore globs, in sorted order with each directory
+        before its contents. Ignored directories are never descended into.
+
+        :returns: generator -- (name, path, is_dir) tuples, name is the ``/``
+                  separated path relative to the template root
+        """
 
-        :returns: generator
+        ignore = self.get_copy_ignore_matcher()
+        for root, dirs, files in os.walk(self.origin, followlinks=True):
+            directory = get_relative_path(root, self.origin)
+            prefix = directory + '/' if directory else ''
+
+            ignored = ignore.filter(directory, dirs, files)
+            dirs[:] = sorted(d for d in dirs if d not in ignored)
+            for name in dirs:
+                yield prefix + name, os.path.join(root, name), True
+            for name in sorted(f for f in files if f not in ignored):
+                yield prefix + name, os.path.join(root, name), False
+
+    def classify(self, path):
+        """ Returns how a template file is generated, the same way
+        ``generate`` decides, ``COPIED`` for files matching the render
+        ignore globs, ``BINARY``, ``UNMARKED`` for files without Jinja2
+        markers or ``RENDERED``.
+
+        :param path: Path to the template file
+        :type path: str
+
+        :returns: str
         """
 
-        for root, dirs, files in os.walk(state.get_project_root()):
-            for directory in fnmatch.filter(dirs, '*{{*}}*'):
-                var_name = get_var_name_pattern.findall(directory)[0]
-                var_value = state.get_context_variable(var_name)
-                if var_value:
-                    old_path = os.path.join(root, directory)
-                    new_path = os.path.join(root, var_value)
-                    shutil.move(old_path, new_path)
-                    yield (old_path, new_path)
+        if self.get_render_ignore_matcher().match(os.path.basename(path)):
+            return COPIED
+        if is_binary(path):
+            return BINARY
+        if not has_template_markers(path):
+            return UNMARKED
+        return RENDERED
+
+    def get_rename_plan(self, root):
+        """ Works out every file and directory under root to be renamed in a
+        single walk, substituting all context variables in each name. Moves
+        are ordered bottom up, deepest paths first, so every move is made
+        inside a directory which has not been renamed yet.
 
-    def rename_files(self):
-        """ Rename files that are named after context variables, for example:
-        ``{{PROJECT_NAME}}.py``
+        :param root: The directory to plan renames in
+        :type root: str
 
-        :returns: generator
+        :returns: list -- list of (old_path, new_path) tuples
         """
 
-        for root, dirs, files in os.walk(state.get_project_root()):
-            for filename in fnmatch.filter(files, '*{{*}}*'):
-                var_name = get_var_name_pattern.findall(filename)[0]
-                var_value = state.get_context_variable(var_name)
-                if var_value:
-                    name, ext = os.path.splitext(filename)
-                    old_path = os.path.join(root, filename)
-                    new_path = os.path.join(root, '{0}{1}'.format(
-                        var_value, ext))
-                    shutil.move(old_path, new_path)
-                    yield (old_path, new_path)
+        moves = []
+        for current, dirs, files in os.walk(root):
+            renames = self.get_renames(current, dirs + files)
+            for name in dirs + files:
+                if renames[name] != name:
+                    moves.append((os.path.join(current, name),
+                                  os.path.join(current, renames[name])))
+
+        for old, new in moves:
+            if os.path.lexists(new):
+                raise FacioException('Renaming {0} to {1} would overwrite '
+                                     'an existing file'.format(old, new))
+
+        moves.sort(key=lambda move: move[0].count(os.sep), reverse=True)
+        return moves
 
     def rename(self):
-        """ Runs the two rename files and rename directories methods. """
+        """ Rename files and directories in the project root named after
+        context variables, for example ``{{PROJECT_NAME}}.py``. """
 
-        for old, new in self.rename_direcories():
+        for old, new in self.get_rename_plan(state.get_project_root()):
             self.out('Renaming {0} to {1}'.format(old, new))
+            os.rename(old, new)
 
-        for old, new in self.rename_files():
-            self.out('Renaming {0} to {1}'.format(old, new))
+    def get_environment(self, path, loader=None, cache_size=None):
+        """ Returns a Jinja2 environment whose loader is rooted at path. A
+        single environment is shared for a whole render so compiled templates
+        are cached in memory and ``{% include %}`` / ``{% extends %}`` work
+        across directories.
+
+        :param path: The root directory of the templates
+        :type path: str
+
+        ** Optional Key Word Arguments **
+
+        :param loader: Jinja2 loader to use instead of loading from path
+        :type loader: jinja2.BaseLoader -- default None
+
+        :param cache_size: Number of compiled templates held in memory, -1
+                           holds every template
+        :type cache_size: int -- default JINJA_CACHE_SIZE
+
+        :returns: jinja2.Environment
+        """
+
+        if cache_size is None:
+            cache_size = self.JINJA_CACHE_SIZE
+        return Environment(loader=loader or FileSystemLoader(path),
+                           cache_size=cache_size,
+                           bytecode_cache=self.bytecode_cache)
+
+    def get_render_environment(self, root):
+        """ Returns the Jinja2 environment to render the files under root
+        with, the environment set by ``compile`` if root is the template
+        origin.
+
+        :param root: The directory the Jinja2 loader is rooted at
+        :type root: str
+
+        :returns: jinja2.Environment
+        """
+
+        if self.environment is not None and root == self.origin:
+            return self.environment
+        return self.get_environment(root)
+
+    def get_template_environment(self):
+        """ Returns an empty Jinja2 environment holding every file of the
+        prepared template once it is compiled, which is kept in memory, see
+        ``compile``. Archive members are compiled as they are read, so
+        archives have none.
+
+        :returns: jinja2.Environment or None
+        """
+
+        if self.archive is not None:
+            return None
+        if self.bundle is not None:
+            return self.get_environment(
+                None, loader=BundleLoader(self.bundle), cache_size=-1)
+        return self.get_environment(self.origin, cache_size=-1)
+
+    def compile(self):
+        """ Compile every file of the prepared template which is rendered
+        into ``environment``, so generating many projects from the template
+        compiles each file once. Files which fail to compile are reported
+        when they are rendered. Archive members are compiled as they are
+        read. """
+
+        environment = self.get_template_environment()
+        if environment is None:
+            return
+
+        if self.bundle is not None:
+            names = [entry['name'] for entry in self.bundle.entries
+                     if entry['kind'] == RENDERED]
+        else:
+            names = [name for name, path, is_dir in self.walk()
+                     if not is_dir and self.classify(path) == RENDERED]
+
+        for name in names:
+            try:
+                environment.get_template(name)
+            except:
+                pass
+
+        self.environment = environment
+
+    def get_template_name(self, root, path):
+        """ Returns the Jinja2 template name of a file, which is its path
+        relative to root using forward slashes.
+
+        :param root: The directory the Jinja2 loader is rooted at
+        :type root: str
+
+        :param path: Path to the file
+        :type path: str
+
+        :returns: str
+        """
+
+        return '/'.join(os.path.relpath(path, root).split(os.sep))
+
+    def get_render_settings(self):
+        """ Returns the settings render pool workers are started with, plain
+        values which can be pickled. Only a ``facio.cache.BytecodeCache`` is
+        passed on, as its directory and size.
+
+        :returns: dict
+        """
+
+        bytecode_cache = None
+        if isinstance(self.bytecode_cache, BytecodeCache):
+            bytecode_cache = (self.bytecode_cache.directory,
+                              self.bytecode_cache.max_size)
+        return {
+            'bytecode_cache': bytecode_cache,
+            'cache_size': self.JINJA_CACHE_SIZE,
+            'buffer_size': self.buffer_size,
+            'copy_strategy': self.copy_strategy,
+        }
+
+    def render_files(self, root, tasks, counts=None):
+        """ Render files with Jinja2, in a pool of ``jobs`` processes if
+        more than one job is set. Warnings are reported in task order followed
+        by a summary of the files rendered and skipped.
+
+        :param root: The directory the Jinja2 loader is rooted at
+        :type root: str
+
+        :param tasks: List of (path, new_path) tuples to render, or of
+                      (path, new_path, kind) tuples if they have already
+                      been classified
+        :type tasks: list
+
+        ** Optional Key Word Arguments **
+
+        :param counts: Number of files of each outcome already copied
+                       without rendering, added to the summary
+        :type counts: dict -- default None
+        """
+
+        variables = state.get_context_variables()
+        tasks = [(self.get_template_name(root, task[0]), task[0], task[1],
+                  task[2] if len(task) > 2 else None) for task in tasks]
+
+        if self.jobs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(
+                processes=self.jobs,
+                initializer=_init_render_worker,
+                initargs=(root, variables, self.get_render_settings()))
+            try:
+                results = pool.map(_render_worker, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            environment = self.get_render_environment(root)
+            results = [render_file(environment, name, variables, path,
+                                   new_path, self.buffer_size,
+                                   copy_strategy=self.copy_strategy,
+                                   kind=kind)
+                       for name, path, new_path, kind in tasks]
+
+        totals = dict((outcome, 0) for outcome in (RENDERED, BINARY,
+                                                   UNMARKED, FAILED))
+        totals.update(counts or {})
+        for outcome, warning in results:
+            totals[outcome] += 1
+            if warning:
+                self.warning(warning)
+
+        self.out('Rendered {0} files, skipped {1} without template markers '
+                 'and {2} binary files'.format(totals[RENDERED],
+                                               totals[UNMARKED],
+                                               totals[BINARY]))
 
     def render(self):
         """ Reads the template and uses Jinja 2 to replace context variables
         with their real values.
         """
 
-        variables = state.get_context_variables()
-        for root, dirs, files in os.walk(state.get_project_root()):
-            jinja_loader = FileSystemLoader(root)
-            jinja_environment = Environment(loader=jinja_loader)
+        project_root = state.get_project_root()
+        tasks = []
+        for root, dirs, files in os.walk(project_root):
+            dirs.sort()
             ignores = self.get_render_ignore_files(files)
-            for filename in files:
+            for filename in sorted(files):
                 if filename not in ignores:
                     path = os.path.join(root, filename)
-                    try:
-                        template = jinja_environment.get_template(filename)
-                        rendered = template.render(variables)
-                    except:
-                        import sys
-                        e = sys.exc_info()[1]
-                        self.warning('Failed to render {0}: {1}'.format(
-                            path, e))
-                    else:
-                        with open(path, 'w', encoding='utf8') as handler:
-                            handler.write(rendered)
+                    tasks.append((path, path))
+
+        self.render_files(project_root, tasks)
@@ -5,25 +5,66 @@
    :synopsis: Classes for cloning remote templates from VCS repositories
 """
 
+import os
+import re
 import shutil
+import subprocess
+import tarfile
 import tempfile
 
 from facio.base import BaseFacio
 from facio.exceptions import FacioException
+from facio.files import extract_tar_stream
+
+
+# Matches a full commit hash
+get_commit_hash_pattern = re.compile(r'^[0-9a-f]{40}$')
+
+# Matches an abbreviated commit hash
+get_short_hash_pattern = re.compile(r'^[0-9a-f]{4,39}$')
 
 
 class BaseVCS(BaseFacio):
     """ Base Version Control System Class all VCS related classes should extend
     from, provides common API. """
 
+    # Optional facio.cache.MirrorCache to keep local mirrors of repositories
+    mirror_cache = None
+
     def __init__(self, path):
-        """ Simply sets the repository path based.
+        """ Sets the repository path, the optional ref pinned with an ``@``
+        after the last path segment, e.g: ``git+/foo/bar.git@v2``, and the
+        optional template subdirectory, e.g: ``git+/foo/bar.git#subdir=baz``.
 
         :param path: The path to the repository, e.g: git+git@foo.com/bar.git
         :type path: str
         """
 
+        self.origin = path
         self.vcs, self.path = path.split('+', 1)
+        self.ref = None
+        self.subdir = None
+        self.directory = None
+
+        if '#subdir=' in self.path:
+            self.path, self.subdir = self.path.split('#subdir=', 1)
+            self.subdir = self.subdir.strip('/')
+            if not self.subdir or '..' in self.subdir.split('/'):
+                raise FacioException('Invalid template subdirectory '
+                                     '{0}'.format(self.subdir))
+
+        segment = re.split(r'[/:]', self.path)[-1]
+        if '@' in segment:
+            self.path, self.ref = self.path.rsplit('@', 1)
+
+    def is_immutable(self):
+        """ Does the repository path pin a ref which can never change, so a
+        local copy never needs revalidating.
+
+        :returns: bool
+        """
+
+        return False
 
     def get_temp_directory(self):
         """ Create a temporary directory to clone the template to.
@@ -37,25 +78,180 @@ class BaseVCS(BaseFacio):
             self.temp_directory_path = tempfile.mkdtemp(suffix='facio')
             return self.temp_directory_path
 
-    def clone(self):
+    def clone(self, directory=None, working_tree=True):
         """ This class should be overridden in VCS subclass, if not a
         FacioException will be raised. """
 
         raise FacioException('The clone method on BaseVCS needs to be '
                              'overridden.')
 
+    def update(self, directory):
+        """ This class should be overridden in VCS subclass, if not a
+        FacioException will be raised. """
+
+        raise FacioException('The update method on BaseVCS needs to be '
+                             'overridden.')
+
+    def get_clone_directory(self, directory=None):
+        """ Returns the directory to clone into, a temporary directory if
+        none is given, making sure it exists.
+
+        :param directory: Directory to clone into -- optional
+        :type directory: str
+
+        :returns: str
+        """
+
+        if directory is None:
+            return self.get_temp_directory()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return directory
+
+    def get_archive_command(self):
+        """ This class should be overridden in VCS subclass, if not a
+        FacioException will be raised. """
+
+        raise FacioException('The get_archive_command method on BaseVCS '
+                             'needs to be overridden.')
+
+    def read_file(self, name):
+        """ This class should be overridden in VCS subclass, if not a
+        FacioException will be raised. """
+
+        raise FacioException('The read_file method on BaseVCS needs to be '
+                             'overridden.')
+
+    def checkout(self, working_tree=True):
+        """ Returns a local copy of the template, from ``mirror_cache`` if
+        set else from a fresh clone into a temporary directory. If a
+        subdirectory is set the path to it within the copy is returned.
+
+        ** Optional Key Word Arguments **
+
+        :param working_tree: Check out the files of a fresh clone, not
+                             needed if the copy is only used to ``export``
+        :type working_tree: bool -- default True
+
+        :returns: str -- Path to the local copy of the template
+        """
+
+        if self.mirror_cache is None:
+            self.directory = self.clone(working_tree=working_tree)
+        else:
+            self.directory = self.mirror_cache.checkout(self)
+
+        if not self.directory or not self.subdir or not working_tree:
+            return self.directory
+
+        path = os.path.join(self.directory, *self.subdir.split('/'))
+        if not os.path.isdir(path):
+            self.cleanup(path, None)
+            raise FacioException('{0} not found in {1}'.format(
+                self.subdir, self.path))
+        return path
+
+    def export(self, destination, ignore=None):
+        """ Stream the template files at the checked out revision from the
+        local copy returned by ``checkout`` straight into destination as a
+        tar archive, so files are written once and the repository metadata
+        is never copied.
+
+        :param destination: Directory to export the template files to
+        :type destination: str
+
+        ** Optional Key Word Arguments **
+
+        :param ignore: Files and directories matched are not exported
+        :type ignore: facio.files.GlobMatcher -- default None
+
+        :returns: int -- Number of files exported
+        """
+
+        command, prefix = self.get_archive_command()
+
+        self.out('Exporting {0} to {1}'.format(self.path, destination))
+
+        try:
+            process = subprocess.Popen(command, cwd=self.directory,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        except OSError:
+            raise FacioException('Failed to export {0}'.format(self.path))
+
+        try:
+            count = extract_tar_stream(process.stdout, destination,
+                                       ignore=ignore, prefix=prefix)
+            # Drain the end of archive padding so the process can exit
+            while process.stdout.read(64 * 1024):
+                pass
+        except (tarfile.TarError, IOError, OSError):
+            count = None
+        finally:
+            process.stdout.close()
+            process.stderr.read()
+            process.stderr.close()
+            returncode = process.wait()
+
+        if count is None or returncode:
+            raise FacioException('Failed to export {0}'.format(self.path))
+
+        return count
+
     def remove_tmp_dir(self, origin, destination):
         """ Template.copy callback function to remove created temp directory.
         """
 
         shutil.rmtree(origin)
 
+    def cleanup(self, origin, destination):
+        """ Template callback function to release the local copy returned by
+        ``checkout``, mirrors are kept and temporary clones removed. """
+
+        directory = self.directory or origin
+        if self.mirror_cache is None:
+            self.remove_tmp_dir(directory, destination)
+        else:
+            self.mirror_cache.release(directory)
+
 
 class GitVCS(BaseVCS):
     """ Git Version Control System for cloning git repositories. """
 
-    def clone(self):
-        """ Clone the git repository into a temporary directory. """
+    def is_immutable(self):
+        """ Refs pinned to a full commit hash never change.
+
+        :returns: bool
+        """
+
+        return bool(self.ref and get_commit_hash_pattern.match(self.ref))
+
+    def is_commit(self):
+        """ Is the pinned ref a full or abbreviated commit hash, which can
+        not be cloned with ``--branch``. An abbreviated hash may also be the
+        name of a branch or tag, it is fetched either way.
+
+        :returns: bool
+        """
+
+        return bool(self.ref and get_short_hash_pattern.match(self.ref)) or \
+            self.is_immutable()
+
+    def clone(self, directory=None, working_tree=True):
+        """ Shallow clone the git repository into a directory, by default a
+        temporary directory. Only the pinned branch, tag or commit is fetched,
+        or the default branch if no ref is pinned. If a subdirectory is set
+        only its files are downloaded and checked out, using a partial clone
+        and sparse checkout.
+
+        :param directory: Directory to clone into -- optional
+        :type directory: str
+
+        :param working_tree: Check out the files -- default True
+        :type working_tree: bool
+
+        :returns: str -- The directory cloned into
+        """
 
         try:
             from sh import git
@@ -63,27 +259,170 @@ class GitVCS(BaseVCS):
             raise FacioException('Git must be installed to use git+ '
                                  'template paths')
 
-        temp_diretory = self.get_temp_directory()
+        temp_diretory = self.get_clone_directory(directory)
 
         self.out('Git Cloning {0} to {1}'.format(self.path, temp_diretory))
 
+        args = ['--depth', '1']
+        if self.subdir:
+            args += ['--filter=blob:none']
+
         try:
             git = git.bake(_cwd=temp_diretory)
-            git.clone(self.path, temp_diretory)
-            git.fetch('--all')
-            git.checkout('master')
+            if self.is_commit():
+                git.init()
+                git.remote('add', 'origin', self.path)
+                if self.subdir:
+                    git.config('remote.origin.promisor', 'true')
+                    git.config('remote.origin.partialclonefilter',
+                               'blob:none')
+                    self.set_sparse_checkout(git)
+                # Sparse checkouts fetch the subdirectory in a single batch,
+                # abbreviated hashes are resolved by checking them out
+                self.fetch_commit(git, checkout=working_tree or bool(
+                    self.subdir) or not self.is_immutable())
+            else:
+                if self.ref:
+                    args += ['--branch', self.ref]
+                if self.subdir or not working_tree:
+                    args += ['--no-checkout']
+                git.clone(*(args + ['--single-branch', self.path,
+                                    temp_diretory]))
+                if self.subdir:
+                    self.set_sparse_checkout(git)
+                    git.checkout()
         except:
             raise FacioException('Failed to clone git repository '
                                  'at {0}'.format(self.path))
 
         return temp_diretory
 
+    def set_sparse_checkout(self, git):
+        """ Limit the working tree to the template subdirectory.
+
+        :param git: ``sh.git`` baked with the clone as working directory
+        :type git: sh.Command
+        """
+
+        git('sparse-checkout', 'set', '--no-cone', '/{0}/'.format(self.subdir))
+
+    def fetch_commit(self, git, checkout=True):
+        """ Fetch and checkout the pinned commit. Not every server allows
+        fetching a single commit, nor any server an abbreviated hash, if it
+        fails the whole history is fetched and the commit found in it.
+
+        :param git: ``sh.git`` baked with the clone as working directory
+        :type git: sh.Command
+
+        :param checkout: Check out the commit -- default True
+        :type checkout: bool
+        """
+
+        args = ['--filter=blob:none'] if self.subdir else []
+        try:
+            git.fetch(*(args + ['--depth', '1', 'origin', self.ref]))
+            # An abbreviated hash fetched by name is a branch or tag
+            commit = self.ref if self.is_immutable() else 'FETCH_HEAD'
+        except:
+            git.fetch(*(args + ['origin']))
+            commit = self.ref
+        if checkout:
+            git.checkout('--detach', commit)
+
+    def get_archive_command(self):
+        """ Returns the command writing a tar archive of the checked out
+        commit, or the pinned commit, limited to the template subdirectory
+        if set, and the path prefix of the files in the archive.
+
+        :returns: tuple -- (list, str)
+        """
+
+        return ['git', 'archive', '--format=tar', self.get_tree()], ''
+
+    def get_tree(self, name=None):
+        """ Returns the git object name of the template at the checked out
+        commit, or the pinned commit, or of a file within it.
+
+        :param name: ``/`` separated path of a file in the template
+        :type name: str -- optional
+
+        :returns: str
+        """
+
+        commit = self.ref if self.is_immutable() else 'HEAD'
+        path = '/'.join(part for part in (self.subdir, name) if part)
+        if not path:
+            return commit
+        return '{0}:{1}'.format(commit, path)
+
+    def read_file(self, name):
+        """ Returns the contents of a file in the template at the checked out
+        commit of the local copy returned by ``checkout``, which does not
+        need a working tree.
+
+        :param name: ``/`` separated path of the file in the template
+        :type name: str
+
+        :returns: str or None if the file does not exist
+        """
+
+        try:
+            from sh import git
+        except ImportError:
+            raise FacioException('Git must be installed to use git+ '
+                                 'template paths')
+
+        try:
+            git = git.bake(_cwd=self.directory, _tty_out=False)
+            return str(git('cat-file', 'blob', self.get_tree(name)))
+        except:
+            return None
+
+    def update(self, directory):
+        """ Fetch the latest commit of the pinned ref, or the default branch,
+        into an existing shallow clone and reset it to that commit.
+
+        :param directory: Directory of the existing clone
+        :type directory: str
+        """
+
+        try:
+            from sh import git
+        except ImportError:
+            raise FacioException('Git must be installed to use git+ '
+                                 'template paths')
+
+        self.out('Git Fetching {0} into {1}'.format(self.path, directory))
+
+        try:
+            git = git.bake(_cwd=directory)
+            if self.is_commit():
+                self.fetch_commit(git)
+            else:
+                args = ['--filter=blob:none'] if self.subdir else []
+                git.fetch(*(args + ['--depth', '1', 'origin',
+                                    self.ref or 'HEAD']))
+                git.reset('--hard', 'FETCH_HEAD')
+        except:
+            raise FacioException('Failed to fetch git repository '
+                                 'at {0}'.format(self.path))
+
 
 class MercurialVCS(BaseVCS):
     """ Mercurial Version Control System for cloning hg repositories. """
 
-    def clone(self):
-        """ Clone the hg repository into a temporary directory. """
+    def clone(self, directory=None, working_tree=True):
+        """ Clone the hg repository into a directory, by default a
+        temporary directory.
+
+        :param directory: Directory to clone into -- optional
+        :type directory: str
+
+        :param working_tree: Update the working directory -- default True
+        :type working_tree: bool
+
+        :returns: str -- The directory cloned into
+        """
 
         try:
             from sh import hg
@@ -91,16 +430,88 @@ class MercurialVCS(BaseVCS):
             raise FacioException('Mercurial must be installed to use hg+ '
                                  'template paths')
 
-        temp_diretory = self.get_temp_directory()
+        temp_diretory = self.get_clone_directory(directory)
 
         self.out('Mercurial Cloning {0} to {1}'.format(self.path,
                                                        temp_diretory))
 
         try:
             hg = hg.bake(_cwd=temp_diretory)
-            hg.clone(self.path, temp_diretory)
+            if not working_tree:
+                hg.clone('--noupdate', self.path, temp_diretory)
+            elif self.ref:
+                hg.clone('--updaterev', self.ref, self.path, temp_diretory)
+            else:
+                hg.clone(self.path, temp_diretory)
         except:
             raise FacioException('Failed to clone hg repository '
                                  'at {0}'.format(self.path))
 
         return temp_diretory
+
+    def update(self, directory):
+        """ Pull new changesets into an existing clone and update to the
+        pinned ref, or the default branch.
+
+        :param directory: Directory of the existing clone
+        :type directory: str
+        """
+
+        try:
+            from sh import hg
+        except ImportError:
+            raise FacioException('Mercurial must be installed to use hg+ '
+                                 'template paths')
+
+        self.out('Mercurial Pulling {0} into {1}'.format(self.path,
+                                                         directory))
+
+        try:
+            hg = hg.bake(_cwd=directory)
+            hg.pull(self.path)
+            hg.update('--clean', self.ref or 'default')
+        except:
+            raise FacioException('Failed to pull hg repository '
+                                 'at {0}'.format(self.path))
+
+    def get_archive_command(self):
+        """ Returns the command writing a tar archive of the pinned ref, or
+        the default branch, limited to the template subdirectory if set, and
+        the path prefix of the files in the archive.
+
+        :returns: tuple -- (list, str)
+        """
+
+        prefix = 'template'
+        command = ['hg', 'archive', '--config', 'ui.archivemeta=false',
+                   '--type', 'tar', '--prefix', prefix,
+                   '--rev', self.ref or 'default']
+        if self.subdir:
+            command += ['--include', 'path:{0}'.format(self.subdir)]
+            prefix = '{0}/{1}'.format(prefix, self.subdir)
+        return command + ['-'], prefix
+
+    def read_file(self, name):
+        """ Returns the contents of a file in the template at the pinned
+        ref, or the default branch, of the local copy returned by
+        ``checkout``, which does not need a working directory.
+
+        :param name: ``/`` separated path of the file in the template
+        :type name: str
+
+        :returns: str or None if the file does not exist
+        """
+
+        try:
+            from sh import hg
+        except ImportError:
+            raise FacioException('Mercurial must be installed to use hg+ '
+                                 'template paths')
+
+        path = '/'.join(part for part in (self.subdir, name) if part)
+        try:
+            hg = hg.bake(_cwd=self.directory, _tty_out=False)
+            return str(hg.cat('--rev', self.ref or 'default',
+                              'path:{0}'.format(path)))
+        except:
+            return None
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_api
+   :synopsis: Tests for the Facio generate API.
+"""
+
+import facio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from facio.api import generate
+from facio.exceptions import FacioException
+from facio.state import count_processes
+from facio.template import Template
+from mock import patch
+
+from . import BaseTestCase
+from .test_archive import make_tar
+
+
+class TestGenerate(BaseTestCase):
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.base.puts',
+            'facio.exceptions.puts',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.origin = os.path.join(self.directory, 'origin')
+        self.destination = os.path.join(self.directory, 'projects')
+        os.makedirs(os.path.join(self.origin, '{{PROJECT_NAME}}'))
+        os.mkdir(self.destination)
+        self.write('{{PROJECT_NAME}}/settings.py',
+                   '{{ PROJECT_NAME }} {{ a }}')
+        self.write('README', 'readme')
+
+    def write(self, name, contents):
+        with open(os.path.join(self.origin, name), 'w') as handler:
+            handler.write(contents)
+
+    def read(self, name):
+        with open(os.path.join(self.destination, name)) as handler:
+            return handler.read()
+
+    def test_generate(self):
+        result = generate(self.origin, 'foo', {'a': 'b'},
+                          destination=self.destination)
+
+        self.assertEqual(result.project_root,
+                         os.path.join(self.destination, 'foo'))
+        self.assertEqual(result.files, ['README', 'foo/settings.py'])
+        self.assertEqual(self.read('foo/foo/settings.py'), 'foo b')
+        self.assertEqual(sorted(result.timings),
+                         ['generate', 'prepare', 'total'])
+        self.assertIn('{0} not found'.format(
+            os.path.join(self.origin, '.facio.hooks.yml')), result.warnings)
+        self.assertFalse(self.mocked_facio_base_puts.called)
+
+    @unittest.skipIf(not hasattr(sys, 'addaudithook'),
+                     'Counting processes needs audit hooks')
+    def test_generate_spawns_no_processes(self):
+        count_processes()
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.destination)
+
+        result = generate(self.origin, 'foo', {'a': 'b'})
+
+        self.assertEqual(result.files, ['README', 'foo/settings.py'])
+        self.assertEqual(result.processes, 0)
+
+    def test_generate_reexported(self):
+        result = facio.generate(self.origin, 'foo',
+                                destination=self.destination)
+
+        self.assertEqual(result.files, ['README', 'foo/settings.py'])
+
+    def test_generate_prepared_template(self):
+        template = Template(self.origin)
+        template.compile()
+
+        generate(template, 'foo', {'a': 'b'}, destination=self.destination)
+        generate(template, 'bar', {'a': 'c'}, destination=self.destination)
+
+        self.assertEqual(self.read('foo/foo/settings.py'), 'foo b')
+        self.assertEqual(self.read('bar/bar/settings.py'), 'bar c')
+
+    def test_generate_threads(self):
+        template = Template(self.origin)
+        template.compile()
+        results = {}
+
+        def run(name):
+            results[name] = generate(template, name, {'a': name},
+                                     destination=self.destination)
+
+        threads = [threading.Thread(target=run, args=(name, ))
+                   for name in ('foo', 'bar', 'baz')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for name in ('foo', 'bar', 'baz'):
+            self.assertEqual(results[name].files,
+                             ['README', '{0}/settings.py'.format(name)])
+            self.assertEqual(self.read('{0}/{0}/settings.py'.format(name)),
+                             '{0} {0}'.format(name))
+
+    def test_generate_archive_threads(self):
+        path = os.path.join(self.directory, 'template.tar.gz')
+        members = [('{0}.txt'.format(n),
+                    '{0} {{{{ PROJECT_NAME }}}} {1}'.format(
+                        n, 'x' * (n * 512)).encode('utf8'))
+                   for n in range(50)]
+        members += [('{0}.bin'.format(n),
+                     b'\x00' + os.urandom(n * 1024)) for n in range(50)]
+        make_tar(path, members)
+        template = Template(path)
+        template.prepare()
+        names = ['project{0}'.format(n) for n in range(8)]
+
+        threads = [threading.Thread(target=generate, args=(template, name),
+                                    kwargs={'destination': self.destination,
+                                            'hooks': False})
+                   for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for name in names:
+            for member, data in members:
+                with open(os.path.join(self.destination, name, member),
+                          'rb') as handler:
+                    if member.endswith('.txt'):
+                        data = data.replace(b'{{ PROJECT_NAME }}',
+                                            name.encode('utf8'))
+                    self.assertEqual(handler.read(), data)
+
+    @patch('facio.hooks.yaml.load')
+    def test_generate_hooks(self, mock_load):
+        mock_load.return_value = {'before': ['facio.hooks.django.secret']}
+        self.write('.facio.hooks.yml', 'before:\n'
+                                       '    - facio.hooks.django.secret\n')
+
+        result = generate(self.origin, 'foo', destination=self.destination)
+
+        self.assertEqual(len(result.hook_results), 1)
+        module, key = result.hook_results[0]
+        self.assertEqual(module, 'facio.hooks.django.secret')
+        self.assertEqual(len(key), 50)
+        self.assertIn('before', result.timings)
+
+    @patch('sys.exit')
+    def test_generate_raises(self, mock_exit):
+        os.mkdir(os.path.join(self.destination, 'foo'))
+
+        with self.assertRaises(FacioException) as context:
+            generate(self.origin, 'foo', destination=self.destination)
+
+        self.assertEqual(str(context.exception), '{0} already exists'.format(
+            os.path.join(self.destination, 'foo')))
+        self.assertFalse(mock_exit.called)
+        self.assertFalse(self.mocked_facio_exceptions_puts.called)
+
+    @patch('sys.exit')
+    def test_generate_invalid_project_name(self, mock_exit):
+        with self.assertRaises(FacioException):
+            generate(self.origin, 'foo-bar', destination=self.destination)
+
+        self.assertFalse(mock_exit.called)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_archive
+   :synopsis: Tests for the Facio archive module.
+"""
+
+import io
+import os
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import zipfile
+
+from facio.archive import (ArchiveLoader, RepositoryArchive, TemplateArchive,
+                           is_archive)
+from facio.vcs import GitVCS
+from jinja2 import Environment, TemplateNotFound
+from mock import patch
+
+from . import BaseTestCase
+
+
+def make_tar(path, members):
+    with tarfile.open(path, 'w:gz') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            if isinstance(data, tuple):
+                info.type, info.linkname = data
+                archive.addfile(info)
+            elif data is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                archive.addfile(info)
+            else:
+                info.size = len(data)
+                info.mode = 0o644
+                archive.addfile(info, io.BytesIO(data))
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in members:
+            if data is None:
+                archive.writestr(name.rstrip('/') + '/', b'')
+            else:
+                archive.writestr(name, data)
+
+
+class TestTemplateArchive(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_is_archive(self):
+        path = os.path.join(self.directory, 'template.tar.gz')
+        make_tar(path, [('a.txt', b'a')])
+
+        self.assertTrue(is_archive(path))
+        self.assertFalse(is_archive(os.path.join(self.directory, 'b.zip')))
+        self.assertFalse(is_archive(self.directory))
+
+    def test_tar_members(self):
+        path = os.path.join(self.directory, 'template.tar.gz')
+        make_tar(path, [('a', None), ('a/b.txt', b'b'), ('c.txt', b'c')])
+
+        archive = TemplateArchive(path)
+
+        self.assertEqual([(m[0], m[1]) for m in archive.members], [
+            ('a', True), ('a/b.txt', False), ('c.txt', False)])
+        self.assertEqual(archive.read('a/b.txt'), b'b')
+
+    def test_tar_links(self):
+        path = os.path.join(self.directory, 'template.tar.gz')
+        make_tar(path, [('a.txt', b'a'),
+                        ('link.txt', (tarfile.SYMTYPE, 'a.txt')),
+                        ('hard.txt', (tarfile.LNKTYPE, 'a.txt')),
+                        ('pipe', (tarfile.FIFOTYPE, ''))])
+
+        with patch('facio.archive.TemplateArchive.warning') as mock_warning:
+            archive = TemplateArchive(path)
+
+        self.assertEqual([m[0] for m in archive.members],
+                         ['a.txt', 'link.txt', 'hard.txt'])
+        self.assertEqual([archive.get_link(m[4]) for m in archive.members],
+                         [None, 'a.txt', None])
+        self.assertEqual(archive.read('hard.txt'), b'a')
+        with self.assertRaises(KeyError):
+            archive.read('link.txt')
+        mock_warning.assert_called_once_with(
+            'Skipping pipe in {0}, only files, directories and links are '
+            'supported'.format(path))
+
+    def test_zip_links(self):
+        path = os.path.join(self.directory, 'template.zip')
+        make_zip(path, [('a.txt', b'a')])
+        with zipfile.ZipFile(path, 'a') as handler:
+            info = zipfile.ZipInfo('link.txt')
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            handler.writestr(info, 'a.txt')
+
+        archive = TemplateArchive(path)
+
+        self.assertEqual([archive.get_link(m[4]) for m in archive.members],
+                         [None, 'a.txt'])
+        self.assertEqual(sorted(archive.index), ['a.txt'])
+
+    def test_zip_members(self):
+        path = os.path.join(self.directory, 'template.zip')
+        make_zip(path, [('a/', None), ('a/b.txt', b'b'), ('c.txt', b'c')])
+
+        archive = TemplateArchive(path)
+
+        self.assertEqual([(m[0], m[1]) for m in archive.members], [
+            ('a', True), ('a/b.txt', False), ('c.txt', False)])
+        self.assertEqual(archive.read('c.txt'), b'c')
+
+    def test_single_top_level_directory_stripped(self):
+        path = os.path.join(self.directory, 'template.zip')
+        make_zip(path, [('template-1.0/', None),
+                        ('template-1.0/a/b.txt', b'b')])
+
+        archive = TemplateArchive(path)
+
+        self.assertEqual([m[0] for m in archive.members], ['a/b.txt'])
+
+    def test_parent_paths_skipped(self):
+        path = os.path.join(self.directory, 'template.tar.gz')
+        make_tar(path, [('../evil', b'evil'), ('a.txt', b'a')])
+
+        archive = TemplateArchive(path)
+
+        self.assertEqual([m[0] for m in archive.members], ['a.txt'])
+
+    def test_loader(self):
+        path = os.path.join(self.directory, 'template.zip')
+        make_zip(path, [('base.txt', b'Hello {% block a %}{% endblock %}')])
+        loader = ArchiveLoader(TemplateArchive(path))
+        loader.sources['a.txt'] = ('{% extends "base.txt" %}'
+                                   '{% block a %}{{ b }}{% endblock %}')
+
+        environment = Environment(loader=loader)
+
+        self.assertEqual(environment.get_template('a.txt').render(b='foo'),
+                         'Hello foo')
+        with self.assertRaises(TemplateNotFound):
+            environment.get_template('missing.txt')
+
+
+class TestRepositoryArchive(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        os.makedirs(os.path.join(self.directory, 'templates', 'django'))
+        for name, data in [('setup.py', 'a'),
+                           ('templates/django/manage.py', 'b')]:
+            with open(os.path.join(self.directory, name), 'w') as handler:
+                handler.write(data)
+        for args in [['init', '-q'], ['add', '.'],
+                     ['-c', 'user.name=Facio', '-c', 'user.email=facio@test',
+                      'commit', '-q', '-m', 'Template']]:
+            subprocess.check_call(['git'] + args, cwd=self.directory)
+
+    def get_archive(self, origin):
+        vcs = GitVCS(origin)
+        vcs.directory = self.directory
+        return RepositoryArchive(vcs)
+
+    def test_members(self):
+        archive = self.get_archive('git+/foo/bar')
+
+        contents = [(name, is_dir, archive.open(member).read())
+                    for name, is_dir, mode, mtime, member in archive.members
+                    if not is_dir]
+
+        self.assertEqual(contents, [('setup.py', False, b'a'),
+                                    ('templates/django/manage.py', False,
+                                     b'b')])
+
+    def test_subdir_members(self):
+        archive = self.get_archive('git+/foo/bar#subdir=templates')
+
+        self.assertEqual([member[0] for member in archive.members],
+                         ['django', 'django/manage.py'])
+        # Members are streamed again each time they are iterated
+        self.assertEqual(len(list(archive.members)), 2)
+
+    def test_symlink_members(self):
+        os.symlink('manage.py',
+                   os.path.join(self.directory, 'templates', 'link.py'))
+        for args in [['add', '.'],
+                     ['-c', 'user.name=Facio', '-c', 'user.email=facio@test',
+                      'commit', '-q', '-m', 'Link']]:
+            subprocess.check_call(['git'] + args, cwd=self.directory)
+        archive = self.get_archive('git+/foo/bar#subdir=templates')
+
+        links = [(name, archive.get_link(member))
+                 for name, is_dir, mode, mtime, member in archive.members]
+
+        self.assertEqual(links, [('django', None), ('django/manage.py', None),
+                                 ('link.py', 'manage.py')])
+
+    def test_read(self):
+        archive = self.get_archive('git+/foo/bar#subdir=templates/django')
+
+        self.assertEqual(archive.read('manage.py'), b'b')
+        with self.assertRaises(KeyError):
+            archive.read('setup.py')
+
+    def test_archive_command_fails(self):
+        archive = self.get_archive('git+/foo/bar#subdir=templates/flask')
+
+        with self.assertRaises(tarfile.TarError):
+            list(archive.members)
@@ -5,7 +5,9 @@
    :synopsis: Tests for Facio base class
 """
 
-from facio.base import BaseFacio
+from facio.base import BaseFacio, Embedded, get_embedded_messages
+from facio.exceptions import FacioException
+from mock import patch
 
 from . import BaseTestCase
 
@@ -40,3 +42,30 @@ class TestFacio(BaseTestCase):
         f.success('Foo')
 
         self.mocked_facio_base_puts.called_once_with('Success: Foo')
+
+    def test_embedded_collects_messages(self):
+        f = BaseFacio()
+        with Embedded() as messages:
+            f.out('Foo')
+            f.warning('Bar')
+
+        self.assertEqual(messages, ['Foo', 'Warning: Bar'])
+        self.assertFalse(self.mocked_facio_base_puts.called)
+        self.assertIsNone(get_embedded_messages())
+
+    @patch('facio.base.input')
+    def test_embedded_gather_uses_default(self, mock_input):
+        f = BaseFacio()
+        with Embedded():
+            self.assertEqual(f.gather('Foo?'), '')
+
+        self.assertFalse(mock_input.called)
+
+    @patch('sys.exit')
+    def test_embedded_exception_does_not_exit(self, mock_exit):
+        with Embedded():
+            with self.assertRaises(FacioException) as context:
+                raise FacioException('Foo')
+
+        self.assertEqual(str(context.exception), 'Foo')
+        self.assertFalse(mock_exit.called)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_batch
+   :synopsis: Tests for the Facio batch module.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from facio.batch import Batch
+from facio.exceptions import FacioException
+from facio.hooks import Hook
+from facio.template import Template
+from jinja2 import Environment
+from mock import MagicMock, patch, PropertyMock
+from six import StringIO
+
+from . import BaseTestCase
+
+
+class TestBatch(BaseTestCase):
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.exceptions.puts',
+            'facio.batch.Batch.out',
+            'facio.batch.Batch.success',
+            'facio.batch.Batch.error',
+            'facio.template.Template.out',
+            'facio.template.Template.warning',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.origin = os.path.join(self.directory, 'origin')
+        self.cwd = os.path.join(self.directory, 'cwd')
+        os.makedirs(os.path.join(self.origin, '{{PROJECT_NAME}}'))
+        os.mkdir(self.cwd)
+        with open(os.path.join(self.origin, '{{PROJECT_NAME}}',
+                               'settings.py'), 'w') as handler:
+            handler.write('{{ PROJECT_NAME }} {{ port }} {{ debug }}')
+
+        patcher = patch('facio.state.getcwd', return_value=self.cwd)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch('facio.batch.state.state',
+                        new_callable=PropertyMock,
+                        create=True)
+        self.mock_state = patcher.start()
+        self.mock_state.context_variables = {'debug': 'false'}
+        self.addCleanup(patcher.stop)
+
+    def get_batch(self, jobs=1):
+        pipeline = Hook()
+        pipeline.hooks = {}
+        return Batch(Template(self.origin), pipeline, jobs=jobs)
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handler:
+            handler.write(contents)
+        return path
+
+    def read(self, name):
+        with open(os.path.join(self.cwd, name, name, 'settings.py')) as f:
+            return f.read()
+
+    def test_read_jsonl(self):
+        path = self.write('records.jsonl', '{"project_name": "foo", '
+                                           '"vars": {"port": "80"}}\n\n'
+                                           '{"project_name": "bar", '
+                                           '"vars": "port=81,debug=true"}\n')
+
+        records = self.get_batch().read_records(path)
+
+        self.assertEqual(records, [
+            ('foo', {'port': '80'}),
+            ('bar', {'port': '81', 'debug': 'true'})])
+
+    def test_read_csv(self):
+        path = self.write('records.csv', 'project_name,port,vars\n'
+                                         'foo,80,\n'
+                                         'bar,81,debug=true\n')
+
+        records = self.get_batch().read_records(path)
+
+        self.assertEqual(records, [
+            ('foo', {'port': '80'}),
+            ('bar', {'port': '81', 'debug': 'true'})])
+
+    @patch('sys.stdin', new_callable=StringIO)
+    def test_read_stdin(self, mock_stdin):
+        mock_stdin.write('{"project_name": "foo"}\n')
+        mock_stdin.seek(0)
+
+        records = self.get_batch().read_records('-')
+
+        self.assertEqual(records, [('foo', {})])
+
+    @patch('sys.exit')
+    def test_read_invalid_project_name(self, mock_exit):
+        path = self.write('records.csv', 'project_name\nfoo\nfoo-bar\n')
+
+        with self.assertRaises(FacioException):
+            self.get_batch().read_records(path)
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Line 3: project names can only contain numbers letters '
+            'and underscores')
+
+    @patch('sys.exit')
+    def test_read_duplicate_project_name(self, mock_exit):
+        path = self.write('records.csv', 'project_name\nfoo\nfoo\n')
+
+        with self.assertRaises(FacioException):
+            self.get_batch().read_records(path)
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Line 3: foo is listed more than once')
+
+    @patch('sys.exit')
+    def test_read_invalid_json(self, mock_exit):
+        path = self.write('records.jsonl', '{"project_name": "foo"}\n[]\n')
+
+        with self.assertRaises(FacioException):
+            self.get_batch().read_records(path)
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Line 2: records should be JSON objects with a '
+            'project_name and vars')
+
+    def test_run(self):
+        batch = self.get_batch()
+
+        with patch('facio.template.Template.compile',
+                   wraps=batch.template.compile) as mock_compile:
+            batch.run([('foo', {'port': '80'}), ('bar', {'port': '81'})])
+
+        self.assertEqual(mock_compile.call_count, 1)
+        self.assertEqual(self.read('foo'), 'foo 80 false')
+        self.assertEqual(self.read('bar'), 'bar 81 false')
+        self.assertTrue(self.mocked_facio_batch_Batch_out.call_args[0][0]
+                        .startswith('Generated 2 of 2 projects in'))
+
+    def test_run_in_pool(self):
+        self.get_batch(jobs=2).run([('foo', {'port': '80'}),
+                                    ('bar', {'port': '81'})])
+
+        self.assertEqual(self.read('foo'), 'foo 80 false')
+        self.assertEqual(self.read('bar'), 'bar 81 false')
+
+    def test_run_in_pool_compiles_once(self):
+        batch = self.get_batch(jobs=2)
+        parent = os.getpid()
+        compile = Environment.compile
+
+        def compile_in_parent(environment, *args, **kwargs):
+            if os.getpid() != parent:
+                raise SyntaxError('compiled in a worker')
+            return compile(environment, *args, **kwargs)
+
+        with patch.object(Environment, 'compile', compile_in_parent):
+            batch.run([('foo', {'port': '80'}), ('bar', {'port': '81'})])
+
+        # Workers load the code compiled by the parent from a temporary
+        # bytecode cache, removed once the batch is done
+        self.assertEqual(self.read('foo'), 'foo 80 false')
+        self.assertEqual(self.read('bar'), 'bar 81 false')
+        self.assertEqual(batch.template.bytecode_cache, None)
+        self.assertFalse(os.path.exists(
+            batch.template.environment.bytecode_cache.directory))
+
+    @unittest.skipIf(not hasattr(multiprocessing, 'get_context'),
+                     'spawn start method not available')
+    def test_run_in_spawned_pool(self):
+        batch = self.get_batch(jobs=2)
+        batch.pipeline.hooks = {'after': []}
+        # Neither can be pickled, workers are started from plain settings
+        batch.template.compile()
+        batch.template.mirror_cache = MagicMock()
+
+        with patch('facio.batch.multiprocessing.Pool',
+                   multiprocessing.get_context('spawn').Pool):
+            batch.run([('foo', {'port': '80'}), ('bar', {'port': '81'})])
+
+        self.assertEqual(self.read('foo'), 'foo 80 false')
+        self.assertEqual(self.read('bar'), 'bar 81 false')
+
+    def test_run_failure(self):
+        os.mkdir(os.path.join(self.cwd, 'foo'))
+
+        # Only the summary exits, the error of each project is reported
+        with self.assertRaises(SystemExit):
+            self.get_batch().run([('foo', {}), ('bar', {'port': '81'})])
+
+        self.assertEqual(self.read('bar'), 'bar 81 false')
+        self.mocked_facio_batch_Batch_error.assert_any_call(
+            'foo: {0} already exists'.format(os.path.join(self.cwd, 'foo')))
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Failed to generate 1 projects')
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_bundle
+   :synopsis: Tests for the Facio bundle and pack modules.
+"""
+
+import os
+import shutil
+import tempfile
+
+from facio.bundle import (DIRECTORY, BundleLoader, BundleWriter,
+                          TemplateBundle, is_bundle)
+from facio.exceptions import FacioException
+from facio.pack import Pack
+from facio.template import (BINARY, COPIED, RENDERED, UNMARKED, Template)
+from jinja2 import Environment, TemplateNotFound
+from mock import patch
+
+from . import BaseTestCase
+
+
+class TestBundle(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'template.faciopack')
+
+    def make_file(self, name, contents):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as handler:
+            handler.write(contents)
+        return path
+
+    def write(self):
+        environment = Environment()
+        writer = BundleWriter(self.path)
+        writer.add_directory('{{PROJECT_NAME}}', 0o755, 1.0, True)
+        writer.add_file(
+            'base.txt', RENDERED, 0o644, 2.0, False,
+            self.make_file('base', b'Hello {% block a %}{% endblock %}'),
+            code=environment.compile('Hello {% block a %}{% endblock %}',
+                                     'base.txt', 'base.txt'))
+        writer.add_file('{{PROJECT_NAME}}/a.txt', RENDERED, 0o600, 3.0, True,
+                        self.make_file('a', b'{% extends "base.txt" %}'
+                                            b'{% block a %}{{ b }}'
+                                            b'{% endblock %}'))
+        writer.add_file('plain.txt', UNMARKED, 0o644, 4.0, False,
+                        self.make_file('plain', b'plain'))
+        writer.close()
+        return TemplateBundle(self.path)
+
+    def test_is_bundle(self):
+        self.write()
+
+        self.assertTrue(is_bundle(self.path))
+        self.assertFalse(is_bundle(self.make_file('other', b'other')))
+        self.assertFalse(is_bundle(self.directory))
+
+    def test_entries(self):
+        bundle = self.write()
+
+        self.assertEqual([(e['name'], e['kind'], e['mode'], e['rename'])
+                          for e in bundle.entries], [
+            ('{{PROJECT_NAME}}', DIRECTORY, 0o755, True),
+            ('base.txt', RENDERED, 0o644, False),
+            ('{{PROJECT_NAME}}/a.txt', RENDERED, 0o600, True),
+            ('plain.txt', UNMARKED, 0o644, False)])
+        self.assertEqual(bundle.read('plain.txt'), b'plain')
+        self.assertNotIn('{{PROJECT_NAME}}', bundle.index)
+        with self.assertRaises(KeyError):
+            bundle.read('missing.txt')
+
+    def test_get_code(self):
+        bundle = self.write()
+
+        self.assertIsNotNone(bundle.get_code(bundle.index['base.txt']))
+        self.assertIsNone(bundle.get_code(bundle.index['plain.txt']))
+
+    def test_get_code_other_version(self):
+        self.write()
+        with patch('facio.bundle.CODE_TAG', 'other'):
+            bundle = TemplateBundle(self.path)
+
+        self.assertFalse(bundle.compiled)
+        self.assertIsNone(bundle.get_code(bundle.index['base.txt']))
+
+    def test_not_a_bundle(self):
+        with self.assertRaises(ValueError):
+            TemplateBundle(self.make_file('other', b'other'))
+
+    def test_loader_uses_compiled_code(self):
+        environment = Environment(loader=BundleLoader(self.write()))
+
+        with patch.object(environment, 'compile',
+                          wraps=environment.compile) as mock_compile:
+            template = environment.get_template('{{PROJECT_NAME}}/a.txt')
+            self.assertEqual(template.render(b='foo'), 'Hello foo')
+
+        # Only the template packed without code is compiled
+        mock_compile.assert_called_once_with(
+            '{% extends "base.txt" %}{% block a %}{{ b }}{% endblock %}',
+            '{{PROJECT_NAME}}/a.txt', '{{PROJECT_NAME}}/a.txt')
+        with self.assertRaises(TemplateNotFound):
+            environment.get_template('missing.txt')
+
+
+class TestPack(BaseTestCase):
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.exceptions.puts',
+            'facio.pack.Pack.out',
+            'facio.pack.Pack.warning',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.origin = os.path.join(self.directory, 'origin')
+        self.path = os.path.join(self.directory, 'template.faciopack')
+        files = {
+            '{{PROJECT_NAME}}/settings.py': b'{{ PROJECT_NAME }}',
+            'bad.txt': b'{% if %}',
+            'logo.png': b'{{ PROJECT_NAME }}',
+            'fixture.db': b'SQLite format 3\x00{{ PROJECT_NAME }}',
+            'plain.txt': b'plain',
+            '.git/HEAD': b'ref',
+        }
+        for name, contents in files.items():
+            path = os.path.join(self.origin, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as handler:
+                handler.write(contents)
+
+    def test_pack(self):
+        Pack(Template(self.origin)).run(self.path)
+
+        bundle = TemplateBundle(self.path)
+        self.assertEqual([(e['name'], e['kind'], e['rename'])
+                          for e in bundle.entries], [
+            ('{{PROJECT_NAME}}', DIRECTORY, True),
+            ('bad.txt', RENDERED, False),
+            ('fixture.db', BINARY, False),
+            ('logo.png', COPIED, False),
+            ('plain.txt', UNMARKED, False),
+            ('{{PROJECT_NAME}}/settings.py', RENDERED, False)])
+        self.assertIsNone(bundle.get_code(bundle.index['bad.txt']))
+        self.assertIsNotNone(bundle.get_code(
+            bundle.index['{{PROJECT_NAME}}/settings.py']))
+        self.mocked_facio_pack_Pack_out.assert_called_with(
+            'Packed 5 files, 1 compiled')
+        self.assertTrue(self.mocked_facio_pack_Pack_warning.called)
+
+    @patch('sys.exit')
+    def test_pack_requires_directory(self, mock_exit):
+        with self.assertRaises(FacioException):
+            Pack(Template(self.path)).run(self.path)
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Only template directories and git+ or hg+ templates can '
+            'be packed')
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_cache
+   :synopsis: Tests for the Facio cache module.
+"""
+
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from facio.cache import (BytecodeCache, MirrorCache,
+                         get_default_cache_directory)
+from jinja2 import DictLoader, Environment
+from mock import MagicMock, patch
+
+from . import BaseTestCase
+
+
+class TestDefaultCacheDirectory(BaseTestCase):
+
+    @patch.dict('os.environ', {'XDG_CACHE_HOME': '/foo/cache'})
+    def test_xdg_cache_home(self):
+        self.assertEqual(get_default_cache_directory(), '/foo/cache/facio')
+
+    @patch.dict('os.environ', {}, clear=True)
+    @patch('os.path.expanduser', side_effect=lambda p: p.replace('~', '/bar'))
+    def test_home_cache(self, mock_expanduser):
+        self.assertEqual(get_default_cache_directory(), '/bar/.cache/facio')
+
+
+class TestBytecodeCache(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def get_environment(self, cache, templates):
+        return Environment(loader=DictLoader(templates), bytecode_cache=cache)
+
+    def test_keyed_by_name_and_content(self):
+        cache = BytecodeCache(self.directory, 1024 * 1024)
+        templates = {
+            'a.txt': 'Hello {{ foo }}',
+            'b/c.txt': 'Hello {{ foo }}',
+        }
+
+        self.get_environment(cache, templates).get_template('a.txt')
+        self.get_environment(cache, templates).get_template('a.txt')
+        self.get_environment(cache, templates).get_template('b/c.txt')
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_keyed_by_environment_settings(self):
+        cache = BytecodeCache(self.directory, 1024 * 1024)
+        templates = {'a.txt': '{{ foo }} [[ foo ]]'}
+        self.get_environment(cache, templates).get_template('a.txt')
+
+        environment = Environment(loader=DictLoader(templates),
+                                  bytecode_cache=cache,
+                                  variable_start_string='[[',
+                                  variable_end_string=']]')
+        template = environment.get_template('a.txt')
+
+        self.assertEqual(template.render(foo='bar'), '{{ foo }} bar')
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_compiled_template_loaded_from_cache(self):
+        cache = BytecodeCache(self.directory, 1024 * 1024)
+        self.get_environment(cache, {'a.txt': '{{ foo }}'}).get_template(
+            'a.txt')
+
+        environment = self.get_environment(cache, {'a.txt': '{{ foo }}'})
+        with patch.object(environment, 'compile') as mock_compile:
+            template = environment.get_template('a.txt')
+
+        self.assertFalse(mock_compile.called)
+        self.assertEqual(template.render(foo='bar'), 'bar')
+
+    def test_least_recently_used_evicted(self):
+        cache = BytecodeCache(self.directory, 1024 * 1024)
+        environment = self.get_environment(cache, {
+            'a.txt': '{{ a }}',
+            'b.txt': '{{ b }}',
+        })
+        environment.get_template('a.txt')
+        environment.get_template('b.txt')
+        a, b = sorted(cache.get_entries(), key=lambda e: e[2])
+        os.utime(a[2], (1, 1))
+        os.utime(b[2], (2, 2))
+
+        cache.max_size = b[1]
+        cache.prune()
+
+        self.assertEqual([e[2] for e in cache.get_entries()], [b[2]])
+        self.assertEqual(cache.size, b[1])
+
+    def test_unwritable_directory_ignored(self):
+        cache = BytecodeCache(os.path.join(self.directory, 'file'), 1024)
+        open(os.path.join(self.directory, 'file'), 'w').close()
+        environment = self.get_environment(cache, {'a.txt': '{{ a }}'})
+
+        template = environment.get_template('a.txt')
+
+        self.assertEqual(template.render(a=1), '1')
+
+
+class TestMirrorCache(BaseTestCase):
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.base.puts',
+            'facio.cache.MirrorCache.out',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def get_vcs(self, origin='git+/foo/bar'):
+        def clone(directory):
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'file'), 'w') as handler:
+                handler.write('x' * 10)
+            return directory
+
+        vcs = MagicMock()
+        vcs.origin = origin
+        vcs.clone.side_effect = clone
+        vcs.is_immutable.return_value = False
+        return vcs
+
+    def test_clone_when_missing(self):
+        cache = MirrorCache(self.directory, 60, 1024)
+        vcs = self.get_vcs()
+
+        path = cache.checkout(vcs)
+        cache.release(path)
+
+        vcs.clone.assert_called_once_with(path)
+        self.assertFalse(vcs.update.called)
+        self.assertEqual(path, os.path.join(self.directory,
+                                            cache.get_key('git+/foo/bar')))
+        with open(path + '.size') as handler:
+            self.assertEqual(handler.read(), '10')
+
+    def test_fresh_mirror_reused(self):
+        cache = MirrorCache(self.directory, 60, 1024)
+        vcs = self.get_vcs()
+        cache.release(cache.checkout(vcs))
+
+        cache.release(cache.checkout(vcs))
+
+        self.assertEqual(vcs.clone.call_count, 1)
+        self.assertFalse(vcs.update.called)
+
+    def test_stale_mirror_fetched(self):
+        cache = MirrorCache(self.directory, 60, 1024)
+        vcs = self.get_vcs()
+        path = cache.checkout(vcs)
+        cache.release(path)
+        os.utime(path + '.fetched', (time.time() - 61, time.time() - 61))
+
+        cache.release(cache.checkout(vcs))
+
+        vcs.update.assert_called_once_with(path)
+        self.assertFalse(cache.is_stale(path))
+
+    def test_immutable_mirror_never_fetched(self):
+        cache = MirrorCache(self.directory, 0, 1024)
+        vcs = self.get_vcs()
+        vcs.is_immutable.return_value = True
+        cache.release(cache.checkout(vcs))
+
+        cache.release(cache.checkout(vcs, force=True))
+
+        self.assertFalse(vcs.update.called)
+
+    def test_force_fetch(self):
+        cache = MirrorCache(self.directory, 60, 1024)
+        vcs = self.get_vcs()
+        cache.release(cache.checkout(vcs))
+
+        path = cache.checkout(vcs, force=True)
+
+        vcs.update.assert_called_once_with(path)
+
+    def test_failed_clone_removed(self):
+        cache = MirrorCache(self.directory, 60, 1024)
+        vcs = self.get_vcs()
+        clone = vcs.clone.side_effect
+
+        def fail(directory):
+            clone(directory)
+            raise RuntimeError
+
+        vcs.clone.side_effect = fail
+
+        with self.assertRaises(RuntimeError):
+            cache.checkout(vcs)
+        self.assertFalse(os.path.exists(cache.get_path(vcs.origin)))
+
+    def test_checkout_holds_shared_lock(self):
+        cache = MirrorCache(self.directory, 60, 1024)
+        path = cache.checkout(self.get_vcs())
+
+        with open(path + '.lock', 'a') as handler:
+            fcntl.flock(handler.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+            with self.assertRaises((IOError, OSError)):
+                fcntl.flock(handler.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        cache.release(path)
+        with open(path + '.lock', 'a') as handler:
+            fcntl.flock(handler.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def test_fresh_mirror_read_concurrently(self):
+        vcs = self.get_vcs()
+        first = MirrorCache(self.directory, 3600, 1024)
+        path = first.checkout(vcs)
+        self.addCleanup(first.release, path)
+        second = MirrorCache(self.directory, 3600, 1024)
+        paths = []
+
+        # The first checkout still holds its lock, as while generating
+        reader = threading.Thread(target=lambda: paths.append(
+            second.checkout(vcs)))
+        reader.daemon = True
+        reader.start()
+        reader.join(5)
+
+        self.assertEqual(paths, [path])
+        second.release(path)
+        self.assertEqual(vcs.clone.call_count, 1)
+
+    def test_stale_mirror_waits_for_readers(self):
+        vcs = self.get_vcs()
+        first = MirrorCache(self.directory, 60, 1024)
+        path = first.checkout(vcs)
+        os.utime(path + '.fetched', (time.time() - 61, time.time() - 61))
+        second = MirrorCache(self.directory, 60, 1024)
+
+        updater = threading.Thread(target=second.checkout, args=(vcs, ))
+        updater.daemon = True
+        updater.start()
+        updater.join(0.2)
+        self.assertFalse(vcs.update.called)
+
+        first.release(path)
+        updater.join(5)
+        vcs.update.assert_called_once_with(path)
+        second.release(path)
+
+    def test_least_recently_used_evicted(self):
+        cache = MirrorCache(self.directory, 60, 25)
+        old = cache.checkout(self.get_vcs('git+/old'))
+        cache.release(old)
+        os.utime(old + '.lock', (1, 1))
+        used = cache.checkout(self.get_vcs('git+/used'))
+        cache.release(used)
+
+        new = cache.checkout(self.get_vcs('git+/new'))
+        cache.release(new)
+
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(used))
+        self.assertTrue(os.path.exists(new))
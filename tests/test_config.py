@@ -47,6 +47,81 @@ class TestCommandLintInterface(BaseTestCase):
 
         mock_validate.assert_called_with('foo')
 
+    @patch('facio.config.docopt')
+    @patch('facio.config.CommandLineInterface.validate_project_name')
+    def test_fetch_does_not_validate_project_name(
+            self,
+            mock_validate,
+            mock_docopt):
+        mock_docopt.return_value = {
+            'fetch': True,
+            '<project_name>': None
+        }
+
+        i = CommandLineInterface()
+        i.start()
+
+        self.assertFalse(mock_validate.called)
+
+    @patch('facio.config.docopt')
+    @patch('facio.config.CommandLineInterface.validate_project_name')
+    def test_pack_does_not_validate_project_name(
+            self,
+            mock_validate,
+            mock_docopt):
+        mock_docopt.return_value = {
+            'pack': True,
+            '<bundle>': 'foo.faciopack',
+            '<project_name>': None
+        }
+
+        i = CommandLineInterface()
+        i.start()
+
+        self.assertFalse(mock_validate.called)
+
+    @patch('facio.config.docopt')
+    @patch('facio.config.CommandLineInterface.validate_project_name')
+    def test_index_does_not_validate_project_name(
+            self,
+            mock_validate,
+            mock_docopt):
+        mock_docopt.return_value = {
+            'index': True,
+            '<project_name>': None
+        }
+
+        i = CommandLineInterface()
+        i.start()
+
+        self.assertFalse(mock_validate.called)
+
+    @patch('sys.argv', ['facio', 'new', 'fetch', '--jobs', '2'])
+    def test_new_creates_project_named_after_command(self):
+        i = CommandLineInterface()
+        i.start()
+
+        self.assertTrue(i.arguments['new'])
+        self.assertFalse(i.arguments['fetch'])
+        self.assertEqual(i.arguments['<project_name>'], 'fetch')
+        self.assertEqual(i.arguments['--jobs'], '2')
+        self.assertEqual(self.mock_state.project_name, 'fetch')
+
+    @patch('sys.argv', ['facio', 'fetch'])
+    def test_command_names_are_reserved(self):
+        i = CommandLineInterface()
+        i.start()
+
+        self.assertTrue(i.arguments['fetch'])
+        self.assertIsNone(i.arguments['<project_name>'])
+
+    @patch('sys.exit')
+    def test_missing_project_name(self, mock_exit):
+        i = CommandLineInterface()
+
+        with self.assertRaises(FacioException):
+            i.validate_project_name(None)
+
     def test_valid_project_name(self):
         valid_names = [
             'this_is_valid',
@@ -310,3 +385,166 @@ class TestSettings(BaseTestCase):
         s = Settings(self.interface, self.config)
 
         self.assertEqual(s.render_ignore_globs(), ['foo=bar', 'baz=foo'])
+
+    def test_copy_strategy(self):
+        self.config.get.return_value = 'Hardlink'
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.copy_strategy(), 'hardlink')
+        self.config.get.assert_called_with('files', 'copy_strategy')
+
+    def test_copy_strategy_no_section(self):
+        self.config.get.side_effect = ConfigParser.NoSectionError('files')
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.copy_strategy(), 'auto')
+
+    def test_copy_strategy_unknown(self):
+        self.config.get.return_value = 'teleport'
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.copy_strategy(), 'auto')
+        self.mocked_facio_config_Settings_warning.assert_called_with(
+            'copy_strategy in [files] should be one of auto, hardlink, copy, '
+            'using auto')
+
+    def test_copy_threads(self):
+        self.config.getint.return_value = 0
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.copy_threads(), 1)
+        self.config.getint.assert_called_with('files', 'copy_threads')
+
+    def test_get_verbose(self):
+        arguments = PropertyMock(return_value={
+            '--verbose': True})
+        type(self.interface).arguments = arguments
+
+        s = Settings(self.interface, self.config)
+
+        self.assertTrue(s.get_verbose())
+
+    @patch('os.getcwd', return_value='/foo')
+    def test_get_bundle_path(self, mock_getcwd):
+        arguments = PropertyMock(return_value={
+            '<bundle>': 'bar.faciopack'})
+        type(self.interface).arguments = arguments
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_bundle_path(), '/foo/bar.faciopack')
+
+    def test_get_records_path_stdin(self):
+        arguments = PropertyMock(return_value={
+            '<records>': '-'})
+        type(self.interface).arguments = arguments
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_records_path(), '-')
+
+    def test_get_int(self):
+        self.config.getint.return_value = 3
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_int('foo', 'bar', 1), 3)
+
+    def test_get_int_default_not_a_number(self):
+        self.config.getint.side_effect = ValueError
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_int('foo', 'bar', 1), 1)
+        self.mocked_facio_config_Settings_warning.assert_called_with(
+            'bar in [foo] should be a number, using 1')
+
+    @patch('facio.config.get_default_cache_directory',
+           return_value='/foo/.cache/facio')
+    def test_default_cache_directory(self, mock_default):
+        self.config.get.side_effect = ConfigParser.NoSectionError('cache')
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.cache_directory(), '/foo/.cache/facio')
+
+    def test_cache_directory(self):
+        self.config.get.return_value = '/foo/cache'
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.cache_directory(), '/foo/cache')
+
+    def test_bytecode_cache_size(self):
+        self.config.getint.return_value = 2
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.bytecode_cache_size(), 2 * 1024 * 1024)
+        self.config.getint.assert_called_with('cache', 'bytecode_size')
+
+    def test_get_jobs(self):
+        arguments = PropertyMock(return_value={
+            '--jobs': '4'})
+        type(self.interface).arguments = arguments
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_jobs(), 4)
+
+    def test_get_jobs_default(self):
+        arguments = PropertyMock(return_value={
+            '--jobs': None})
+        type(self.interface).arguments = arguments
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_jobs(), 1)
+        self.assertEqual(s.get_jobs(default=4), 4)
+
+    def test_get_templates(self):
+        self.config.items.return_value = [('foo', 'git+/foo/bar')]
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_templates(), [('foo', 'git+/foo/bar')])
+        self.config.items.assert_called_with('template')
+
+    def test_get_templates_no_section(self):
+        self.config.items.side_effect = ConfigParser.NoSectionError('template')
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.get_templates(), [])
+
+    @patch('sys.exit')
+    def test_get_jobs_invalid(self, mock_exit):
+        arguments = PropertyMock(return_value={
+            '--jobs': '0'})
+        type(self.interface).arguments = arguments
+
+        s = Settings(self.interface, self.config)
+
+        with self.assertRaises(FacioException):
+            s.get_jobs()
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: --jobs must be a positive number')
+
+    def test_mirror_ttl(self):
+        self.config.getint.return_value = 3600
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.mirror_ttl(), 3600)
+        self.config.getint.assert_called_with('cache', 'mirror_ttl')
+
+    def test_mirror_cache_size_default(self):
+        self.config.getint.side_effect = ConfigParser.NoSectionError('cache')
+
+        s = Settings(self.interface, self.config)
+
+        self.assertEqual(s.mirror_cache_size(), 1024 * 1024 * 1024)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_fetch
+   :synopsis: Tests for the Facio fetch module.
+"""
+
+import os
+import shutil
+import tempfile
+
+from facio.cache import MirrorCache
+from facio.exceptions import FacioException
+from facio.fetch import Fetch
+from mock import call, patch
+
+from . import BaseTestCase
+
+
+class TestFetch(BaseTestCase):
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.exceptions.puts',
+            'facio.fetch.Fetch.out',
+            'facio.fetch.Fetch.success',
+            'facio.fetch.Fetch.error',
+            'facio.fetch.Fetch.warning',
+            'facio.cache.MirrorCache.out',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache = MirrorCache(self.directory, 3600, 1024 * 1024)
+
+    def clone(self, directory):
+        os.makedirs(directory)
+        return directory
+
+    def test_get_vcs(self):
+        instance = Fetch(self.cache)
+
+        found = instance.get_vcs([
+            ('django', 'git+/foo/django.git'),
+            ('local', '/foo/local'),
+            ('flask', 'hg+/foo/flask'),
+            ('django2', 'git+/foo/django.git'),
+        ])
+
+        self.assertEqual([(name, vcs.origin) for name, vcs in found], [
+            ('django', 'git+/foo/django.git'),
+            ('flask', 'hg+/foo/flask'),
+        ])
+        self.assertTrue(all(vcs.mirror_cache is self.cache
+                            for name, vcs in found))
+
+    @patch('facio.vcs.GitVCS.update')
+    @patch('facio.vcs.GitVCS.clone')
+    def test_run_fetches_every_template(self, mock_clone, mock_update):
+        mock_clone.side_effect = self.clone
+        instance = Fetch(self.cache, jobs=2)
+        templates = [('a', 'git+/foo/a.git'), ('b', 'git+/foo/b.git')]
+
+        self.assertEqual(instance.run(templates), [])
+        self.assertEqual(mock_clone.call_count, 2)
+
+        # Fresh mirrors are fetched again
+        instance.run(templates)
+        self.assertEqual(mock_update.call_count, 2)
+        self.assertEqual(self.cache.locks, {})
+
+    @patch('sys.exit')
+    @patch('facio.vcs.GitVCS.clone')
+    def test_run_failures_summarised(self, mock_clone, mock_exit):
+        def clone(directory):
+            if directory.endswith(self.cache.get_key('git+/foo/b.git')):
+                raise FacioException('Failed to clone git repository at '
+                                     '/foo/b.git')
+            return self.clone(directory)
+        mock_clone.side_effect = clone
+        instance = Fetch(self.cache)
+
+        with self.assertRaises(FacioException):
+            instance.run([('a', 'git+/foo/a.git'), ('b', 'git+/foo/b.git')])
+        self.mocked_facio_fetch_Fetch_error.assert_any_call(
+            'b: /foo/b.git: Failed to clone git repository at /foo/b.git')
+        # The clone error is only reported in the summary
+        self.assertNotIn(
+            call('Error: Failed to clone git repository at /foo/b.git'),
+            self.mocked_facio_exceptions_puts.call_args_list)
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Failed to fetch 1 templates')
+
+    def test_run_nothing_to_fetch(self):
+        instance = Fetch(self.cache)
+
+        self.assertEqual(instance.run([('local', '/foo/local')]), [])
+        self.mocked_facio_fetch_Fetch_warning.assert_called_once_with(
+            'No git+ or hg+ templates to fetch')
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_files
+   :synopsis: Tests for the Facio files module.
+"""
+
+import errno
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+
+from facio.files import (GlobMatcher, IgnoreMatcher, copy_file,
+                         copy_file_data, extract_tar_stream,
+                         has_template_markers, is_binary,
+                         translate_ignore_pattern, write_stream)
+from mock import patch
+
+from . import BaseTestCase
+
+
+class TestGlobMatcher(BaseTestCase):
+
+    def test_literal(self):
+        matcher = GlobMatcher(['.git', 'Thumbs.db'])
+
+        self.assertTrue(matcher.match('.git'))
+        self.assertFalse(matcher.match('.gitignore'))
+
+    def test_extension(self):
+        matcher = GlobMatcher(['*.png', '*.tar.gz'])
+
+        self.assertTrue(matcher.match('logo.png'))
+        self.assertTrue(matcher.match('release.tar.gz'))
+        self.assertFalse(matcher.match('logo.png.txt'))
+        self.assertFalse(matcher.match('release.gz'))
+
+    def test_glob(self):
+        matcher = GlobMatcher(['foo?.py', 'ba[rz].txt', 'test_*.py'])
+
+        self.assertTrue(matcher.match('foo1.py'))
+        self.assertTrue(matcher.match('baz.txt'))
+        self.assertTrue(matcher.match('test_foo.py'))
+        self.assertFalse(matcher.match('bat.txt'))
+        self.assertFalse(matcher.match('foo.py'))
+
+    def test_star(self):
+        self.assertTrue(GlobMatcher(['*']).match('anything'))
+
+    def test_empty(self):
+        self.assertFalse(GlobMatcher([]).match('foo'))
+
+    def test_filter(self):
+        matcher = GlobMatcher(['*.png', '.git', 'foo*'])
+
+        self.assertEqual(matcher.filter(['a.png', '.git', 'food', 'bar']),
+                         set(['a.png', '.git', 'food']))
+        self.assertEqual(matcher('/some/dir', ['a.png', 'bar']),
+                         set(['a.png']))
+
+
+class TestIsBinary(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as handler:
+            handler.write(data)
+        return path
+
+    def test_text(self):
+        path = self.write('index.html', b'<h1>{{ PROJECT_NAME }}</h1>')
+
+        self.assertFalse(is_binary(path))
+
+    def test_utf8_text(self):
+        path = self.write('README', u'Caf\xe9 {{ x }}'.encode('utf8'))
+
+        self.assertFalse(is_binary(path))
+
+    def test_empty(self):
+        path = self.write('__init__.py', b'')
+
+        self.assertFalse(is_binary(path))
+
+    def test_nul_byte(self):
+        path = self.write('foo.pyc', b'\x03\xf3\r\n\x00\x00\x00\x00c')
+
+        self.assertTrue(is_binary(path))
+
+    def test_magic_number(self):
+        path = self.write('manual.pdf', b'%PDF-1.4\n%\xe2\xe3\xcf\xd3')
+
+        self.assertTrue(is_binary(path))
+
+
+class TestHasTemplateMarkers(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, data):
+        path = os.path.join(self.directory, 'file')
+        with open(path, 'wb') as handler:
+            handler.write(data)
+        return path
+
+    def test_markers(self):
+        for data in [b'{{ foo }}', b'a {% if b %}{% endif %}', b'{# c #}']:
+            self.assertTrue(has_template_markers(self.write(data)))
+
+    def test_no_markers(self):
+        path = self.write(b'body { color: red; }\nvar a = {b: {}};')
+
+        self.assertFalse(has_template_markers(path))
+
+    def test_empty(self):
+        self.assertFalse(has_template_markers(self.write(b'')))
+
+
+class TestWriteStream(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_write_stream(self):
+        path = os.path.join(self.directory, 'file')
+
+        write_stream((u'\xe9{0}'.format(n) for n in range(100)), path, 10)
+
+        with open(path, 'rb') as handler:
+            self.assertEqual(
+                handler.read().decode('utf8'),
+                u''.join(u'\xe9{0}'.format(n) for n in range(100)))
+
+
+class TestIgnoreMatcher(BaseTestCase):
+
+    def test_translate(self):
+        self.assertEqual(translate_ignore_pattern('*.py[co]'),
+                         r'^(?:.*/)?[^/]*\.py[co]$')
+        self.assertEqual(translate_ignore_pattern('/build'), '^build$')
+        self.assertEqual(translate_ignore_pattern('a/**/b'),
+                         '^a/(?:.*/)?b$')
+
+    def test_globs_match_names(self):
+        matcher = IgnoreMatcher(['.git', '*.pyc'])
+
+        self.assertTrue(matcher.is_ignored('a/b/.git', True))
+        self.assertTrue(matcher.is_ignored('a/b.pyc'))
+        self.assertFalse(matcher.is_ignored('a/b.py'))
+
+    def test_unanchored(self):
+        matcher = IgnoreMatcher([], ['*.log', 'tmp'])
+
+        self.assertTrue(matcher.is_ignored('debug.log'))
+        self.assertTrue(matcher.is_ignored('a/b/debug.log'))
+        self.assertTrue(matcher.is_ignored('a/tmp', True))
+
+    def test_anchored(self):
+        matcher = IgnoreMatcher([], ['/build', 'docs/*.tmp'])
+
+        self.assertTrue(matcher.is_ignored('build', True))
+        self.assertFalse(matcher.is_ignored('src/build', True))
+        self.assertTrue(matcher.is_ignored('docs/a.tmp'))
+        self.assertFalse(matcher.is_ignored('docs/a/b.tmp'))
+        self.assertFalse(matcher.is_ignored('src/docs/a.tmp'))
+
+    def test_double_star(self):
+        matcher = IgnoreMatcher([], ['docs/**/*.tmp', 'cache/**'])
+
+        self.assertTrue(matcher.is_ignored('docs/a.tmp'))
+        self.assertTrue(matcher.is_ignored('docs/a/b/c.tmp'))
+        self.assertTrue(matcher.is_ignored('cache/a/b'))
+        self.assertFalse(matcher.is_ignored('cache', True))
+
+    def test_directory_only(self):
+        matcher = IgnoreMatcher([], ['build/'])
+
+        self.assertTrue(matcher.is_ignored('src/build', True))
+        self.assertFalse(matcher.is_ignored('src/build', False))
+
+    def test_negation(self):
+        matcher = IgnoreMatcher(['*.pyc'], [
+            '*.log', '!keep.log', '!vendored.pyc'])
+
+        self.assertTrue(matcher.is_ignored('debug.log'))
+        self.assertFalse(matcher.is_ignored('a/keep.log'))
+        self.assertFalse(matcher.is_ignored('vendored.pyc'))
+        self.assertTrue(matcher.is_ignored('other.pyc'))
+
+    def test_comments_blank_lines_and_escapes(self):
+        matcher = IgnoreMatcher([], [
+            '# comment', '', '   ', '\\#notes', '\\!important', 'trail  '])
+
+        self.assertFalse(matcher.is_ignored('# comment'))
+        self.assertTrue(matcher.is_ignored('#notes'))
+        self.assertTrue(matcher.is_ignored('!important'))
+        self.assertTrue(matcher.is_ignored('trail'))
+
+    def test_excludes_checks_parent_directories(self):
+        matcher = IgnoreMatcher([], ['node_modules/', '!node_modules/a.js'])
+
+        self.assertTrue(matcher.excludes('node_modules/a.js'))
+        self.assertFalse(matcher.excludes('src/a.js'))
+
+    def test_filter(self):
+        matcher = IgnoreMatcher(['.git'], ['/build/', 'src/*.log'])
+
+        self.assertEqual(matcher.filter('', ['.git', 'build', 'src'],
+                                        ['build.txt']),
+                         set(['.git', 'build']))
+        self.assertEqual(matcher.filter('src', ['build'], ['a.log']),
+                         set(['a.log']))
+
+
+class TestExtractTarStream(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.destination = os.path.join(self.directory, 'project')
+
+    def make_archive(self, members):
+        stream = io.BytesIO()
+        archive = tarfile.open(fileobj=stream, mode='w')
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                archive.addfile(info)
+            else:
+                info.size = len(data)
+                info.mode = 0o755
+                archive.addfile(info, io.BytesIO(data))
+        archive.close()
+        stream.seek(0)
+        return stream
+
+    def test_extract(self):
+        stream = self.make_archive([
+            ('foo', None),
+            ('foo/bar.txt', b'bar'),
+            ('setup.py', b'setup'),
+        ])
+
+        count = extract_tar_stream(stream, self.destination)
+
+        self.assertEqual(count, 2)
+        path = os.path.join(self.destination, 'foo', 'bar.txt')
+        with open(path, 'rb') as handler:
+            self.assertEqual(handler.read(), b'bar')
+        self.assertTrue(os.access(path, os.X_OK))
+
+    def test_extract_ignore(self):
+        stream = self.make_archive([
+            ('.git/HEAD', b'ref'),
+            ('foo/a.pyc', b'a'),
+            ('foo/a.py', b'a'),
+        ])
+
+        extract_tar_stream(stream, self.destination,
+                           ignore=IgnoreMatcher(['.git', '*.pyc']))
+
+        self.assertEqual(os.listdir(self.destination), ['foo'])
+        self.assertEqual(os.listdir(os.path.join(self.destination, 'foo')),
+                         ['a.py'])
+
+    def test_extract_ignored_directory(self):
+        stream = self.make_archive([
+            ('node_modules/a/b.js', b'b'),
+            ('src/node_modules', b'file'),
+            ('src/a.py', b'a'),
+        ])
+
+        extract_tar_stream(stream, self.destination,
+                           ignore=IgnoreMatcher([], ['node_modules/']))
+
+        self.assertEqual(os.listdir(self.destination), ['src'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.destination,
+                                                        'src'))),
+                         ['a.py', 'node_modules'])
+
+    def test_extract_prefix(self):
+        stream = self.make_archive([
+            ('template/django/a.py', b'a'),
+            ('template/flask/b.py', b'b'),
+        ])
+
+        extract_tar_stream(stream, self.destination,
+                           prefix='template/django')
+
+        self.assertEqual(os.listdir(self.destination), ['a.py'])
+
+    def test_extract_skips_parent_paths(self):
+        stream = self.make_archive([('../evil', b'evil'), ('a.py', b'a')])
+
+        extract_tar_stream(stream, self.destination)
+
+        self.assertEqual(os.listdir(self.destination), ['a.py'])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'evil')))
+
+
+class TestCopyFile(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.source = os.path.join(self.directory, 'source')
+        self.destination = os.path.join(self.directory, 'destination')
+        with open(self.source, 'wb') as handler:
+            handler.write(b'x' * 100000)
+        os.chmod(self.source, 0o750)
+        os.utime(self.source, (1000000000, 1000000000))
+
+    def assertCopied(self):
+        with open(self.destination, 'rb') as handler:
+            self.assertEqual(handler.read(), b'x' * 100000)
+        stat = os.stat(self.destination)
+        self.assertEqual(stat.st_mode & 0o777, 0o750)
+        self.assertEqual(int(stat.st_mtime), 1000000000)
+
+    def test_copy_auto(self):
+        copy_file(self.source, self.destination)
+
+        self.assertCopied()
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+
+    def test_copy_strategy_copy(self):
+        copy_file(self.source, self.destination, 'copy', link=True)
+
+        self.assertCopied()
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+
+    def test_hardlink(self):
+        copy_file(self.source, self.destination, 'hardlink', link=True)
+
+        self.assertTrue(os.path.samefile(self.source, self.destination))
+
+    def test_hardlink_only_linkable_files(self):
+        copy_file(self.source, self.destination, 'hardlink')
+
+        self.assertCopied()
+        self.assertFalse(os.path.samefile(self.source, self.destination))
+
+    @patch('facio.files.reflink', return_value=False)
+    def test_kernel_copy_unsupported(self, mock_reflink):
+        error = OSError(errno.EXDEV, 'Invalid cross-device link')
+        with patch('os.copy_file_range', side_effect=error, create=True):
+            with patch('os.sendfile', side_effect=error, create=True):
+                copy_file(self.source, self.destination)
+
+        self.assertCopied()
+
+    @patch('facio.files.sys.platform', 'darwin')
+    def test_copy_file_data_no_sendfile_between_files(self):
+        error = OSError(errno.ENOTSOCK, 'Socket operation on non-socket')
+        with patch('os.copy_file_range', None, create=True), \
+                patch('os.sendfile', side_effect=error,
+                      create=True) as mock_sendfile:
+            copy_file_data(self.source, self.destination)
+
+        self.assertFalse(mock_sendfile.called)
+        with open(self.destination, 'rb') as handler:
+            self.assertEqual(handler.read(), b'x' * 100000)
+
+    @patch('facio.files.sys.platform', 'linux')
+    def test_copy_file_data_any_kernel_error(self):
+        error = OSError(errno.ENOTSOCK, 'Socket operation on non-socket')
+        with patch('os.copy_file_range', None, create=True), \
+                patch('os.sendfile', side_effect=error, create=True):
+            copy_file_data(self.source, self.destination)
+
+        with open(self.destination, 'rb') as handler:
+            self.assertEqual(handler.read(), b'x' * 100000)
+
+    def test_copy_file_data_empty_file(self):
+        open(self.source, 'w').close()
+
+        copy_file_data(self.source, self.destination)
+
+        self.assertEqual(os.path.getsize(self.destination), 0)
@@ -5,7 +5,10 @@
    :synopsis: Tests for the facio hooks module.
 """
 
-from facio.hooks import Hook
+import types
+
+from facio.hooks import Hook, accepts_context
+from facio.state import HOOK_FAILED, HOOK_SUCCEEDED, Context, state
 from mock import MagicMock, mock_open, patch
 from random import choice
 
@@ -263,7 +266,7 @@ class HookTest(BaseTestCase):
         mock = import_module_mock.stop()
         self.assertTrue(module.foo.called)
         self.mocked_facio_hooks_Hook_warning.assert_called_with(
-            'Exeption caught in module: \'Failed lookup\' line: 117')
+            'Exeption caught in module: \'Failed lookup\' line: 181')
 
     @patch('facio.hooks.Hook.load', return_value=True)
     def test_store_hooks_states(self, return_value=True):
@@ -278,7 +281,7 @@ class HookTest(BaseTestCase):
             i.run_module(path)
 
             self.assertTrue(module.run.called)
-            self.assertEqual(i.calls[-1:][0].get(path),
+            self.assertEqual(list(i.calls)[-1]['result'],
                              module.run.return_value)
 
         mock_import = import_module_mock.stop()
@@ -343,3 +346,53 @@ class HookTest(BaseTestCase):
         self.assertTrue(i.has_run('thing.foo.bar'))
 
         open_mock.stop()
+
+    def test_accepts_context(self):
+        def run(context=None):
+            pass
+
+        self.assertTrue(accepts_context(run))
+        self.assertFalse(accepts_context(lambda: None))
+        self.assertFalse(accepts_context(MagicMock()))
+
+    @patch('facio.hooks.Hook.import_module')
+    def test_run_module_context(self, mock_import):
+        context = Context()
+        context.set_project_name('foo')
+
+        passed = types.ModuleType('passed')
+        passed.run = lambda context=None: context.get_project_name()
+        shimmed = types.ModuleType('shimmed')
+        shimmed.run = lambda: state.get_project_name()
+
+        i = Hook(context=context)
+        mock_import.return_value = passed
+        self.assertEqual(i.run_module('foo.passed'), 'foo')
+        mock_import.return_value = shimmed
+        self.assertEqual(i.run_module('foo.shimmed'), 'foo')
+
+        self.assertEqual(context.get_hook_call('foo.passed'), 'foo')
+        self.assertEqual(context.get_hook_call('foo.shimmed'), 'foo')
+        self.assertEqual(state.get_hook_call('foo.passed'), None)
+
+    @patch('facio.hooks.Hook.import_module')
+    def test_run_module_records_status(self, mock_import):
+        failing = types.ModuleType('failing')
+        failing.run = lambda: {}['missing']
+        passing = types.ModuleType('passing')
+        passing.run = lambda: 'foo'
+
+        i = Hook(context=Context())
+        mock_import.return_value = failing
+        i.run_module('foo.failing')
+        mock_import.return_value = passing
+        i.run_module('foo.passing')
+
+        failed = i.calls.get('foo.failing')
+        passed = i.context.get_hook_calls().get('foo.passing')
+        self.assertEqual(failed['status'], HOOK_FAILED)
+        self.assertEqual(passed['status'], HOOK_SUCCEEDED)
+        self.assertEqual(passed['order'], 1)
+        self.assertTrue(passed['seconds'] >= 0)
+        self.assertEqual(i.has_run('foo.passing'), 'foo')
+        self.assertFalse(i.has_run('foo.missing'))
@@ -7,7 +7,7 @@
 
 
 from facio.hooks.django.secret import GenerateDjangoSecretKey, run
-from facio.state import state
+from facio.state import Context, state
 from mock import patch
 from six.moves import builtins
 
@@ -50,3 +50,16 @@ class TestDjangoSecretKey(BaseTestCase):
         self.assertEqual(key, 'foobarbaz')
         self.assertEqual(state.context_variables['DJANGO_SECRET_KEY'],
                          'foobarbaz')
+
+    @patch('facio.hooks.django.secret.GenerateDjangoSecretKey.generate')
+    def test_run_context(self, mock_generate):
+        mock_generate.return_value = 'foobarbaz'
+        state.reset()
+        context = Context()
+
+        run(context=context)
+
+        self.assertEqual(context.get_context_variable('DJANGO_SECRET_KEY'),
+                         'foobarbaz')
+        self.assertEqual(state.get_context_variable('DJANGO_SECRET_KEY'),
+                         None)
@@ -10,6 +10,7 @@ import sys
 
 from facio.hooks.python.setup import Setup, run as setup_run
 from facio.hooks.python.virtualenv import Virtualenv, run as venv_run
+from facio.state import HookCalls
 from mock import MagicMock, mock_open, patch, PropertyMock
 
 from .. import BaseTestCase
@@ -175,9 +176,9 @@ class TestSetup(BaseTestCase):
         self.assertEqual(sys.executable, path)
 
     def test_get_default_path_virtualenv(self):
-        self.mock_state.hook_calls = [(
-            'facio.hooks.python.virtualenv', '/foo/bar'
-        )]
+        self.mock_state.hook_calls = HookCalls()
+        self.mock_state.hook_calls.add('facio.hooks.python.virtualenv',
+                                       '/foo/bar')
 
         i = Setup()
         path = i.get_default_path_to_python()
@@ -222,15 +223,15 @@ class TestSetup(BaseTestCase):
     @patch('facio.base.input')
     @patch('facio.hooks.python.setup.Setup.get_path_to_python')
     @patch('facio.hooks.python.setup.subprocess.Popen')
-    @patch('facio.state.pwd')
+    @patch('facio.state.getcwd')
     def test_run_zero_exit_code(
             self,
-            mock_pwd,
+            mock_getcwd,
             mock_popen,
             mock_get_path_to_python,
             mock_input,
             mock_chdir):
-        mock_pwd.return_value = '/bar'
+        mock_getcwd.return_value = '/bar'
         mock_get_path_to_python.return_value = '/foo/python'
         mock_input.return_value = 'develop'
 
@@ -255,16 +256,16 @@ class TestSetup(BaseTestCase):
     @patch('facio.base.input')
     @patch('facio.hooks.python.setup.Setup.get_path_to_python')
     @patch('facio.hooks.python.setup.subprocess.Popen')
-    @patch('facio.state.pwd')
+    @patch('facio.state.getcwd')
     def test_run_non_zero_exit_code(
             self,
-            mock_pwd,
+            mock_getcwd,
             mock_popen,
             mock_get_path_to_python,
             mock_input,
             mock_chdir,
             mock_log_errors):
-        mock_pwd.return_value = '/bar'
+        mock_getcwd.return_value = '/bar'
         mock_get_path_to_python.return_value = '/foo/python'
         mock_input.return_value = 'develop'
 
@@ -288,15 +289,15 @@ class TestSetup(BaseTestCase):
     @patch('facio.base.input')
     @patch('facio.hooks.python.setup.Setup.get_path_to_python')
     @patch('facio.hooks.python.setup.subprocess.Popen')
-    @patch('facio.state.pwd')
+    @patch('facio.state.getcwd')
     def test_run(
             self,
-            mock_pwd,
+            mock_getcwd,
             mock_popen,
             mock_get_path_to_python,
             mock_input,
             mock_chdir):
-        mock_pwd.return_value = '/bar'
+        mock_getcwd.return_value = '/bar'
         mock_get_path_to_python.return_value = '/foo/python'
         mock_input.return_value = 'develop'
 
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+"""
+.. module:: tests.test_index
+   :synopsis: Tests for the Facio index module.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from facio.index import INDEX_FILE_NAME, TemplateIndex
+from facio.template import BINARY, COPIED, RENDERED, UNMARKED, Template
+
+from . import BaseTestCase
+
+
+class TestTemplateIndex(BaseTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.write('{{PROJECT_NAME}}/settings.py', b'{{ PROJECT_NAME }}')
+        self.write('logo.png', b'{{ PROJECT_NAME }}')
+        self.write('fixture.db', b'SQLite format 3\x00{{ PROJECT_NAME }}')
+        self.write('plain.txt', b'plain')
+        self.write('.git/HEAD', b'ref')
+        self.template = Template(self.directory)
+        self.path = os.path.join(self.directory, INDEX_FILE_NAME)
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as handler:
+            handler.write(contents)
+
+    def build(self):
+        index = TemplateIndex(self.path)
+        index.build(self.template)
+        index.save()
+        loaded = TemplateIndex(self.path)
+        loaded.load()
+        return loaded
+
+    def test_build(self):
+        index = self.build()
+
+        self.assertEqual([(e['name'], e.get('kind'), e['rename'])
+                          for e in index.entries], [
+            ('', None, False),
+            ('fixture.db', BINARY, False),
+            ('logo.png', COPIED, False),
+            ('plain.txt', UNMARKED, False),
+            ('{{PROJECT_NAME}}', None, True),
+            ('{{PROJECT_NAME}}/settings.py', RENDERED, False)])
+        self.assertEqual(index.entries[0]['ignored'], ['.git'])
+        self.assertEqual(index.entries[3]['size'], 5)
+        self.assertEqual(index.entries[3]['sha1'],
+                         hashlib.sha1(b'plain').hexdigest())
+
+    def test_build_follows_symlinked_directories(self):
+        shared = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, shared)
+        with open(os.path.join(shared, 'a.txt'), 'wb') as handler:
+            handler.write(b'a')
+        os.symlink(shared, os.path.join(self.directory, 'lib'))
+
+        index = self.build()
+
+        self.assertIn('lib/a.txt', [e['name'] for e in index.entries])
+        self.assertTrue(index.is_valid(self.template))
+
+    def test_is_valid(self):
+        self.assertTrue(self.build().is_valid(self.template))
+
+    def test_file_added(self):
+        index = self.build()
+        self.write('{{PROJECT_NAME}}/new.py', b'new')
+        os.utime(os.path.join(self.directory, '{{PROJECT_NAME}}'),
+                 (1, 1))
+
+        self.assertFalse(index.is_valid(self.template))
+
+    def test_ignored_file_added(self):
+        index = self.build()
+        self.write('.git/ORIG_HEAD', b'ref')
+
+        self.assertTrue(index.is_valid(self.template))
+
+    def test_file_removed(self):
+        index = self.build()
+        os.remove(os.path.join(self.directory, 'plain.txt'))
+
+        self.assertFalse(index.is_valid(self.template))
+
+    def test_file_changed(self):
+        index = self.build()
+        self.write('plain.txt', b'{{ a }}')
+        os.utime(os.path.join(self.directory, 'plain.txt'), (1, 1))
+
+        self.assertFalse(index.is_valid(self.template))
+
+    def test_file_touched(self):
+        index = self.build()
+        os.utime(os.path.join(self.directory, 'plain.txt'), (1, 1))
+
+        self.assertTrue(index.is_valid(self.template))
+
+    def test_settings_changed(self):
+        index = self.build()
+        self.template.update_render_ignore_globs(['*.txt'])
+
+        self.assertFalse(index.is_valid(self.template))
+
+    def test_load_invalid(self):
+        with open(self.path, 'w') as handler:
+            handler.write('[]')
+
+        with self.assertRaises(ValueError):
+            TemplateIndex(self.path).load()
@@ -5,7 +5,13 @@
    :synopsis: Tests for facios state module
 """
 
-from facio.state import State
+import subprocess
+import sys
+import threading
+import unittest
+
+from facio.state import (HOOK_FAILED, HOOK_SUCCEEDED, Context, State,
+                         count_processes, get_context)
 from mock import patch
 from six.moves import builtins
 
@@ -36,20 +42,31 @@ class TestState(BaseTestCase):
 
         self.assertEqual(state.get_project_name(), 'foo')
 
-    @patch('facio.state.pwd', return_value='/foo')
-    def test_return_current_working_dir(self, mock_pwd):
+    @patch('facio.state.getcwd', return_value='/foo')
+    def test_return_current_working_dir(self, mock_getcwd):
         state = State()
         state.set_project_name('foo')
 
         self.assertEqual(state.get_working_directory(), '/foo')
 
-    @patch('facio.state.pwd', return_value='/bar')
-    def test_return_project_root(self, mock_pwd):
+    @patch('facio.state.getcwd', return_value='/bar')
+    def test_return_project_root(self, mock_getcwd):
         state = State()
         state.set_project_name('foo')
 
         self.assertEqual(state.get_project_root(), '/bar/foo')
 
+    @patch('facio.state.getcwd', return_value='/bar')
+    def test_working_directory_looked_up_once(self, mock_getcwd):
+        state = State()
+        state.set_project_name('foo')
+        state.get_project_root()
+        state.set_project_name('baz')
+
+        self.assertEqual(state.get_project_root(), '/bar/baz')
+        self.assertEqual(state.get_working_directory(), '/bar')
+        self.assertEqual(mock_getcwd.call_count, 1)
+
     def test_update_context_variables(self):
         state = State()
 
@@ -79,14 +96,38 @@ class TestState(BaseTestCase):
         self.assertEqual(state.get_context_variable('PROJECT_NAME'), 'foo')
         self.assertNotEqual(state.get_context_variable('not_created'), 'foo')
 
+    def test_reset(self):
+        state = State()
+        state.set_project_name('foo')
+        state.update_context_variables({'a': 1})
+        state.save_hook_call('foo.bar', 'baz')
+
+        state.reset({'b': 2})
+
+        self.assertEqual(state.get_project_name(), None)
+        self.assertEqual(state.get_context_variables(), {'b': 2})
+        self.assertEqual(state.get_hook_call('foo.bar'), None)
+
+    def test_set_working_directory(self):
+        state = State()
+
+        state.set_project_name('bar')
+        state.set_working_directory('/foo')
+
+        self.assertEqual(state.get_working_directory(), '/foo')
+        self.assertEqual(state.get_project_root(), '/foo/bar')
+
     def test_save_hook_call(self):
         state = State()
 
         state.save_hook_call('foo.bar', 'baz')
         state.save_hook_call('baz.foo', 'bar')
-        calls = state.save_hook_call('foo.bar', 'baz')
+        calls = state.save_hook_call('foo.bar', 'qux')
 
-        self.assertEqual(calls, [('foo.bar', 'baz'), ('baz.foo', 'bar')])
+        self.assertEqual(calls.items(), [('foo.bar', 'baz'),
+                                         ('baz.foo', 'bar')])
+        self.assertEqual(calls.get('baz.foo')['order'], 1)
+        self.assertEqual(calls.get('baz.foo')['status'], HOOK_SUCCEEDED)
 
     def test_get_hook_call(self):
         state = State()
@@ -96,3 +137,83 @@ class TestState(BaseTestCase):
 
         self.assertEqual(state.get_hook_call('foo.bar'), 'baz')
         self.assertEqual(state.get_hook_call('baz.foo'), 'bar')
+
+    def test_save_failed_hook_call(self):
+        state = State()
+
+        state.save_hook_call('foo.bar', None, status=HOOK_FAILED, seconds=1.5)
+        call = state.get_hook_calls().get('foo.bar')
+
+        self.assertEqual(call, {
+            'path': 'foo.bar',
+            'order': 0,
+            'status': HOOK_FAILED,
+            'seconds': 1.5,
+            'result': None,
+        })
+        self.assertTrue('foo.bar' in state.get_hook_calls())
+        self.assertEqual(state.get_hook_call('foo.bar'), None)
+
+    def test_context_kept_apart(self):
+        state = State()
+        state.set_project_name('foo')
+        context = Context({'a': 'b'})
+        context.set_project_name('bar')
+
+        self.assertEqual(state.get_project_name(), 'foo')
+        self.assertEqual(context.get_context_variables(), {
+            'a': 'b', 'PROJECT_NAME': 'bar'})
+        self.assertEqual(context.get_hook_call('foo.bar'), None)
+
+    def test_entered_context(self):
+        state = State()
+        state.set_project_name('foo')
+        context = Context()
+
+        with context:
+            self.assertEqual(get_context(), context)
+            state.set_project_name('bar')
+            with context:
+                state.save_hook_call('foo.bar', 'baz')
+            self.assertEqual(state.get_project_name(), 'bar')
+
+        self.assertEqual(get_context(), None)
+        self.assertEqual(state.get_project_name(), 'foo')
+        self.assertEqual(state.get_hook_call('foo.bar'), None)
+        self.assertEqual(context.get_project_name(), 'bar')
+        self.assertEqual(context.get_hook_call('foo.bar'), 'baz')
+
+    def test_context_per_thread(self):
+        state = State()
+        names = {}
+
+        def generate(name):
+            with Context():
+                state.set_project_name(name)
+                started.wait()
+                names[name] = state.get_project_name()
+
+        started = threading.Event()
+        threads = [threading.Thread(target=generate, args=(name, ))
+                   for name in ('foo', 'bar')]
+        for thread in threads:
+            thread.start()
+        started.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(names, {'foo': 'foo', 'bar': 'bar'})
+
+    @unittest.skipIf(not hasattr(sys, 'addaudithook'),
+                     'Counting processes needs audit hooks')
+    def test_count_processes(self):
+        state = State()
+        state.reset()
+        context = Context()
+
+        self.assertTrue(count_processes())
+        with context:
+            subprocess.call([sys.executable, '-c', ''])
+
+        self.assertEqual(context.get_process_count(), 1)
+        self.assertEqual(state.get_process_count(), 0)
@@ -5,14 +5,26 @@
    :synopsis: Unit tests for template module
 """
 
+import multiprocessing
+import os
+import shutil
 import six
+import stat
+import subprocess
+import tarfile
+import tempfile
+import unittest
 
+from facio.archive import RepositoryArchive
 from facio.exceptions import FacioException
+from facio.index import INDEX_FILE_NAME, TemplateIndex
+from facio.pack import Pack
 from facio.template import Template
 from mock import MagicMock, mock_open, PropertyMock, patch
 from shutil import Error as ShutilError
 
 from . import BaseTestCase
+from .test_archive import make_tar, make_zip
 
 
 class TemplateTests(BaseTestCase):
@@ -82,6 +94,8 @@ class TemplateTests(BaseTestCase):
             '.svn',
             '.DS_Store',
             'Thumbs.db',
+            '.facioignore',
+            '.facio.index',
             '*.png',
             '*.gif'
         ])
@@ -93,7 +107,25 @@ class TemplateTests(BaseTestCase):
 
         ignores = instance.get_render_ignore_files(files)
 
-        self.assertEqual(ignores, ['foo.png', 'bar.jpeg'])
+        self.assertEqual(ignores, set(['foo.png', 'bar.jpeg']))
+
+    def test_render_ignore_matcher_recompiled_on_update(self):
+        instance = Template('/foo/bar')
+        self.assertEqual(instance.get_render_ignore_files(['a.ico']), set())
+
+        instance.update_render_ignore_globs(['*.ico'])
+
+        self.assertEqual(instance.get_render_ignore_files(['a.ico']),
+                         set(['a.ico']))
+
+    def test_copy_ignore_matcher(self):
+        instance = Template('/foo/bar')
+        instance.update_copy_ignore_globs(['*.pyc'])
+
+        ignore = instance.get_copy_ignore_matcher()
+
+        self.assertEqual(ignore('/foo/bar', ['.git', 'a.pyc', 'a.py']),
+                         set(['.git', 'a.pyc']))
 
     def test_get_render_ignore_globs_empty_list(self):
         instance = Template('/foo/bar')
@@ -115,12 +147,14 @@ class TemplateTests(BaseTestCase):
         ])
 
     @patch('sys.exit')
-    @patch('facio.state.pwd', return_value='/tmp')
-    @patch('facio.template.shutil.copytree', side_effect=ShutilError)
+    @patch('facio.state.getcwd', return_value='/tmp')
+    @patch('facio.template.os.path.isdir', side_effect=[False, True])
+    @patch('facio.template.Template.copy_tree', side_effect=ShutilError)
     def test_copy_shutil_error_raise_exception(
             self,
             mock_copy_tree,
-            mock_pwd,
+            mock_isdir,
+            mock_getcwd,
             mock_exit):
 
         instance = Template('/foo/bar')
@@ -132,14 +166,14 @@ class TemplateTests(BaseTestCase):
             'Error: Failed to copy /foo/bar to /tmp/foo')
 
     @patch('sys.exit')
-    @patch('facio.state.pwd', return_value='/tmp')
+    @patch('facio.state.getcwd', return_value='/tmp')
     @patch('facio.template.os.path.isdir', return_value=True)
-    @patch('facio.template.shutil.copytree', side_effect=OSError)
-    def test_copy_shutil_oserror_raise_exception(
+    @patch('facio.template.Template.copy_tree')
+    def test_copy_project_root_exists_exception(
             self,
             mock_copy_tree,
             mock_isdir,
-            mock_pwd,
+            mock_getcwd,
             mock_exit):
 
         instance = Template('/foo/bar')
@@ -152,89 +186,113 @@ class TemplateTests(BaseTestCase):
             'Error: /tmp/foo already exists')
 
     @patch('sys.exit')
-    @patch('facio.state.pwd', return_value='/tmp')
+    @patch('facio.state.getcwd', return_value='/tmp')
     @patch('facio.template.os.path.isdir', return_value=False)
-    @patch('facio.template.shutil.copytree', side_effect=OSError)
-    def test_copy_oserror_not_vcs_path_exception(
+    @patch('facio.template.Template.copy_tree')
+    def test_copy_not_vcs_path_exception(
             self,
             mock_copy_tree,
             mock_isdir,
-            mock_pwd,
+            mock_getcwd,
             mock_exit):
 
         instance = Template('/foo/bar')
 
         with self.assertRaises(FacioException):
             instance.copy()
-        mock_isdir.assert_called_with('/tmp/foo')
+        mock_isdir.assert_called_with('/foo/bar')
         self.assertTrue(mock_exit.called)
         self.mocked_facio_exceptions_puts.assert_any_call(
             'Error: /foo/bar does not exist')
 
-    @patch('sys.exit')
+    @patch('facio.state.getcwd', return_value='/tmp')
     @patch('facio.template.GitVCS', new_callable=MagicMock)
     @patch('facio.template.os.path.isdir', return_value=False)
-    @patch('facio.template.shutil.copytree', side_effect=OSError)
-    def test_copy_oserror_vcs_path(
+    @patch('facio.template.Template.copy_tree')
+    def test_copy_vcs_path_exports(
             self,
             mock_copy_tree,
             mock_isdir,
             mock_gitvcs,
+            mock_getcwd):
+
+        instance = Template('git+/foo/bar')
+        instance.update_copy_ignore_globs(['*.pyc'])
+
+        self.assertTrue(instance.copy())
+        mock_gitvcs.assert_called_with('git+/foo/bar')
+        vcs = mock_gitvcs()
+        vcs.checkout.assert_called_with(working_tree=False)
+        vcs.export.assert_called_with(
+            '/tmp/foo', ignore=instance.copy_ignore_matcher)
+        vcs.cleanup.assert_called_with(vcs.directory, '/tmp/foo')
+        self.assertFalse(mock_copy_tree.called)
+
+    @patch('sys.exit')
+    @patch('facio.state.getcwd', return_value='/tmp')
+    @patch('facio.template.GitVCS', new_callable=MagicMock)
+    @patch('facio.template.os.path.isdir', return_value=False)
+    def test_copy_vcs_path_export_failure_cleans_up(
+            self,
+            mock_isdir,
+            mock_gitvcs,
+            mock_getcwd,
             mock_exit):
 
+        vcs = mock_gitvcs()
+        vcs.export.side_effect = FacioException('Failed to export /foo/bar')
         instance = Template('git+/foo/bar')
-        instance.COPY_ATTEMPT_LIMIT = 0  # Block the next copy call
 
         with self.assertRaises(FacioException):
             instance.copy()
-        mock_gitvcs.assert_called_with('git+/foo/bar')
+        vcs.cleanup.assert_called_with(vcs.directory, '/tmp/foo')
 
     @patch('sys.exit')
-    @patch('facio.template.GitVCS.clone', return_value=False)
-    @patch('facio.template.os.path.isdir', return_value=False)
-    @patch('facio.template.shutil.copytree', side_effect=OSError)
-    def test_copy_oserror_vcs_clone_returns_not_path(
+    @patch('facio.state.getcwd', return_value='/tmp')
+    @patch('facio.template.GitVCS', new_callable=MagicMock)
+    @patch('facio.template.os.path.isdir', return_value=True)
+    def test_copy_vcs_path_project_root_exists(
             self,
-            mock_copy_tree,
             mock_isdir,
             mock_gitvcs,
+            mock_getcwd,
             mock_exit):
 
         instance = Template('git+/foo/bar')
-        instance.COPY_ATTEMPT_LIMIT = 0  # Block the next copy call
 
         with self.assertRaises(FacioException):
             instance.copy()
+        self.assertFalse(mock_gitvcs().checkout.called)
         self.mocked_facio_exceptions_puts.assert_any_call(
-            'Error: New path to template not returned by GitVCS.clone()')
+            'Error: /tmp/foo already exists')
 
     @patch('sys.exit')
-    @patch('facio.template.GitVCS', new_callable=MagicMock)
+    @patch('facio.template.GitVCS.clone', return_value=False)
     @patch('facio.template.os.path.isdir', return_value=False)
-    @patch('facio.template.shutil.copytree', side_effect=OSError)
-    def test_copy_oserror_vcs_path_recursion_limit(
+    def test_copy_vcs_clone_returns_not_path(
             self,
-            mock_copy_tree,
             mock_isdir,
             mock_gitvcs,
             mock_exit):
 
         instance = Template('git+/foo/bar')
+
         with self.assertRaises(FacioException):
             instance.copy()
-        self.assertTrue(mock_exit.called)
         self.mocked_facio_exceptions_puts.assert_any_call(
-            'Error: Failed to copy template after 6 attempts')
+            'Error: New path to template not returned by GitVCS.clone()')
 
-    @patch('facio.template.shutil.copytree', new_callable=MagicMock)
-    def test_copy_returns_true(self, mock_copy_tree):
+    @patch('facio.template.os.path.isdir', side_effect=[False, True])
+    @patch('facio.template.Template.copy_tree', new_callable=MagicMock)
+    def test_copy_returns_true(self, mock_copy_tree, mock_isdir):
         instance = Template('/foo/bar')
 
         self.assertTrue(instance.copy())
 
-    @patch('facio.state.pwd', return_value='/tmp')
-    @patch('facio.template.shutil.copytree', new_callable=MagicMock)
-    def test_copy_callback_call(self, mock_copy_tree, mock_pwd):
+    @patch('facio.state.getcwd', return_value='/tmp')
+    @patch('facio.template.os.path.isdir', side_effect=[False, True])
+    @patch('facio.template.Template.copy_tree', new_callable=MagicMock)
+    def test_copy_callback_call(self, mock_copy_tree, mock_isdir, mock_getcwd):
         from facio.state import state
         instance = Template('/foo/bar')
         callback = MagicMock()
@@ -244,38 +302,72 @@ class TemplateTests(BaseTestCase):
             origin=instance.origin,
             destination=state.get_project_root())
 
+    def test_get_renamed(self):
+        instance = Template('/foo/bar')
+        self.mock_state.context_variables = {
+            'PROJECT_NAME': 'foo', 'APP': 'bar'}
+
+        self.assertEqual(instance.get_renamed('setup.py'), 'setup.py')
+        self.assertEqual(instance.get_renamed('{{PROJECT_NAME}}'), 'foo')
+        self.assertEqual(instance.get_renamed('test_{{PROJECT_NAME}}.py'),
+                         'test_foo.py')
+        self.assertEqual(instance.get_renamed('{{PROJECT_NAME}}_{{APP}}.py'),
+                         'foo_bar.py')
+        self.assertEqual(instance.get_renamed('{{UNKNOWN}}_{{APP}}'),
+                         '{{UNKNOWN}}_bar')
+
+    @patch('sys.exit')
+    def test_get_renames_collision(self, mock_exit):
+        instance = Template('/foo/bar')
+
+        with self.assertRaises(FacioException):
+            instance.get_renames('/foo', ['foo.py', '{{PROJECT_NAME}}.py'])
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Renaming /foo/{{PROJECT_NAME}}.py to /foo/foo.py '
+            'collides with /foo/foo.py')
+
+    @patch('facio.template.os.path.lexists', return_value=False)
     @patch('os.walk')
-    @patch('facio.template.shutil.move', new_callable=MagicMock)
-    def test_rename_directories(self, mock_move, mock_walk):
+    def test_get_rename_plan(self, mock_walk, mock_lexists):
         mock_walk.return_value = [
-            ('/foo', ['bar', '{{UNKNOWN}}', '{{PROJECT_NAME}}', 'baz'], [])
+            ('/foo', ['{{PROJECT_NAME}}', '{{UNKNOWN}}', 'baz'],
+             ['bar.py', '{{PROJECT_NAME}}.html']),
+            ('/foo/{{PROJECT_NAME}}', ['{{PROJECT_NAME}}'], []),
+            ('/foo/{{PROJECT_NAME}}/{{PROJECT_NAME}}', [],
+             ['test_{{PROJECT_NAME}}.py']),
         ]
         instance = Template('/foo/bar')
 
-        for index, value in enumerate(instance.rename_direcories()):
-            old, new = value
-            mock_move.assert_called_with(old, new)
-            self.assertEqual(old, '/foo/{{PROJECT_NAME}}')
-            self.assertEqual(new, '/foo/foo')
+        plan = instance.get_rename_plan('/foo')
+
+        self.assertEqual(plan, [
+            ('/foo/{{PROJECT_NAME}}/{{PROJECT_NAME}}/test_{{PROJECT_NAME}}.py',
+             '/foo/{{PROJECT_NAME}}/{{PROJECT_NAME}}/test_foo.py'),
+            ('/foo/{{PROJECT_NAME}}/{{PROJECT_NAME}}',
+             '/foo/{{PROJECT_NAME}}/foo'),
+            ('/foo/{{PROJECT_NAME}}', '/foo/foo'),
+            ('/foo/{{PROJECT_NAME}}.html', '/foo/foo.html'),
+        ])
 
+    @patch('sys.exit')
+    @patch('facio.template.os.path.lexists', return_value=True)
     @patch('os.walk')
-    @patch('facio.template.shutil.move', new_callable=MagicMock)
-    def test_rename_files(self, mock_move, mock_walk):
-        mock_walk.return_value = [
-            ('/foo', [], ['bar.py', '{{UNKNOWN}}.png',
-                          '{{PROJECT_NAME}}.html', 'baz.gif'])
-        ]
+    def test_get_rename_plan_existing_file(self, mock_walk, mock_lexists,
+                                           mock_exit):
+        mock_walk.return_value = [('/foo', [], ['{{PROJECT_NAME}}.py'])]
         instance = Template('/foo/bar')
 
-        for index, value in enumerate(instance.rename_files()):
-            old, new = value
-            mock_move.assert_called_with(old, new)
-            self.assertEqual(old, '/foo/{{PROJECT_NAME}}.html')
-            self.assertEqual(new, '/foo/foo.html')
+        with self.assertRaises(FacioException):
+            instance.get_rename_plan('/foo')
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Renaming /foo/{{PROJECT_NAME}}.py to /foo/foo.py would '
+            'overwrite an existing file')
 
+    @patch('facio.state.getcwd', return_value='/')
+    @patch('facio.template.os.rename')
+    @patch('facio.template.os.path.lexists', return_value=False)
     @patch('os.walk')
-    @patch('facio.template.shutil.move', new_callable=MagicMock)
-    def test_rename(self, mock_move, mock_walk):
+    def test_rename(self, mock_walk, mock_lexists, mock_rename, mock_getcwd):
         mock_walk.return_value = [(
             '/foo',  # Root
             ['{{PROJECT_NAME}}', 'baz'],  # Dirs
@@ -286,14 +378,20 @@ class TemplateTests(BaseTestCase):
         instance.rename()
 
         self.assertEqual(self.mocked_facio_template_Template_out.call_count, 2)
-        self.mocked_facio_template_Template_out.has_any_call(
+        self.mocked_facio_template_Template_out.assert_any_call(
             'Renaming /foo/{{PROJECT_NAME}} to /foo/foo')
-        self.mocked_facio_template_Template_out.has_any_call(
+        self.mocked_facio_template_Template_out.assert_any_call(
             'Renaming /foo/{{PROJECT_NAME}}.png to /foo/foo.png')
+        mock_walk.assert_called_once_with('/foo')
+        self.assertEqual(mock_rename.call_count, 2)
 
+    @patch('facio.template.has_template_markers', return_value=True)
+    @patch('facio.template.is_binary', return_value=False)
+    @patch('facio.state.getcwd', return_value='/')
     @patch('os.walk')
     @patch('facio.template.FileSystemLoader.get_source')
-    def test_render(self, mock_get_source, mock_walk):
+    def test_render(self, mock_get_source, mock_walk, mock_getcwd,
+                    mock_is_binary, mock_has_template_markers):
 
         # Mock Setups - Fake file contents and open renderer
         files_map = {
@@ -321,8 +419,13 @@ class TemplateTests(BaseTestCase):
         ]
 
         open_mock = mock_open()
-        open_patcher = patch('facio.template.open', open_mock, create=True)
+        open_patcher = patch('facio.files.codecs.open', open_mock)
         open_patcher.start()
+        for path in ['facio.template.os.rename',
+                     'facio.template.shutil.copymode']:
+            patcher = patch(path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
         # Call the renderer method on facio.Template
         instance = Template('/foo/bar')
@@ -340,3 +443,683 @@ class TemplateTests(BaseTestCase):
 
         # Stop the open patch
         open_patcher.stop()
+
+    @patch('facio.template.has_template_markers', return_value=True)
+    @patch('facio.template.is_binary', return_value=False)
+    @patch('facio.state.getcwd', return_value='/')
+    @patch('os.walk')
+    @patch('facio.template.Template.get_environment')
+    def test_render_shares_one_environment(self, mock_get_environment,
+                                           mock_walk, mock_getcwd,
+                                           mock_is_binary,
+                                           mock_has_template_markers):
+        mock_walk.return_value = [
+            ('/foo', ['bar'], ['a.txt']),
+            ('/foo/bar', [], ['b.txt']),
+        ]
+
+        for path in ['facio.files.codecs.open',
+                     'facio.template.os.rename',
+                     'facio.template.shutil.copymode']:
+            patcher = patch(path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        instance = Template('/foo/bar')
+        instance.render()
+
+        mock_get_environment.assert_called_once_with('/foo')
+        environment = mock_get_environment.return_value
+        environment.get_template.assert_any_call('a.txt')
+        environment.get_template.assert_any_call('bar/b.txt')
+
+
+class GenerateTests(BaseTestCase):
+    """ Template.generate Tests """
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.base.puts',
+            'facio.exceptions.puts',
+            'facio.template.Template.out',
+            'facio.template.Template.warning',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.origin = os.path.join(self.directory, 'origin')
+        self.cwd = os.path.join(self.directory, 'cwd')
+        os.mkdir(self.cwd)
+
+        patcher = patch('facio.state.getcwd', return_value=self.cwd)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch('facio.template.state.state',
+                        new_callable=PropertyMock,
+                        create=True)
+        self.mock_state = patcher.start()
+        self.mock_state.project_name = 'foo'
+        self.mock_state.context_variables = {
+            'PROJECT_NAME': 'foo'}
+        self.addCleanup(patcher.stop)
+
+    def make_files(self, files):
+        for path, contents in six.iteritems(files):
+            path = os.path.join(self.origin, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as handler:
+                handler.write(contents)
+
+    def read(self, path):
+        with open(os.path.join(self.cwd, 'foo', path)) as handler:
+            return handler.read()
+
+    def test_generate(self):
+        self.make_files({
+            'index.html': '<h1>{{ PROJECT_NAME }}</h1>',
+            '{{PROJECT_NAME}}/{{PROJECT_NAME}}.py':
+                'name = "{{ PROJECT_NAME }}"',
+            '{{PROJECT_NAME}}/static/logo.png': '{{ PROJECT_NAME }}',
+            '.git/config': '',
+        })
+
+        instance = Template(self.origin)
+        self.assertTrue(instance.generate())
+
+        self.assertEqual(self.read('index.html'), '<h1>foo</h1>')
+        self.assertEqual(self.read('foo/foo.py'), 'name = "foo"')
+        self.assertEqual(self.read('foo/static/logo.png'),
+                         '{{ PROJECT_NAME }}')
+        self.assertFalse(os.path.exists(os.path.join(self.cwd, 'foo', '.git')))
+
+    def test_generate_follows_symlinked_directories(self):
+        self.make_files({'r.txt': 'r'})
+        shared = os.path.join(self.directory, 'shared')
+        os.mkdir(shared)
+        with open(os.path.join(shared, 'a.txt'), 'w') as handler:
+            handler.write('{{ PROJECT_NAME }}')
+        os.symlink(shared, os.path.join(self.origin, 'lib'))
+
+        instance = Template(self.origin)
+        instance.generate()
+
+        self.assertEqual(self.read('r.txt'), 'r')
+        self.assertEqual(self.read('lib/a.txt'), 'foo')
+        self.assertEqual([name for name, path, is_dir in instance.walk()],
+                         ['lib', 'r.txt', 'lib/a.txt'])
+
+    def test_generate_renames_every_variable(self):
+        self.mock_state.context_variables = {
+            'PROJECT_NAME': 'foo', 'APP': 'bar'}
+        self.make_files({
+            '{{PROJECT_NAME}}_{{APP}}/test_{{APP}}.py': 'x',
+        })
+
+        instance = Template(self.origin)
+        instance.generate()
+
+        self.assertEqual(self.read('foo_bar/test_bar.py'), 'x')
+
+    def test_generate_copies_binary_files_verbatim(self):
+        self.make_files({
+            'fixture.db': 'SQLite format 3\x00{{ PROJECT_NAME }}',
+        })
+
+        instance = Template(self.origin)
+        with patch('facio.template.Environment.get_template') as mock_get:
+            instance.generate()
+
+        self.assertFalse(mock_get.called)
+        self.assertEqual(self.read('fixture.db'),
+                         'SQLite format 3\x00{{ PROJECT_NAME }}')
+
+    def test_generate_skips_files_without_markers(self):
+        self.make_files({
+            'index.html': '<h1>{{ PROJECT_NAME }}</h1>',
+            'app.js': 'function foo() { return {a: 1}; }',
+            'empty.py': '',
+        })
+
+        instance = Template(self.origin)
+        with patch('facio.template.Environment.get_template',
+                   side_effect=AssertionError) as mock_get:
+            instance.generate()
+
+        mock_get.assert_called_once_with('index.html')
+        self.assertEqual(self.read('app.js'),
+                         'function foo() { return {a: 1}; }')
+        self.assertEqual(self.read('empty.py'), '')
+        self.mocked_facio_template_Template_out.assert_called_with(
+            'Rendered 0 files, skipped 2 without template markers and 0 '
+            'binary files')
+
+    def test_generate_streams_output(self):
+        self.make_files({
+            'data.csv': '{% for n in range(1000) %}{{ n }},{% endfor %}'})
+
+        instance = Template(self.origin)
+        instance.buffer_size = 100
+        with patch('facio.files.codecs.open', mock_open()) as mock_file:
+            with patch('facio.template.os.rename'):
+                with patch('facio.template.shutil.copymode'):
+                    instance.generate()
+
+        writes = mock_file().write.call_args_list
+        self.assertTrue(len(writes) > 1)
+        self.assertTrue(all(len(c[0][0]) < 110 for c in writes))
+        self.assertEqual(''.join(c[0][0] for c in writes),
+                         ''.join('{0},'.format(n) for n in range(1000)))
+
+    def test_generate_include_across_directories(self):
+        self.make_files({
+            'base.txt': 'Hello {% block name %}{% endblock %}',
+            'a/b/c.txt': '{% extends "base.txt" %}'
+                         '{% block name %}{{ PROJECT_NAME }}{% endblock %}',
+        })
+
+        instance = Template(self.origin)
+        instance.generate()
+
+        self.assertEqual(self.read('a/b/c.txt'), 'Hello foo')
+
+    def test_generate_keeps_mode(self):
+        self.make_files({'run.sh': 'echo {{ PROJECT_NAME }}'})
+        os.chmod(os.path.join(self.origin, 'run.sh'), 0o755)
+
+        instance = Template(self.origin)
+        instance.generate()
+
+        mode = os.stat(os.path.join(self.cwd, 'foo', 'run.sh')).st_mode
+        self.assertTrue(mode & stat.S_IXUSR)
+
+    def test_generate_copies_files_failing_to_render(self):
+        self.make_files({'broken.txt': '{% if %}'})
+
+        instance = Template(self.origin)
+        instance.generate()
+
+        self.assertEqual(self.read('broken.txt'), '{% if %}')
+        self.assertTrue(self.mocked_facio_template_Template_warning.called)
+
+    def test_generate_render_pool(self):
+        self.make_files(dict(
+            ('{0}.txt'.format(n), '{{ PROJECT_NAME }} %s' % n)
+            for n in range(10)))
+        self.make_files({'a.txt': '{% if %}', 'b.txt': '{% for %}'})
+
+        instance = Template(self.origin, jobs=2)
+        instance.generate()
+
+        for n in range(10):
+            self.assertEqual(self.read('{0}.txt'.format(n)),
+                             'foo {0}'.format(n))
+        calls = self.mocked_facio_template_Template_warning.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(calls[0][0][0].startswith(
+            'Failed to render {0}'.format(
+                os.path.join(self.cwd, 'foo', 'a.txt'))))
+        self.assertTrue(calls[1][0][0].startswith(
+            'Failed to render {0}'.format(
+                os.path.join(self.cwd, 'foo', 'b.txt'))))
+
+    @unittest.skipIf(not hasattr(multiprocessing, 'get_context'),
+                     'Start methods need Python 3.4')
+    def test_generate_render_pool_spawned(self):
+        self.make_files(dict(
+            ('{0}.txt'.format(n), '{{ PROJECT_NAME }} %s' % n)
+            for n in range(4)))
+
+        instance = Template(self.origin, jobs=2)
+        instance.compile()
+        # An open file, as held by a mirror cache, can not be pickled
+        instance.mirror_cache = MagicMock(directory=self.directory,
+                                          lock=tempfile.TemporaryFile())
+        self.addCleanup(instance.mirror_cache.lock.close)
+        with patch('facio.template.multiprocessing.Pool',
+                   multiprocessing.get_context('spawn').Pool):
+            instance.generate()
+
+        for n in range(4):
+            self.assertEqual(self.read('{0}.txt'.format(n)),
+                             'foo {0}'.format(n))
+
+    def test_generate_hardlinks_cached_assets(self):
+        self.make_files({
+            'logo.png': '\x89PNG\r\n\x1a\n',
+            'data.db': 'SQLite format 3\x00',
+            'index.html': '<h1>{{ PROJECT_NAME }}</h1>',
+            'app.js': 'function foo() { return {a: 1}; }',
+        })
+
+        instance = Template(self.origin)
+        instance.copy_strategy = 'hardlink'
+        instance.mirror_cache = MagicMock()
+        instance.mirror_cache.directory = self.directory
+        instance.generate()
+
+        def is_linked(name):
+            return os.path.samefile(os.path.join(self.origin, name),
+                                    os.path.join(self.cwd, 'foo', name))
+        self.assertTrue(is_linked('logo.png'))
+        # Only render ignored files are hardlinked, never binary files
+        # found while rendering
+        self.assertFalse(is_linked('data.db'))
+        self.assertFalse(is_linked('index.html'))
+        self.assertFalse(is_linked('app.js'))
+        self.assertEqual(self.read('index.html'), '<h1>foo</h1>')
+
+    def test_generate_copies_unrendered_files_in_pool(self):
+        self.make_files({
+            'logo.png': '{{ PROJECT_NAME }}',
+            'data.db': 'SQLite format 3\x00',
+            'app.js': 'function foo() { return {a: 1}; }',
+            'index.html': '<h1>{{ PROJECT_NAME }}</h1>',
+        })
+
+        instance = Template(self.origin)
+        with patch.object(Template, 'copy_files', autospec=True,
+                          side_effect=Template.copy_files) as mock_copy, \
+                patch('facio.template.render_file',
+                      return_value=('rendered', None)) as mock_render:
+            instance.generate()
+
+        copied = [os.path.basename(path) for path, new_path
+                  in mock_copy.call_args[0][1]]
+        self.assertEqual(sorted(copied), ['app.js', 'data.db', 'logo.png'])
+        self.assertEqual(mock_render.call_count, 1)
+        self.assertEqual(mock_render.call_args[0][1], 'index.html')
+        self.mocked_facio_template_Template_out.assert_called_with(
+            'Rendered 1 files, skipped 1 without template markers and 1 '
+            'binary files')
+
+    def test_generate_copies_directory_stat(self):
+        self.make_files({'bin/run.sh': '{{ PROJECT_NAME }}'})
+        directory = os.path.join(self.origin, 'bin')
+        os.chmod(directory, 0o750)
+        os.utime(directory, (1000000000, 1000000000))
+
+        Template(self.origin).generate()
+
+        target = os.stat(os.path.join(self.cwd, 'foo', 'bin'))
+        self.assertEqual(stat.S_IMODE(target.st_mode), 0o750)
+        self.assertEqual(int(target.st_mtime), 1000000000)
+        self.assertEqual(self.read('bin/run.sh'), 'foo')
+
+    def test_generate_never_hardlinks_uncached_templates(self):
+        self.make_files({'logo.png': '\x89PNG\r\n\x1a\n'})
+
+        instance = Template(self.origin)
+        instance.copy_strategy = 'hardlink'
+        instance.generate()
+
+        self.assertFalse(os.path.samefile(
+            os.path.join(self.origin, 'logo.png'),
+            os.path.join(self.cwd, 'foo', 'logo.png')))
+
+    def test_copy_tree(self):
+        self.make_files({
+            'a/b/c.txt': 'c',
+            'a/d.pyc': 'd',
+            '.git/HEAD': 'ref',
+            'e.txt': 'e',
+        })
+        os.chmod(os.path.join(self.origin, 'e.txt'), 0o750)
+        os.utime(os.path.join(self.origin, 'a', 'b', 'c.txt'),
+                 (1000000000, 1000000000))
+        os.utime(os.path.join(self.origin, 'a'), (1000000000, 1000000000))
+        destination = os.path.join(self.cwd, 'foo')
+
+        instance = Template(self.origin)
+        instance.update_copy_ignore_globs(['*.pyc'])
+        instance.copy_threads = 4
+        instance.copy_tree(self.origin, destination)
+
+        self.assertEqual(sorted(os.listdir(destination)), ['a', 'e.txt'])
+        self.assertEqual(os.listdir(os.path.join(destination, 'a')), ['b'])
+        self.assertEqual(self.read('a/b/c.txt'), 'c')
+        self.assertEqual(
+            os.stat(os.path.join(destination, 'e.txt')).st_mode & 0o777,
+            0o750)
+        for path in ['a', 'a/b/c.txt']:
+            self.assertEqual(
+                int(os.path.getmtime(os.path.join(destination, path))),
+                1000000000)
+
+    def test_copy_files_reports_throughput_when_verbose(self):
+        self.make_files({'a.txt': 'a' * 1024, 'b.txt': 'b' * 1024})
+        os.mkdir(os.path.join(self.cwd, 'foo'))
+        tasks = [(os.path.join(self.origin, name),
+                  os.path.join(self.cwd, 'foo', name))
+                 for name in ['a.txt', 'b.txt']]
+
+        instance = Template(self.origin)
+        instance.verbose = True
+        instance.copy_files(tasks)
+
+        message = self.mocked_facio_template_Template_out.call_args[0][0]
+        self.assertTrue(message.startswith('Copied 2 files, 0.0 MB in '))
+        self.assertTrue(message.endswith('MB/s'))
+        self.assertEqual(self.read('b.txt'), 'b' * 1024)
+
+    def test_generate_facioignore(self):
+        self.make_files({
+            '.facioignore': '# Build output\n/build/\nnode_modules/\n*.log\n'
+                            '!keep.log\n',
+            'build/a.txt': 'a',
+            'src/build/b.txt': 'b',
+            'src/node_modules/c.js': 'c',
+            'debug.log': 'd',
+            'keep.log': 'e',
+        })
+
+        walked = []
+        walk = os.walk
+
+        def mock_walk(*args, **kwargs):
+            for root, dirs, files in walk(*args, **kwargs):
+                walked.append(root)
+                yield root, dirs, files
+
+        instance = Template(self.origin)
+        with patch('facio.template.os.walk', side_effect=mock_walk):
+            instance.generate()
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cwd, 'foo'))),
+                         ['keep.log', 'src'])
+        self.assertEqual(self.read('src/build/b.txt'), 'b')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.cwd, 'foo', 'src', 'node_modules')))
+        self.assertEqual(sorted(walked), [
+            self.origin,
+            os.path.join(self.origin, 'src'),
+            os.path.join(self.origin, 'src', 'build')])
+
+    def make_archive(self, name):
+        members = [
+            ('template/', None),
+            ('template/{{PROJECT_NAME}}/', None),
+            ('template/{{PROJECT_NAME}}/settings.py',
+             b'{% extends "base.txt" %}{% block a %}{{ PROJECT_NAME }}'
+             b'{% endblock %}'),
+            ('template/base.txt', b'name = {% block a %}{% endblock %}'),
+            ('template/app.js', b'function foo() { return {a: 1}; }'),
+            ('template/fixture.db', b'SQLite format 3\x00{{ PROJECT_NAME }}'),
+            ('template/logo.png', b'{{ PROJECT_NAME }}'),
+            ('template/node_modules/a.js', b'a'),
+            ('template/.facioignore', b'node_modules/\n'),
+        ]
+        path = os.path.join(self.directory, name)
+        if name.endswith('.zip'):
+            make_zip(path, members)
+        else:
+            make_tar(path, members)
+        return path
+
+    def assertArchiveGenerated(self):
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cwd, 'foo'))), [
+            'app.js', 'base.txt', 'fixture.db', 'foo', 'logo.png'])
+        self.assertEqual(self.read('foo/settings.py'), 'name = foo')
+        self.assertEqual(self.read('logo.png'), '{{ PROJECT_NAME }}')
+        self.assertEqual(self.read('fixture.db'),
+                         'SQLite format 3\x00{{ PROJECT_NAME }}')
+        self.mocked_facio_template_Template_out.assert_called_with(
+            'Rendered 2 files, skipped 1 without template markers and 1 '
+            'binary files')
+
+    def test_generate_tar_archive(self):
+        instance = Template(self.make_archive('template.tar.gz'))
+        instance.prepare()
+        with patch('facio.template.os.walk') as mock_walk:
+            instance.generate()
+
+        self.assertFalse(mock_walk.called)
+        self.assertArchiveGenerated()
+
+    def test_generate_zip_archive(self):
+        instance = Template(self.make_archive('template.zip'))
+        instance.prepare()
+        instance.generate()
+
+        self.assertArchiveGenerated()
+
+    def test_generate_archive_symlinks(self):
+        path = os.path.join(self.directory, 'template.tar.gz')
+        make_tar(path, [('a.txt', b'{{ PROJECT_NAME }}'),
+                        ('{{PROJECT_NAME}}.txt', (tarfile.SYMTYPE, 'a.txt'))])
+
+        instance = Template(path)
+        instance.prepare()
+        instance.generate()
+
+        link = os.path.join(self.cwd, 'foo', 'foo.txt')
+        self.assertEqual(os.readlink(link), 'a.txt')
+        self.assertEqual(self.read('foo.txt'), 'foo')
+
+    @patch('sys.exit')
+    def test_generate_archive_rename_collision(self, mock_exit):
+        path = os.path.join(self.directory, 'template.zip')
+        make_zip(path, [('foo.txt', b'a'), ('{{PROJECT_NAME}}.txt', b'b')])
+
+        instance = Template(path)
+        instance.prepare()
+
+        with self.assertRaises(FacioException):
+            instance.generate()
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Renaming {{{{PROJECT_NAME}}}}.txt to {0} collides with '
+            'foo.txt'.format(os.path.join(self.cwd, 'foo', 'foo.txt')))
+
+    @patch('sys.exit')
+    def test_prepare_corrupt_archive(self, mock_exit):
+        path = os.path.join(self.directory, 'template.zip')
+        with open(path, 'w') as handler:
+            handler.write('not a zip')
+
+        instance = Template(path)
+
+        with self.assertRaises(FacioException):
+            instance.prepare()
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Failed to read {0}'.format(path))
+
+    def make_bundle(self):
+        self.make_files({
+            '{{PROJECT_NAME}}/settings.py':
+                '{% extends "base.txt" %}{% block a %}{{ PROJECT_NAME }}'
+                '{% endblock %}',
+            'base.txt': 'name = {% block a %}{% endblock %}',
+            'app.js': 'function foo() { return {a: 1}; }',
+            'logo.png': '{{ PROJECT_NAME }}',
+            'bad.txt': '{% if %}',
+        })
+        os.chmod(os.path.join(self.origin, 'app.js'), 0o755)
+        path = os.path.join(self.directory, 'template.faciopack')
+        with patch('facio.pack.Pack.out'), patch('facio.pack.Pack.warning'):
+            Pack(Template(self.origin)).run(path)
+        shutil.rmtree(self.origin)
+        return path
+
+    def test_generate_bundle(self):
+        instance = Template(self.make_bundle())
+        instance.prepare()
+        with patch('jinja2.Environment.compile') as mock_compile:
+            mock_compile.side_effect = SyntaxError('compiled')
+            instance.generate()
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cwd, 'foo'))), [
+            'app.js', 'bad.txt', 'base.txt', 'foo', 'logo.png'])
+        self.assertEqual(self.read('foo/settings.py'), 'name = foo')
+        self.assertEqual(self.read('logo.png'), '{{ PROJECT_NAME }}')
+        self.assertEqual(self.read('bad.txt'), '{% if %}')
+        self.assertEqual(stat.S_IMODE(os.stat(os.path.join(
+            self.cwd, 'foo', 'app.js')).st_mode), 0o755)
+        # Only the file which failed to compile when packed is compiled
+        self.assertEqual(mock_compile.call_count, 1)
+        self.mocked_facio_template_Template_out.assert_called_with(
+            'Rendered 2 files, skipped 1 without template markers and 0 '
+            'binary files')
+
+    def test_prepare_bundle_other_version(self):
+        path = self.make_bundle()
+
+        instance = Template(path)
+        with patch('facio.bundle.CODE_TAG', 'other'):
+            instance.prepare()
+        instance.generate()
+
+        self.assertEqual(self.read('foo/settings.py'), 'name = foo')
+        self.mocked_facio_template_Template_warning.assert_any_call(
+            '{0} was packed by another version of Python or Jinja2, its '
+            'files are compiled as they are rendered'.format(path))
+
+    def make_index(self):
+        self.make_files({
+            '{{PROJECT_NAME}}/{{PROJECT_NAME}}.py':
+                'name = "{{ PROJECT_NAME }}"',
+            'app.js': 'function foo() { return {a: 1}; }',
+            'logo.png': '{{ PROJECT_NAME }}',
+        })
+        index = TemplateIndex(os.path.join(self.origin, INDEX_FILE_NAME))
+        index.build(Template(self.origin))
+        index.save()
+
+    def test_generate_index(self):
+        self.make_index()
+
+        with patch('facio.template.os.walk') as mock_walk, \
+                patch('facio.template.is_binary') as mock_is_binary, \
+                patch('facio.template.has_template_markers') as \
+                mock_has_markers:
+            Template(self.origin).generate()
+
+        self.assertFalse(mock_walk.called)
+        self.assertFalse(mock_is_binary.called)
+        self.assertFalse(mock_has_markers.called)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cwd, 'foo'))), [
+            'app.js', 'foo', 'logo.png'])
+        self.assertEqual(self.read('foo/foo.py'), 'name = "foo"')
+        self.assertEqual(self.read('logo.png'), '{{ PROJECT_NAME }}')
+        self.mocked_facio_template_Template_out.assert_called_with(
+            'Rendered 1 files, skipped 1 without template markers and 0 '
+            'binary files')
+
+    def test_generate_index_out_of_date(self):
+        self.make_index()
+        self.make_files({'new.txt': '{{ PROJECT_NAME }}'})
+        os.utime(self.origin, (1, 1))
+
+        Template(self.origin).generate()
+
+        self.assertEqual(self.read('new.txt'), 'foo')
+        self.assertFalse(os.path.exists(os.path.join(
+            self.cwd, 'foo', INDEX_FILE_NAME)))
+        self.mocked_facio_template_Template_warning.assert_any_call(
+            '{0} is out of date, run facio index to rebuild it'.format(
+                os.path.join(self.origin, INDEX_FILE_NAME)))
+
+    def test_compile(self):
+        self.make_files({
+            '{{PROJECT_NAME}}/settings.py': 'name = "{{ PROJECT_NAME }}"',
+            'plain.txt': 'plain',
+        })
+
+        instance = Template(self.origin)
+        instance.compile()
+        with patch('jinja2.FileSystemLoader.get_source') as mock_get_source:
+            instance.generate()
+
+        self.assertFalse(mock_get_source.called)
+        self.assertEqual(self.read('foo/settings.py'), 'name = "foo"')
+
+    @patch('sys.exit')
+    def test_generate_project_root_exists(self, mock_exit):
+        self.make_files({'index.html': ''})
+        os.mkdir(os.path.join(self.cwd, 'foo'))
+
+        instance = Template(self.origin)
+
+        with self.assertRaises(FacioException):
+            instance.generate()
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: {0} already exists'.format(os.path.join(self.cwd, 'foo')))
+
+    def test_generate_callback_call(self):
+        self.make_files({'index.html': ''})
+        callback = MagicMock()
+
+        instance = Template(self.origin)
+        instance.generate(callback=callback)
+
+        callback.assert_called_once_with(
+            origin=self.origin,
+            destination=os.path.join(self.cwd, 'foo'))
+
+    def test_prepare_local_directory(self):
+        self.make_files({'index.html': ''})
+
+        instance = Template(self.origin)
+
+        self.assertEqual(instance.prepare(), None)
+
+    @patch('facio.template.GitVCS.clone', return_value='/tmp/clone')
+    def test_prepare_vcs(self, mock_clone):
+        instance = Template('git+/foo/bar')
+
+        vcs = instance.prepare()
+
+        self.assertEqual(vcs.path, '/foo/bar')
+        mock_clone.assert_called_once_with(working_tree=False)
+        self.assertEqual(instance.origin, 'git+/foo/bar')
+        self.assertTrue(isinstance(instance.archive, RepositoryArchive))
+        self.assertEqual(instance.archive.vcs, vcs)
+
+    @patch('facio.template.GitVCS.clone', return_value='/tmp/clone')
+    def test_prepare_vcs_working_tree(self, mock_clone):
+        instance = Template('git+/foo/bar')
+
+        vcs = instance.prepare(working_tree=True)
+
+        self.assertEqual(vcs.path, '/foo/bar')
+        mock_clone.assert_called_once_with(working_tree=True)
+        self.assertEqual(instance.origin, '/tmp/clone')
+        self.assertEqual(instance.archive, None)
+
+    def test_generate_git_repository(self):
+        self.make_files({
+            '{{PROJECT_NAME}}/{{PROJECT_NAME}}.py':
+                '{% include "header.txt" %}name = "{{ PROJECT_NAME }}"',
+            'header.txt': '# {{ PROJECT_NAME }}; ',
+            'skip.pyc': '',
+            '.facioignore': '*.pyc\n',
+        })
+        os.symlink('header.txt', os.path.join(self.origin, 'link.txt'))
+        for args in [['init', '-q'], ['add', '.'],
+                     ['-c', 'user.name=Facio', '-c', 'user.email=facio@test',
+                      'commit', '-q', '-m', 'Template']]:
+            subprocess.check_call(['git'] + args, cwd=self.origin)
+
+        instance = Template('git+file://{0}'.format(self.origin))
+        vcs = instance.prepare()
+        try:
+            instance.generate()
+        finally:
+            vcs.cleanup(origin=instance.origin, destination=None)
+
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cwd, 'foo'))),
+                         ['foo', 'header.txt', 'link.txt'])
+        self.assertEqual(self.read('foo/foo.py'), '# foo; name = "foo"')
+        self.assertEqual(
+            os.readlink(os.path.join(self.cwd, 'foo', 'link.txt')),
+            'header.txt')
+        self.assertFalse(os.path.exists(vcs.directory))
+
+    @patch('sys.exit')
+    def test_prepare_origin_does_not_exist(self, mock_exit):
+        instance = Template('/does/not/exist')
+
+        with self.assertRaises(FacioException):
+            instance.prepare()
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: /does/not/exist does not exist')
@@ -6,10 +6,14 @@
 """
 
 import os
+import shutil
+import subprocess
+import tempfile
 
 from facio.exceptions import FacioException
+from facio.files import IgnoreMatcher
 from facio.vcs import BaseVCS, GitVCS, MercurialVCS
-from mock import patch
+from mock import MagicMock, patch
 
 from . import BaseTestCase
 
@@ -28,6 +32,61 @@ class TestBaseVCS(BaseTestCase):
         self.assertEqual(instance.path, '/foo/+bar')
         self.assertEqual(instance.vcs, 'git')
 
+    def test_repository_ref(self):
+        instance = BaseVCS('git+git@github.com:foo/bar.git@v2')
+
+        self.assertEqual(instance.path, 'git@github.com:foo/bar.git')
+        self.assertEqual(instance.ref, 'v2')
+
+    def test_repository_no_ref(self):
+        for path in ['git@github.com:foo/bar.git', 'git@github.com:bar.git',
+                     'ssh://hg@bitbucket.org/foo/bar']:
+            instance = BaseVCS('git+' + path)
+
+            self.assertEqual(instance.path, path)
+            self.assertEqual(instance.ref, None)
+
+    def test_repository_subdir(self):
+        instance = BaseVCS('git+git@github.com:foo/bar.git@v2'
+                           '#subdir=templates/django/')
+
+        self.assertEqual(instance.path, 'git@github.com:foo/bar.git')
+        self.assertEqual(instance.ref, 'v2')
+        self.assertEqual(instance.subdir, 'templates/django')
+
+    @patch('sys.exit')
+    def test_repository_subdir_outside_repository(self, mock_exit):
+        with self.assertRaises(FacioException):
+            BaseVCS('git+/foo/bar#subdir=../baz')
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Invalid template subdirectory ../baz')
+
+    def test_checkout_subdir(self):
+        directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, directory, True)
+        os.makedirs(os.path.join(directory, 'templates', 'django'))
+        instance = BaseVCS('git+/foo/bar#subdir=templates/django')
+
+        with patch('facio.vcs.BaseVCS.clone', return_value=directory):
+            path = instance.checkout()
+        instance.cleanup(path, '/foo/bar')
+
+        self.assertEqual(path, os.path.join(directory, 'templates', 'django'))
+        self.assertFalse(os.path.exists(directory))
+
+    @patch('sys.exit')
+    def test_checkout_subdir_not_found(self, mock_exit):
+        directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, directory, True)
+        instance = BaseVCS('git+/foo/bar#subdir=templates/django')
+
+        with patch('facio.vcs.BaseVCS.clone', return_value=directory):
+            with self.assertRaises(FacioException):
+                instance.checkout()
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: templates/django not found in /foo/bar')
+        self.assertFalse(os.path.exists(directory))
+
     @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
     def test_get_temp_directory(self, mock_tempfile):
         instance = BaseVCS('git+/foo/bar')
@@ -46,6 +105,62 @@ class TestBaseVCS(BaseTestCase):
         self.mocked_facio_exceptions_puts.assert_any_call(
             'Error: The clone method on BaseVCS needs to be overridden.')
 
+    @patch('sys.exit')
+    def test_update_raises_exception(self, mock_exit):
+        instance = BaseVCS('git+/foo/bar')
+
+        with self.assertRaises(FacioException):
+            instance.update('/foo')
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: The update method on BaseVCS needs to be overridden.')
+
+    @patch('sys.exit')
+    def test_get_archive_command_raises_exception(self, mock_exit):
+        instance = BaseVCS('git+/foo/bar')
+
+        with self.assertRaises(FacioException):
+            instance.export('/foo')
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: The get_archive_command method on BaseVCS needs to be '
+            'overridden.')
+
+    @patch('facio.vcs.BaseVCS.clone', return_value='/tmp/foo')
+    def test_checkout_without_mirror_cache_clones(self, mock_clone):
+        instance = BaseVCS('git+/foo/bar')
+
+        self.assertEqual(instance.checkout(), '/tmp/foo')
+
+    @patch('facio.vcs.BaseVCS.clone', return_value='/tmp/foo')
+    def test_checkout_without_working_tree(self, mock_clone):
+        instance = BaseVCS('git+/foo/bar#subdir=baz')
+
+        self.assertEqual(instance.checkout(working_tree=False), '/tmp/foo')
+        mock_clone.assert_called_once_with(working_tree=False)
+
+    def test_checkout_from_mirror_cache(self):
+        instance = BaseVCS('git+/foo/bar')
+        instance.mirror_cache = MagicMock()
+        instance.mirror_cache.checkout.return_value = '/cache/foo'
+
+        self.assertEqual(instance.checkout(), '/cache/foo')
+        instance.mirror_cache.checkout.assert_called_once_with(instance)
+
+    def test_cleanup_releases_mirror(self):
+        instance = BaseVCS('git+/foo/bar')
+        instance.mirror_cache = MagicMock()
+
+        instance.cleanup('/cache/foo', '/foo/bar')
+
+        instance.mirror_cache.release.assert_called_once_with('/cache/foo')
+
+    def test_cleanup_removes_temp_directory(self):
+        instance = BaseVCS('git+/foo/bar')
+        d = instance.get_temp_directory()
+
+        instance.cleanup(d, '/foo/bar')
+
+        self.assertFalse(os.path.isdir(d))
+
     def test_rm_temp_dir(self):
         instance = BaseVCS('git+/foo/bar')
         d = instance.get_temp_directory()
@@ -97,6 +212,173 @@ class TestGitVCS(BaseTestCase):
 
         mock_git.bake.assert_called_with(_cwd='/tmp/foo')
 
+    def test_is_immutable(self):
+        sha = '0123456789abcdef0123456789abcdef01234567'
+
+        self.assertTrue(GitVCS('git+/foo/bar@' + sha).is_immutable())
+        self.assertFalse(GitVCS('git+/foo/bar@0123456').is_immutable())
+        self.assertFalse(GitVCS('git+/foo/bar@master').is_immutable())
+        self.assertFalse(GitVCS('git+/foo/bar').is_immutable())
+
+    def test_is_commit(self):
+        self.assertTrue(GitVCS('git+/foo/bar@0123456').is_commit())
+        self.assertTrue(GitVCS('git+/foo/bar@' + '0' * 40).is_commit())
+        self.assertFalse(GitVCS('git+/foo/bar@master').is_commit())
+        self.assertFalse(GitVCS('git+/foo/bar').is_commit())
+
+    @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
+    @patch('sh.git',)
+    def test_shallow_clone(self, mock_git, mock_tempfile):
+        instance = GitVCS('git+/foo/bar')
+        instance.clone()
+
+        mock_git.bake().clone.assert_called_with(
+            '--depth', '1', '--single-branch', '/foo/bar', '/tmp/foo')
+
+    @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
+    @patch('sh.git',)
+    def test_shallow_clone_ref(self, mock_git, mock_tempfile):
+        instance = GitVCS('git+/foo/bar@v2')
+        instance.clone()
+
+        mock_git.bake().clone.assert_called_with(
+            '--depth', '1', '--branch', 'v2', '--single-branch', '/foo/bar',
+            '/tmp/foo')
+
+    @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
+    @patch('sh.git',)
+    def test_clone_commit(self, mock_git, mock_tempfile):
+        sha = '0123456789abcdef0123456789abcdef01234567'
+        instance = GitVCS('git+/foo/bar@' + sha)
+        instance.clone()
+
+        git = mock_git.bake()
+        git.remote.assert_called_with('add', 'origin', '/foo/bar')
+        git.fetch.assert_called_with('--depth', '1', 'origin', sha)
+        git.checkout.assert_called_with('--detach', sha)
+
+    @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
+    @patch('sh.git',)
+    def test_sparse_clone(self, mock_git, mock_tempfile):
+        instance = GitVCS('git+/foo/bar#subdir=templates/django')
+        instance.clone()
+
+        git = mock_git.bake()
+        git.clone.assert_called_with(
+            '--depth', '1', '--filter=blob:none', '--no-checkout',
+            '--single-branch', '/foo/bar', '/tmp/foo')
+        git.assert_called_with('sparse-checkout', 'set', '--no-cone',
+                               '/templates/django/')
+        git.checkout.assert_called_with()
+
+    @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
+    @patch('sh.git',)
+    def test_clone_without_working_tree(self, mock_git, mock_tempfile):
+        instance = GitVCS('git+/foo/bar')
+        instance.clone(working_tree=False)
+
+        mock_git.bake().clone.assert_called_with(
+            '--depth', '1', '--no-checkout', '--single-branch', '/foo/bar',
+            '/tmp/foo')
+
+    def test_get_archive_command(self):
+        sha = '0123456789abcdef0123456789abcdef01234567'
+
+        self.assertEqual(
+            GitVCS('git+/foo/bar').get_archive_command(),
+            (['git', 'archive', '--format=tar', 'HEAD'], ''))
+        self.assertEqual(
+            GitVCS('git+/foo/bar@{0}#subdir=baz'.format(
+                sha)).get_archive_command(),
+            (['git', 'archive', '--format=tar', sha + ':baz'], ''))
+
+    @patch('sh.git',)
+    def test_update(self, mock_git):
+        instance = GitVCS('git+/foo/bar')
+        instance.update('/cache/foo')
+
+        mock_git.bake.assert_called_with(_cwd='/cache/foo')
+        mock_git.bake().fetch.assert_called_with('--depth', '1', 'origin',
+                                                 'HEAD')
+        mock_git.bake().reset.assert_called_with('--hard', 'FETCH_HEAD')
+
+
+class TestGitExport(BaseTestCase):
+
+    def setUp(self):
+        self._patch_clint([
+            'facio.base.puts',
+            'facio.exceptions.puts',
+        ])
+
+        self.directory = tempfile.mkdtemp(suffix='facio')
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.repository = os.path.join(self.directory, 'repository')
+        self.destination = os.path.join(self.directory, 'project')
+
+        os.makedirs(os.path.join(self.repository, 'templates', 'django'))
+        for name in ['setup.py', 'a.pyc',
+                     os.path.join('templates', 'django', 'manage.py')]:
+            with open(os.path.join(self.repository, name), 'w') as handler:
+                handler.write(name)
+        for args in [['init', '-q'], ['add', '.'],
+                     ['-c', 'user.name=Facio', '-c', 'user.email=facio@test',
+                      'commit', '-q', '-m', 'Template']]:
+            subprocess.check_call(['git'] + args, cwd=self.repository)
+
+    def test_export(self):
+        instance = GitVCS('git+/foo/bar')
+        instance.directory = self.repository
+
+        count = instance.export(self.destination,
+                                ignore=IgnoreMatcher(['*.pyc']))
+
+        self.assertEqual(count, 2)
+        self.assertEqual(sorted(os.listdir(self.destination)),
+                         ['setup.py', 'templates'])
+
+    def test_export_subdir(self):
+        instance = GitVCS('git+/foo/bar#subdir=templates/django')
+        instance.directory = self.repository
+
+        instance.export(self.destination)
+
+        self.assertEqual(os.listdir(self.destination), ['manage.py'])
+
+    def test_clone_abbreviated_commit(self):
+        sha = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      cwd=self.repository).decode().strip()
+        with open(os.path.join(self.repository, 'setup.py'), 'w') as handler:
+            handler.write('changed')
+        subprocess.check_call(['git', '-c', 'user.name=Facio', '-c',
+                               'user.email=facio@test', 'commit', '-q',
+                               '-am', 'Change'], cwd=self.repository)
+        instance = GitVCS('git+file://{0}@{1}'.format(self.repository, sha))
+
+        directory = instance.clone(self.destination)
+
+        self.assertFalse(instance.is_immutable())
+        with open(os.path.join(directory, 'setup.py')) as handler:
+            self.assertEqual(handler.read(), 'setup.py')
+
+    def test_read_file(self):
+        instance = GitVCS('git+/foo/bar#subdir=templates/django')
+        instance.directory = self.repository
+
+        self.assertEqual(instance.read_file('manage.py'),
+                         os.path.join('templates', 'django', 'manage.py'))
+        self.assertEqual(instance.read_file('.facioignore'), None)
+
+    @patch('sys.exit')
+    def test_export_subdir_not_found(self, mock_exit):
+        instance = GitVCS('git+/foo/bar#subdir=templates/flask')
+        instance.directory = self.repository
+
+        with self.assertRaises(FacioException):
+            instance.export(self.destination)
+        self.mocked_facio_exceptions_puts.assert_any_call(
+            'Error: Failed to export /foo/bar')
+
 
 class TestMercurialVCS(BaseTestCase):
 
@@ -139,3 +421,21 @@ class TestMercurialVCS(BaseTestCase):
         instance.clone()
 
         mock_hg.bake.assert_called_with(_cwd='/tmp/foo')
+
+    @patch('facio.vcs.tempfile.mkdtemp', return_value='/tmp/foo')
+    @patch('sh.hg',)
+    def test_clone_without_working_tree(self, mock_hg, mock_tempfile):
+        instance = MercurialVCS('hg+/foo/bar@v2')
+        instance.clone(working_tree=False)
+
+        mock_hg.bake().clone.assert_called_with('--noupdate', '/foo/bar',
+                                                '/tmp/foo')
+
+    def test_get_archive_command(self):
+        instance = MercurialVCS('hg+/foo/bar@v2#subdir=baz')
+
+        self.assertEqual(instance.get_archive_command(), (
+            ['hg', 'archive', '--config', 'ui.archivemeta=false',
+             '--type', 'tar', '--prefix', 'template', '--rev', 'v2',
+             '--include', 'path:baz', '-'],
+            'template/baz'))